@@ -0,0 +1,102 @@
+"""
+Primary/replica database routing.
+
+PrimaryReplicaRouter sends reads to one of settings.DATABASE_REPLICAS and
+everything else to the primary ('default'). Reads stay on the primary when
+they can't tolerate replication lag:
+
+- inside a transaction on the primary (booking reads its slot counters there);
+- for the rest of a request (or management command) once it has written;
+- for the whole of an unsafe request (POST etc.), which is about to write;
+- for DATABASE_REPLICA_PIN_SECONDS after a request that wrote, so a redirect
+  such as appointment_confirmation or profile reads its own writes. The
+  middleware remembers this in a cookie.
+
+select_for_update(), get_or_create() and friends already route as writes.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'db_primary'
+DEFAULT_PIN_SECONDS = 10
+
+# Per request (or thread outside one): whether reads go to the primary and
+# whether anything has been written
+_state = ContextVar('db_routing_state', default=None)
+
+
+def _current():
+    state = _state.get()
+    if state is None:
+        state = {'pinned': False, 'wrote': False}
+        _state.set(state)
+    return state
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+def pin_to_primary():
+    """Read from the primary for the rest of this request (or thread)."""
+    _current()['pinned'] = True
+
+
+def pinned_to_primary():
+    state = _state.get()
+    return bool(state and state['pinned'])
+
+
+@contextmanager
+def routing_scope(pinned=False):
+    """Fresh routing state for a unit of work such as a request; yields it."""
+    state = {'pinned': pinned, 'wrote': False}
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        available = replicas()
+        if not available or pinned_to_primary() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(available)
+
+    def db_for_write(self, model, **hints):
+        state = _current()
+        state['pinned'] = state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        aliases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema by replication
+        return db not in replicas()
+
+
+class PrimaryPinningMiddleware:
+    """Track writes per request and pin the client's next reads to the primary."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        unsafe = request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+        with routing_scope(pinned=unsafe or PIN_COOKIE in request.COOKIES) as state:
+            response = self.get_response(request)
+        if state['wrote'] and replicas():
+            seconds = getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', DEFAULT_PIN_SECONDS)
+            response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+        return response
@@ -1,5 +1,7 @@
 from pathlib import Path
 import os
+import tempfile
+from .database import database_settings, replica_settings
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -19,11 +21,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.request_timing.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'config.routers.PrimaryPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -32,7 +37,8 @@ ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, plus render timing for RequestTimingMiddleware
+        'BACKEND': 'core.request_timing.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -48,11 +54,30 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
+# DATABASE_URL, CONN_MAX_AGE, CONN_HEALTH_CHECKS, DB_POOL and SQLITE_PROFILE;
+# see config/database.py
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "vaccinations.db",
-    }
+    "default": database_settings(os.environ, BASE_DIR),
+    **replica_settings(os.environ),
+}
+
+# Reads go to REPLICA_DATABASE_URLS when set; see config/routers.py
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["config.routers.PrimaryReplicaRouter"]
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get("DATABASE_REPLICA_PIN_SECONDS", 10))
+
+# The reference-data version stamp (core/reference_data.py) must be shared by
+# every worker, so it doesn't live in the per-process default cache. Point it
+# at Redis or Memcached when workers run on more than one host.
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "reference": {
+        "BACKEND": os.environ.get("REFERENCE_CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"),
+        "LOCATION": os.environ.get(
+            "REFERENCE_CACHE_LOCATION", os.path.join(tempfile.gettempdir(), "vaccination-reference-cache"),
+        ),
+        "TIMEOUT": None,
+    },
 }
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -79,6 +104,45 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Share of requests profiled by core.request_timing (0 to disable; set 1 to
+# profile every request while debugging)
+REQUEST_TIMING_SAMPLE_RATE = float(os.environ.get("REQUEST_TIMING_SAMPLE_RATE", 0.05))
+
+# Per-view latency histograms served at /metrics/ (core/metrics.py). Point
+# METRICS_DIR at a directory shared by all workers to aggregate across them.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() not in ("0", "false", "no", "off")
+METRICS_DIR = os.environ.get("METRICS_DIR") or None
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", 5))
+
+# On-demand request profiling (core/profiling.py). PROFILE_SAMPLE_VIEWS, e.g.
+# "appointment_add=100,profile=50", profiles 1 in N requests to those views.
+PROFILE_DIR = os.environ.get("PROFILE_DIR") or None
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 50))
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", 0.002))
+PROFILE_SAMPLE_VIEWS = {
+    view.strip(): int(every)
+    for view, _, every in (item.partition("=") for item in os.environ.get("PROFILE_SAMPLE_VIEWS", "").split(","))
+    if view.strip() and every.strip()
+}
+
+# Editing a vaccine's intervals rebuilds its status rows after the save
+# commits; above this many doses that is left to
+# `manage.py rebuild_vaccine_status --vaccine <id>` and a warning is logged.
+VACCINE_REBUILD_INLINE_MAX_DOSES = int(os.environ.get("VACCINE_REBUILD_INLINE_MAX_DOSES", 100000))
+
+# REQUEST_TIMING_LOG_LEVEL=INFO prints one JSON line per profiled request
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "core.request_timing": {"handlers": ["console"], "level": os.environ.get("REQUEST_TIMING_LOG_LEVEL", "WARNING")},
+    },
+}
+
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
 LOGIN_URL = 'login'
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Vaccine, Branch, Appointment, Dose
+from .models import Vaccine, Branch, Appointment, Dose, UserVaccineStatus
 
 @admin.register(Vaccine)
 class VaccineAdmin(admin.ModelAdmin):
@@ -8,7 +8,7 @@ class VaccineAdmin(admin.ModelAdmin):
 
 @admin.register(Branch)
 class BranchAdmin(admin.ModelAdmin):
-    list_display = ("name", "postcode", "phone")
+    list_display = ("name", "postcode", "phone", "slot_capacity")
     search_fields = ("name", "postcode")
 
 @admin.register(Appointment)
@@ -22,3 +22,10 @@ class DoseAdmin(admin.ModelAdmin):
     list_display = ("user", "vaccine", "dose_number", "date_administered")
     list_filter = ("vaccine",)
     search_fields = ("user__username",)
+
+@admin.register(UserVaccineStatus)
+class UserVaccineStatusAdmin(admin.ModelAdmin):
+    list_display = ("user", "vaccine", "dose_count", "last_dose_date", "next_due_date", "completed")
+    list_filter = ("completed", "vaccine")
+    search_fields = ("user__username",)
+    readonly_fields = ("dose_count", "last_dose_date", "next_due_date", "series_complete", "completed")
@@ -1,9 +1,23 @@
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
-from .models import Vaccine, Branch, Appointment, Dose
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from .models import Vaccine, Branch, Appointment, Dose, attach_status
+from .dose_import import DoseImportError, detect_format, import_doses, text_stream
+from .exports import CONTENT_TYPES, CSVRenderer, ExportError, NDJSONRenderer, parse_filters, stream_export
+from .reference_data import branch_etag, branch_last_modified, reference_etag, reference_last_modified
+from .pagination import AppointmentCursorPagination, DoseCursorPagination, UserCursorPagination
+from .connection_stats import connection_stats
+from .status_cache import branch_status_cache
+from .vaccine_schedule import user_schedule
 from .serializers import (
+    ExpandableFieldsMixin, parse_expand,
     UserSerializer, UserCreateSerializer, VaccineSerializer, 
     BranchSerializer, AppointmentSerializer, AppointmentCreateSerializer,
     DoseSerializer, DoseCreateSerializer
@@ -12,17 +26,118 @@ from .serializers import (
 User = get_user_model()
 
 
+def export_response(request, kind):
+    """
+    Stream an export as CSV (default) or NDJSON (?format=ndjson), filtered by
+    ?branch=<id>&start=YYYY-MM-DD&end=YYYY-MM-DD. Non-staff users only
+    receive their own rows.
+    """
+    fmt = request.accepted_renderer.format
+    try:
+        filters = parse_filters(request.query_params)
+    except ExportError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    if not request.user.is_staff:
+        filters['user'] = request.user
+    response = StreamingHttpResponse(stream_export(kind, fmt, **filters), content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    return response
+
+
 @api_view(['GET'])
 def api_health(request):
     """Health check endpoint"""
     return Response({"status": "ok"})
 
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def api_health_details(request):
+    """Cache and connection counters for the process that answered (staff only)"""
+    return Response({
+        "status": "ok",
+        "caches": {
+            "branch_status": branch_status_cache.stats(),
+        },
+        "connections": connection_stats.stats(),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_schedule(request):
+    """
+    Next-due dates and overdue status per vaccine for the current user.
+    Staff may pass ?user=<id> to view another user's schedule.
+    """
+    user = request.user
+    if request.query_params.get('user') and request.user.is_staff:
+        try:
+            user = get_object_or_404(User, pk=int(request.query_params['user']))
+        except ValueError:
+            return Response({'error': 'Invalid user id'}, status=status.HTTP_400_BAD_REQUEST)
+    schedule = user_schedule(user)
+    return Response({
+        'user': user.pk,
+        'overdue': sum(1 for p in schedule if p.overdue),
+        'results': [p.as_dict() for p in schedule],
+    })
+
+
+class ExpandableViewSetMixin:
+    """
+    Pairs with ExpandableFieldsMixin serializers: joins only the relations
+    requested with ?expand=, and computes status_info for every expanded
+    branch on a page in one attach_status() pass instead of once per
+    serialized branch. `branch_paths` are the expand paths leading to a branch.
+    """
+    branch_paths = ()
+
+    def requested_expand(self):
+        return parse_expand(self.request.query_params.get('expand'))
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if issubclass(serializer_class, ExpandableFieldsMixin):
+            related = serializer_class.select_related_for(self.requested_expand())
+            if related:
+                queryset = queryset.select_related(*related)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        paths = [path.split('.') for path in self.branch_paths if self._expanded(path)]
+        if kwargs.get('many') and args and paths:
+            objects = list(args[0])
+            attach_status([branch for obj in objects for branch in self._follow(obj, paths)])
+            args = (objects,) + args[1:]
+        return super().get_serializer(*args, **kwargs)
+
+    def _expanded(self, path):
+        node = self.requested_expand()
+        for name in path.split('.'):
+            if name not in node:
+                return False
+            node = node[name]
+        return True
+
+    def _follow(self, obj, paths):
+        for path in paths:
+            value = obj
+            for attr in path:
+                value = getattr(value, attr, None)
+                if value is None:
+                    break
+            if value is not None:
+                yield value
+
+
 class UserViewSet(viewsets.ModelViewSet):
     """
     ViewSet for User CRUD operations
     """
     queryset = User.objects.all()
+    pagination_class = UserCursorPagination
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -30,41 +145,85 @@ class UserViewSet(viewsets.ModelViewSet):
         return UserSerializer
 
 
+reference_condition = condition(etag_func=reference_etag, last_modified_func=reference_last_modified)
+branch_condition = condition(etag_func=branch_etag, last_modified_func=branch_last_modified)
+
+
+@method_decorator(reference_condition, name='list')
+@method_decorator(reference_condition, name='retrieve')
 class VaccineViewSet(viewsets.ReadOnlyModelViewSet):
     """
-    ViewSet for Vaccine read operations
+    ViewSet for Vaccine read operations. Responses carry an ETag and
+    Last-Modified from the reference-data version, so revalidation is a 304.
     """
     queryset = Vaccine.objects.all()
     serializer_class = VaccineSerializer
 
 
+@method_decorator(branch_condition, name='list')
+@method_decorator(branch_condition, name='retrieve')
 class BranchViewSet(viewsets.ReadOnlyModelViewSet):
     """
-    ViewSet for Branch read operations
+    ViewSet for Branch read operations. Validators also change whenever any
+    branch's open/closing/closed status can change.
     """
-    queryset = Branch.objects.all()
+    queryset = Branch.objects.with_status()
     serializer_class = BranchSerializer
 
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+class AppointmentViewSet(ExpandableViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet for Appointment CRUD operations
     """
     queryset = Appointment.objects.all()
+    branch_paths = ('branch',)
+    pagination_class = AppointmentCursorPagination
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return AppointmentCreateSerializer
         return AppointmentSerializer
 
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated],
+            renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        return export_response(request, 'appointments')
 
-class DoseViewSet(viewsets.ModelViewSet):
+
+class DoseViewSet(ExpandableViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet for Dose CRUD operations
     """
     queryset = Dose.objects.all()
+    branch_paths = ('appointment.branch',)
+    pagination_class = DoseCursorPagination
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return DoseCreateSerializer
         return DoseSerializer
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated],
+            renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        return export_response(request, 'doses')
+
+    @action(detail=False, methods=['post'], url_path='import',
+            permission_classes=[IsAdminUser], parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        """
+        Bulk import historical doses from an uploaded CSV/NDJSON `file`.
+        Optional fields: format, user_field (username/email/id).
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'No file uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.data.get('format') or detect_format(upload.name)
+        try:
+            result = import_doses(
+                text_stream(upload.file), fmt,
+                user_field=request.data.get('user_field', 'username'),
+            )
+        except DoseImportError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result.as_dict())
@@ -0,0 +1,221 @@
+"""
+Micro-benchmarks for hot model methods, serializers, forms and the wizard
+catalogue, run by `manage.py bench`.
+
+Each benchmark is a setup function, registered with @benchmark, that
+takes the generated BenchData and returns the callable to time. Data comes
+from core.synthetic with a fixed seed. Branches and vaccines are written
+inside a transaction that is rolled back afterwards, so the configured
+database is left as it was. Every benchmark is timed over several rounds,
+and each round runs enough iterations to last at least `min_time` seconds.
+The mean ops/sec and the spread between rounds are reported.
+
+Results can be saved as a JSON baseline, and later runs compare against
+it: a benchmark regresses when its mean falls more than `threshold` below
+the baseline. Baselines are only comparable on the same machine and
+Python version; both are recorded.
+"""
+import json
+import platform
+import random
+import statistics
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import django
+from django.db import transaction
+from .catalogue import build_catalogue
+from .forms import AppointmentForm
+from .models import Vaccine, Branch, Dose, local_now
+from .registry import reference_registry
+from .schedule import MINUTES_PER_DAY, STATUS_OPEN
+from .serializers import BranchSerializer, DoseSerializer
+from .status_cache import branch_status_cache
+from .synthetic import make_branches
+
+DEFAULT_ROUNDS = 5
+DEFAULT_MIN_TIME = 0.1
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_SEED = 1
+DEFAULT_BRANCHES = 500
+DEFAULT_DOSES = 2000
+
+BENCHMARKS = {}
+
+BenchData = namedtuple('BenchData', 'branches vaccines doses now')
+
+
+class BenchResult(namedtuple('BenchResult', 'name rounds iterations ops_per_sec stdev')):
+
+    @property
+    def variation(self):
+        """Standard deviation as a fraction of the mean."""
+        return self.stdev / self.ops_per_sec if self.ops_per_sec else 0.0
+
+    def as_dict(self):
+        return {
+            'rounds': self.rounds,
+            'iterations': self.iterations,
+            'ops_per_sec': round(self.ops_per_sec, 2),
+            'stdev': round(self.stdev, 2),
+        }
+
+
+Regression = namedtuple('Regression', 'name baseline current change')
+
+
+def benchmark(name):
+    """Register a setup function under `name`."""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+@benchmark('branch.status_info')
+def _status_info(data):
+    def run():
+        for branch in data.branches:
+            branch.status_info(data.now)
+    return run
+
+
+@benchmark('branch.status_info.uncached')
+def _status_info_uncached(data):
+    def run():
+        branch_status_cache.invalidate()
+        for branch in data.branches:
+            branch.status_info(data.now)
+    return run
+
+
+@benchmark('branch.get_opening_hours_display')
+def _opening_hours_display(data):
+    def run():
+        for branch in data.branches:
+            branch.get_opening_hours_display()
+    return run
+
+
+@benchmark('serializer.branch_list')
+def _branch_serializer(data):
+    return lambda: BranchSerializer(data.branches, many=True).data
+
+
+@benchmark('serializer.dose_list')
+def _dose_serializer(data):
+    return lambda: DoseSerializer(data.doses, many=True).data
+
+
+@benchmark('form.appointment_valid')
+def _appointment_form(data):
+    # A branch open on Tuesday mornings, booked for next Tuesday at 10:00
+    tuesday_10am = MINUTES_PER_DAY + 10 * 60
+    branch = next(b for b in data.branches
+                  if (b.schedule.status_at_minute(tuesday_10am) or {}).get('class') == STATUS_OPEN)
+    day = data.now.date() + timedelta(days=(1 - data.now.weekday()) % 7 or 7)
+    post = {'vaccine': data.vaccines[0].pk, 'branch': branch.pk, 'datetime': f'{day:%Y-%m-%d}T10:00'}
+
+    def run():
+        form = AppointmentForm(post)
+        if not form.is_valid():
+            raise AssertionError(f"Benchmark form is invalid: {form.errors.as_json()}")
+    return run
+
+
+@benchmark('wizard.catalogue_json')
+def _catalogue(data):
+    return lambda: json.dumps(build_catalogue(), separators=(',', ':'), sort_keys=True)
+
+
+@contextmanager
+def bench_data(seed=DEFAULT_SEED, branches=DEFAULT_BRANCHES, doses=DEFAULT_DOSES):
+    """Generated branches, vaccines and doses; database rows are rolled back on exit."""
+    rng = random.Random(seed)
+    try:
+        with transaction.atomic():
+            created = Branch.objects.bulk_create(make_branches(rng, branches, start=1))
+            vaccines = Vaccine.objects.bulk_create([
+                Vaccine(name=f"Bench Vaccine {n}", price_per_dose=Decimal(rng.randint(500, 9000)) / 100,
+                        side_effects=["Sore arm", "Headache"][:rng.randint(0, 2)])
+                for n in range(20)
+            ])
+            # bulk_create sends no signals; make the registry see the new rows
+            reference_registry.clear()
+            start = date(2020, 1, 1)
+            generated = [Dose(id=n, user_id=rng.randint(1, 10000), vaccine=rng.choice(vaccines),
+                              appointment_id=None, dose_number=rng.randint(1, 3),
+                              date_administered=start + timedelta(days=rng.randint(0, 1800)))
+                         for n in range(1, doses + 1)]
+            # Fixed to a Wednesday noon so results don't depend on when the run happens
+            now = local_now().replace(year=2030, month=1, day=9, hour=12, minute=0, second=0, microsecond=0)
+            yield BenchData(created, vaccines, generated, now)
+            transaction.set_rollback(True)
+    finally:
+        reference_registry.clear()
+        branch_status_cache.invalidate()
+
+
+def measure(name, fn, rounds=DEFAULT_ROUNDS, min_time=DEFAULT_MIN_TIME):
+    """Time `fn`: find an iteration count lasting min_time, then run `rounds` rounds."""
+    fn()  # warm up caches and lazy imports
+    iterations = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        iterations *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    rates = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        rates.append(iterations / (time.perf_counter() - started))
+    return BenchResult(name, rounds, iterations, statistics.mean(rates),
+                       statistics.stdev(rates) if len(rates) > 1 else 0.0)
+
+
+def run_benchmarks(names=None, rounds=DEFAULT_ROUNDS, min_time=DEFAULT_MIN_TIME, seed=DEFAULT_SEED,
+                   branches=DEFAULT_BRANCHES, doses=DEFAULT_DOSES):
+    """Run the named benchmarks (default: all) and return their BenchResults."""
+    unknown = set(names or ()) - set(BENCHMARKS)
+    if unknown:
+        raise KeyError(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+    with bench_data(seed, branches, doses) as data:
+        return [measure(name, BENCHMARKS[name](data), rounds, min_time)
+                for name in BENCHMARKS if not names or name in names]
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'machine': platform.machine(),
+        'node': platform.node(),
+    }
+
+
+def baseline_document(results):
+    return {
+        'created': datetime.now().astimezone().isoformat(timespec='seconds'),
+        'environment': environment(),
+        'results': {r.name: r.as_dict() for r in results},
+    }
+
+
+def find_regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Benchmarks more than `threshold` (a fraction) slower than in `baseline`."""
+    regressions = []
+    for result in results:
+        previous = baseline.get('results', {}).get(result.name)
+        if not previous or not previous.get('ops_per_sec'):
+            continue
+        change = result.ops_per_sec / previous['ops_per_sec'] - 1
+        if change < -threshold:
+            regressions.append(Regression(result.name, previous['ops_per_sec'], result.ops_per_sec, change))
+    return regressions
@@ -0,0 +1,89 @@
+"""
+Contention-safe appointment booking.
+
+Every booking reserves capacity on a SlotCounter row for its (branch, slot)
+before the appointment is inserted, inside one transaction:
+
+* on backends with SELECT ... FOR UPDATE the counter row is locked, checked
+  and incremented;
+* elsewhere (SQLite) a single conditional UPDATE ... WHERE booked < capacity
+  does the check and increment, and the transaction is retried with backoff
+  when the database reports it is locked.
+
+Both the HTML views and the API serializer book through this module.
+"""
+from django.db import connections
+from django.db.models import F
+from .models import Appointment, SlotCounter
+from .slots import booked_counts, slot_start_for
+from .transactions import atomic_with_retries
+
+
+class SlotUnavailable(Exception):
+    """The requested slot is closed or has no capacity left."""
+
+
+def _counter(db, branch, slot_start):
+    """Get the counter row for a slot, seeding it from existing appointments."""
+    counter, _ = SlotCounter.objects.using(db).get_or_create(
+        branch=branch,
+        slot_start=slot_start,
+        defaults={'booked': booked_counts(branch, [slot_start], using=db)[slot_start]},
+    )
+    return counter
+
+
+def _reserve(db, branch, when):
+    slot_start = slot_start_for(branch, when)
+    if slot_start is None:
+        raise SlotUnavailable("The branch is closed at the selected time.")
+    counter = _counter(db, branch, slot_start)
+    counters = SlotCounter.objects.using(db).filter(pk=counter.pk)
+    if connections[db].features.has_select_for_update:
+        locked = counters.select_for_update().get()
+        if locked.booked >= branch.slot_capacity:
+            raise SlotUnavailable("This time slot is fully booked. Please choose another time.")
+        counters.update(booked=F('booked') + 1)
+    elif not counters.filter(booked__lt=branch.slot_capacity).update(booked=F('booked') + 1):
+        raise SlotUnavailable("This time slot is fully booked. Please choose another time.")
+    return slot_start
+
+
+def release_slot(branch, when, using=None):
+    """Give back one unit of capacity for an appointment leaving a slot."""
+    slot_start = slot_start_for(branch, when)
+    if slot_start is None:
+        return
+    SlotCounter.objects.using(using).filter(
+        branch=branch, slot_start=slot_start, booked__gt=0,
+    ).update(booked=F('booked') - 1)
+
+
+def book_appointment(appointment):
+    """
+    Reserve capacity for an unsaved Appointment and insert it with a single
+    write. Raises SlotUnavailable if the slot is closed or full.
+    """
+    def book(db):
+        _reserve(db, appointment.branch, appointment.datetime)
+        appointment._slot_reserved = True
+        appointment.save(using=db, force_insert=True)
+        return appointment
+    return atomic_with_retries(book, Appointment)
+
+
+def reschedule_appointment(appointment, previous_branch, previous_datetime):
+    """
+    Save changes to an existing Appointment, moving its reservation when the
+    branch or slot changed. Raises SlotUnavailable if the new slot is full.
+    """
+    def save(db):
+        old_slot = slot_start_for(previous_branch, previous_datetime)
+        new_slot = slot_start_for(appointment.branch, appointment.datetime)
+        if previous_branch.pk != appointment.branch_id or old_slot != new_slot:
+            _reserve(db, appointment.branch, appointment.datetime)
+            release_slot(previous_branch, previous_datetime, using=db)
+        appointment._slot_reserved = True
+        appointment.save(using=db)
+        return appointment
+    return atomic_with_retries(save, Appointment)
@@ -0,0 +1,57 @@
+"""
+Vaccine and branch catalogue for the booking and dose wizards.
+
+The catalogue is serialised once per reference-data version and kept in the
+cache as a small JavaScript file. It is served at a URL containing a hash of
+its content, so browsers can cache it forever and the wizard pages only
+carry a <script src> instead of the whole catalogue. A new version with
+different content gets a new URL; requests for an old hash are redirected.
+"""
+import hashlib
+import json
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import reverse
+from .models import Vaccine, Branch
+from .reference_data import current_version
+from .request_timing import record_cache_lookup
+
+CACHE_KEY = 'wizard-catalogue:{}'
+GLOBAL_NAME = 'wizardCatalogue'
+# Superseded versions simply expire
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def build_catalogue():
+    # Cached per version, so read the primary rather than a possibly lagging replica
+    vaccines = [{
+        'id': v.id,
+        'name': v.name,
+        'price': str(v.price_per_dose),
+        'side_effects': v.side_effects if isinstance(v.side_effects, list) else [],
+    } for v in Vaccine.objects.using(DEFAULT_DB_ALIAS).order_by('name')]
+    branches = [{
+        'id': b.id,
+        'name': b.name,
+        'postcode': b.postcode,
+        'image_url': b.image_url or '',
+        'opening_hours': b.opening_hours if isinstance(b.opening_hours, list) else [],
+    } for b in Branch.objects.using(DEFAULT_DB_ALIAS).order_by('name')]
+    return {'vaccines': vaccines, 'branches': branches}
+
+
+def catalogue_script():
+    """(digest, script body) for the current reference-data version."""
+    key = CACHE_KEY.format(current_version()[0])
+    script = cache.get(key)
+    record_cache_lookup(hits=script is not None, misses=script is None)
+    if script is None:
+        data = json.dumps(build_catalogue(), separators=(',', ':'), sort_keys=True)
+        body = f'window.{GLOBAL_NAME} = {data};\n'
+        script = (hashlib.sha256(body.encode()).hexdigest()[:16], body)
+        cache.set(key, script, CACHE_TIMEOUT)
+    return script
+
+
+def catalogue_url():
+    return reverse('wizard_catalogue', args=[catalogue_script()[0]])
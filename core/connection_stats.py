@@ -0,0 +1,40 @@
+"""
+Per-process counters for database connection reuse.
+
+With CONN_MAX_AGE (or a pool) a worker should open far fewer connections
+than it serves requests. core.signals counts requests and newly opened
+connections per alias; /api/health/ reports them for the answering process.
+"""
+import os
+from collections import Counter
+
+
+class ConnectionStats:
+    """Counters are best-effort under concurrent requests."""
+
+    def __init__(self):
+        self.requests = 0
+        self.opened = Counter()
+
+    def request_started(self):
+        self.requests += 1
+
+    def connection_opened(self, alias):
+        self.opened[alias] += 1
+
+    def stats(self):
+        return {
+            'pid': os.getpid(),
+            'requests': self.requests,
+            'connections_opened': dict(self.opened),
+            'requests_per_connection': {
+                alias: round(self.requests / opened, 2) for alias, opened in self.opened.items() if opened
+            },
+        }
+
+    def reset_stats(self):
+        self.requests = 0
+        self.opened.clear()
+
+
+connection_stats = ConnectionStats()
@@ -0,0 +1,260 @@
+"""
+Bulk import of historical doses from CSV or NDJSON.
+
+Records are streamed from the file and processed in chunks, so memory stays
+flat however large the file is. Each record needs a user key (username,
+email or id), a vaccine name and a date_administered (YYYY-MM-DD):
+
+    user,vaccine,date_administered
+    alice,Influenza,2023-10-02
+
+    {"user": "alice", "vaccine": "Influenza", "date_administered": "2023-10-02"}
+
+For each chunk, users are resolved with one query and vaccines through an
+in-memory name map. Rows are sorted by (user, vaccine, date) and numbered
+on from each pair's current highest dose number. A pair whose imported
+doses predate its latest existing dose is renumbered as a whole, in date
+order. Rows are written with bulk_create in batches, in one transaction
+per chunk. The chunk's UserVaccineStatus rows are upserted in the same
+transaction, since bulk_create does not send the Dose signals.
+"""
+import csv
+import io
+import json
+import time
+from datetime import date
+from django.contrib.auth import get_user_model
+from django.db.models import Max
+from django.utils import timezone
+from .models import Dose, Vaccine
+from .transactions import atomic_with_retries
+from .vaccine_schedule import refresh_statuses
+
+FORMATS = ('csv', 'ndjson')
+USER_FIELDS = ('username', 'email', 'id')
+REQUIRED_FIELDS = ('user', 'vaccine', 'date_administered')
+DEFAULT_BATCH_SIZE = 1000   # rows per INSERT
+DEFAULT_CHUNK_SIZE = 5000   # rows per transaction
+MAX_REPORTED_ERRORS = 50
+
+
+class DoseImportError(Exception):
+    """The file as a whole cannot be imported (bad format or header)."""
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+        self._started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def reject(self, line, reason):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': reason})
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self._started
+        return self
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'rejected': self.rejected,
+            'elapsed_seconds': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+            'errors': self.errors,
+        }
+
+
+def detect_format(filename):
+    return 'ndjson' if filename.lower().endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+def text_stream(binary):
+    """Wrap a binary file object for line-by-line decoding (BOM tolerant)."""
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+
+def read_records(stream, fmt):
+    """Yield (line_number, record) from a text stream; record is None if unparsable."""
+    if fmt not in FORMATS:
+        raise DoseImportError(f"Unknown format '{fmt}' (expected one of: {', '.join(FORMATS)})")
+    try:
+        yield from _records(stream, fmt)
+    except UnicodeDecodeError:
+        raise DoseImportError("The file is not valid UTF-8 text") from None
+
+
+def _records(stream, fmt):
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        missing = [f for f in REQUIRED_FIELDS if f not in (reader.fieldnames or ())]
+        if missing:
+            raise DoseImportError(f"CSV header is missing: {', '.join(missing)}")
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield line_number, record if isinstance(record, dict) else None
+
+
+class DoseImporter:
+    def __init__(self, user_field='username', batch_size=DEFAULT_BATCH_SIZE, chunk_size=DEFAULT_CHUNK_SIZE):
+        if user_field not in USER_FIELDS:
+            raise DoseImportError(f"Unknown user field '{user_field}' (expected one of: {', '.join(USER_FIELDS)})")
+        self.user_field = user_field
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.vaccines = {name.casefold(): pk for pk, name in Vaccine.objects.values_list('pk', 'name')}
+        self.today = timezone.localdate()
+
+    def run(self, records):
+        result = ImportResult()
+        chunk = []
+        for line, record in records:
+            result.rows += 1
+            parsed = self._parse(line, record, result)
+            if parsed is not None:
+                chunk.append(parsed)
+            if len(chunk) >= self.chunk_size:
+                self._write_chunk(chunk, result)
+                chunk = []
+        if chunk:
+            self._write_chunk(chunk, result)
+        return result.finish()
+
+    def _parse(self, line, record, result):
+        if record is None:
+            result.reject(line, "Unparsable record")
+            return None
+        values = [str(record.get(f) or '').strip() for f in REQUIRED_FIELDS]
+        user_key, vaccine_name, day = values
+        if not all(values):
+            result.reject(line, "Missing user, vaccine or date_administered")
+            return None
+        vaccine_id = self.vaccines.get(vaccine_name.casefold())
+        if vaccine_id is None:
+            result.reject(line, f"Unknown vaccine '{vaccine_name}'")
+            return None
+        try:
+            administered = date.fromisoformat(day)
+        except ValueError:
+            result.reject(line, f"Invalid date '{day}'")
+            return None
+        if administered > self.today:
+            result.reject(line, f"Date {day} is in the future")
+            return None
+        if self.user_field == 'email':
+            user_key = user_key.lower()  # stored lower-cased by the signup/profile forms
+        elif self.user_field == 'id':
+            if not user_key.isdigit():
+                result.reject(line, f"Invalid user id '{user_key}'")
+                return None
+            user_key = int(user_key)
+        return line, user_key, vaccine_id, administered
+
+    def _user_map(self, keys):
+        """{user key: pk} for the keys that exist (one query)."""
+        users = get_user_model().objects.order_by().filter(**{f'{self.user_field}__in': keys})
+        return dict(users.values_list(self.user_field, 'pk'))
+
+    def _write_chunk(self, chunk, result):
+        users = self._user_map({key for _, key, _, _ in chunk})
+        rows = []
+        for line, user_key, vaccine_id, administered in chunk:
+            user_id = users.get(user_key)
+            if user_id is None:
+                result.reject(line, f"Unknown user '{user_key}'")
+            else:
+                rows.append((user_id, vaccine_id, administered, line))
+        if not rows:
+            return
+        rows.sort()
+        user_ids = {r[0] for r in rows}
+        vaccine_ids = {r[1] for r in rows}
+
+        def write(db):
+            pair_doses = Dose.objects.using(db).order_by().filter(user_id__in=user_ids, vaccine_id__in=vaccine_ids)
+            existing = pair_doses.values_list('user_id', 'vaccine_id').annotate(
+                m=Max('dose_number'), last=Max('date_administered'),
+            )
+            last_numbers = {}
+            renumber = set()
+            earliest = {}
+            for user_id, vaccine_id, administered, _ in rows:
+                earliest.setdefault((user_id, vaccine_id), administered)
+            for u, v, m, last in existing:
+                last_numbers[(u, v)] = m
+                if earliest.get((u, v), last) < last:
+                    renumber.add((u, v))
+            doses = []
+            for user_id, vaccine_id, administered, _ in rows:
+                dose = Dose(user_id=user_id, vaccine_id=vaccine_id, date_administered=administered)
+                if (user_id, vaccine_id) not in renumber:
+                    dose.dose_number = last_numbers.get((user_id, vaccine_id), 0) + 1
+                    last_numbers[(user_id, vaccine_id)] = dose.dose_number
+                doses.append(dose)
+            parked, moved = self._renumber(pair_doses, renumber, doses) if renumber else ([], [])
+            if parked:
+                Dose.objects.using(db).bulk_update(parked, ['dose_number'], batch_size=self.batch_size)
+            Dose.objects.using(db).bulk_create(doses, batch_size=self.batch_size)
+            if moved:
+                Dose.objects.using(db).bulk_update(moved, ['dose_number'], batch_size=self.batch_size)
+            refresh_statuses({(u, v) for u, v, _, _ in rows}, using=db)
+            return len(doses)
+
+        result.imported += atomic_with_retries(write, Dose, retry_integrity_errors=True)
+
+
+    def _renumber(self, pair_doses, pairs, doses):
+        """
+        Number `doses` of the given pairs together with the pairs' existing
+        doses, in date order (existing first on the same day). Returns the
+        existing doses whose number changes twice: parked above every number
+        in use, and with their final number. Writing the parked numbers
+        first lets the new rows go in without clashing on the unique
+        constraint.
+        """
+        series = {pair: [] for pair in pairs}
+        for pk, u, v, administered, number in pair_doses.values_list(
+            'pk', 'user_id', 'vaccine_id', 'date_administered', 'dose_number',
+        ):
+            if (u, v) in series:
+                series[(u, v)].append((administered, 0, number, pk))
+        for position, dose in enumerate(doses):
+            pair = (dose.user_id, dose.vaccine_id)
+            if pair in series:
+                series[pair].append((dose.date_administered, 1, position, None))
+        parked, moved = [], []
+        for entries in series.values():
+            entries.sort()
+            park = 2 * len(entries) + max(n for _, new, n, _ in entries if not new)
+            for number, (_, new, key, pk) in enumerate(entries, start=1):
+                if new:
+                    doses[key].dose_number = number
+                elif key != number:
+                    parked.append(Dose(pk=pk, dose_number=park + number))
+                    moved.append(Dose(pk=pk, dose_number=number))
+        return parked, moved
+
+
+def import_doses(stream, fmt='csv', **options):
+    """Import doses from a text stream. Returns an ImportResult."""
+    importer = DoseImporter(**options)
+    return importer.run(read_records(stream, fmt))
@@ -0,0 +1,30 @@
+"""
+Dose recording with race-free dose numbering.
+
+Dose numbers run 1, 2, 3... per (user, vaccine) and are protected by the
+unique_together constraint on Dose. Two submissions for the same user and
+vaccine can read the same MAX(dose_number); the loser hits the constraint,
+its savepoint is rolled back and it is renumbered and retried.
+"""
+from django.db.models import Max
+from .models import Dose
+from .transactions import atomic_with_retries
+
+
+def next_dose_number(user_id, vaccine_id, using=None):
+    last = Dose.objects.using(using).filter(
+        user_id=user_id, vaccine_id=vaccine_id,
+    ).aggregate(m=Max('dose_number'))['m']
+    return (last or 0) + 1
+
+
+def record_dose(dose):
+    """
+    Number and save a Dose (new, or moved to a different user/vaccine).
+    Used by both the dose_create view and the API serializer.
+    """
+    def save(db):
+        dose.dose_number = next_dose_number(dose.user_id, dose.vaccine_id, using=db)
+        dose.save(using=db)
+        return dose
+    return atomic_with_retries(save, Dose, retry_integrity_errors=True)
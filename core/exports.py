@@ -0,0 +1,163 @@
+"""
+Streaming CSV/NDJSON export of appointments and doses.
+
+Rows come from values_list() projections (joined to user, vaccine and
+branch names) read with .iterator(chunk_size), so no model instances are
+built and memory stays constant however many rows are exported. Output is
+produced by a generator, suitable for StreamingHttpResponse or writing to
+a file.
+
+Dose exports start with the user, vaccine and date_administered columns
+that `manage.py import_doses` reads, so an export can be re-imported.
+"""
+import csv
+import json
+from datetime import date, datetime, time
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+from .models import Appointment, Dose
+
+FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+DEFAULT_CHUNK_SIZE = 2000
+ROWS_PER_WRITE = 500
+
+# (column, queryset field) per export
+EXPORTS = {
+    'appointments': (
+        Appointment,
+        'datetime',
+        'branch_id',
+        [
+            ('id', 'id'),
+            ('user', 'user__username'),
+            ('vaccine', 'vaccine__name'),
+            ('branch', 'branch__name'),
+            ('datetime', 'datetime'),
+            ('notes', 'notes'),
+            ('created_at', 'created_at'),
+        ],
+    ),
+    'doses': (
+        Dose,
+        'date_administered',
+        'appointment__branch_id',
+        [
+            ('user', 'user__username'),
+            ('vaccine', 'vaccine__name'),
+            ('date_administered', 'date_administered'),
+            ('dose_number', 'dose_number'),
+            ('id', 'id'),
+            ('appointment', 'appointment_id'),
+            ('branch', 'appointment__branch__name'),
+        ],
+    ),
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+class CSVRenderer(BaseRenderer):
+    """Lets DRF content negotiation accept ?format=csv for export actions."""
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode() if data is not None else b''
+
+
+class NDJSONRenderer(CSVRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+def columns(kind):
+    if kind not in EXPORTS:
+        raise ExportError(f"Unknown export '{kind}'")
+    return [column for column, _ in EXPORTS[kind][3]]
+
+
+def export_rows(kind, branch=None, start=None, end=None, user=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Iterate value tuples for an export, oldest first. `start`/`end` are
+    inclusive dates; `branch` and `user` are ids or instances.
+    """
+    columns(kind)
+    model, date_field, branch_field, fields = EXPORTS[kind]
+    rows = model.objects.order_by(date_field, 'id')
+    if user is not None:
+        rows = rows.filter(user=user)
+    if branch is not None:
+        rows = rows.filter(**{branch_field: getattr(branch, 'pk', branch)})
+    if model is Appointment:
+        # Compare against local-day boundaries so the filter uses the datetime index
+        if start is not None:
+            rows = rows.filter(datetime__gte=timezone.make_aware(datetime.combine(start, time.min)))
+        if end is not None:
+            rows = rows.filter(datetime__lte=timezone.make_aware(datetime.combine(end, time.max)))
+    else:
+        if start is not None:
+            rows = rows.filter(date_administered__gte=start)
+        if end is not None:
+            rows = rows.filter(date_administered__lte=end)
+    return rows.values_list(*[field for _, field in fields]).iterator(chunk_size=chunk_size)
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for csv.writer."""
+    def write(self, value):
+        return value
+
+
+def stream_export(kind, fmt='csv', **filters):
+    """Generator of the export as text chunks of up to ROWS_PER_WRITE rows."""
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format '{fmt}' (expected one of: {', '.join(FORMATS)})")
+    return _generate(columns(kind), export_rows(kind, **filters), fmt)
+
+
+def _generate(header, rows, fmt):
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        encode = lambda row: writer.writerow([_plain(v) for v in row])
+        yield writer.writerow(header)
+    else:
+        encode = lambda row: json.dumps(dict(zip(header, map(_plain, row)))) + '\n'
+    buffer = []
+    for row in rows:
+        buffer.append(encode(row))
+        if len(buffer) >= ROWS_PER_WRITE:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def parse_filters(params):
+    """branch/start/end from query params or command options; raises ExportError."""
+    filters = {}
+    if params.get('branch'):
+        try:
+            filters['branch'] = int(params['branch'])
+        except ValueError:
+            raise ExportError("Invalid branch id")
+    for key in ('start', 'end'):
+        if params.get(key):
+            try:
+                filters[key] = date.fromisoformat(params[key])
+            except ValueError:
+                raise ExportError(f"Invalid {key} date (use YYYY-MM-DD)")
+    return filters
@@ -1,7 +1,50 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
-from .models import Appointment, Dose, Vaccine
+from django.core.exceptions import ValidationError
+from .models import Appointment, Dose
+from .registry import reference_registry
+from .slots import slot_error
+
+
+class RegistryChoiceIterator(forms.models.ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for obj in reference_registry.all(self.queryset.model):
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(reference_registry.all(self.queryset.model)) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(reference_registry.all(self.queryset.model))
+
+
+class RegistryChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField for vaccines and branches that builds its choices and
+    validates submitted ids from core.registry instead of querying.
+    """
+    iterator = RegistryChoiceIterator
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        instance = reference_registry.get(self.queryset.model, value)
+        if instance is None:
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value})
+        return instance
+
+
+class RegistryFormMixin:
+    def _get_validation_exclusions(self):
+        # The form field has already checked the id exists; skip the
+        # ForeignKey.validate() query model validation would run again
+        exclude = super()._get_validation_exclusions()
+        exclude.update(name for name, field in self.fields.items() if isinstance(field, RegistryChoiceField))
+        return exclude
+
 
 class CustomUserCreationForm(UserCreationForm):
     email = forms.EmailField(required=True)
@@ -60,22 +103,30 @@ class UserProfileForm(forms.ModelForm):
             raise forms.ValidationError("Username already in use.")
         return username
 
-class AppointmentForm(forms.ModelForm):
+class AppointmentForm(RegistryFormMixin, forms.ModelForm):
     class Meta:
         model = Appointment
         fields = ["vaccine", "branch", "datetime", "notes"]
+        field_classes = {'vaccine': RegistryChoiceField, 'branch': RegistryChoiceField}
         widgets = {
             'datetime': forms.DateTimeInput(attrs={'type': 'datetime-local'})
         }
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.fields['vaccine'].queryset = Vaccine.objects.order_by('name')
+    def clean(self):
+        cleaned_data = super().clean()
+        branch = cleaned_data.get('branch')
+        when = cleaned_data.get('datetime')
+        if branch and when:
+            error = slot_error(branch, when, exclude_pk=self.instance.pk)
+            if error:
+                self.add_error('datetime', error)
+        return cleaned_data
 
-class DoseForm(forms.ModelForm):
+class DoseForm(RegistryFormMixin, forms.ModelForm):
     class Meta:
         model = Dose
         fields = ["vaccine", "date_administered", "appointment"]  # dose_number removed
+        field_classes = {'vaccine': RegistryChoiceField}
         widgets = {
             'date_administered': forms.DateInput(attrs={'type': 'date'})
         }
@@ -83,7 +134,6 @@ class DoseForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
-        self.fields['vaccine'].queryset = Vaccine.objects.order_by('name')
         if user:
             self.fields['appointment'].queryset = user.appointments.order_by('-datetime')
         else:
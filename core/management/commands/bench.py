@@ -0,0 +1,70 @@
+import json
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmarks import (
+    BENCHMARKS, DEFAULT_BRANCHES, DEFAULT_DOSES, DEFAULT_MIN_TIME, DEFAULT_ROUNDS, DEFAULT_SEED,
+    DEFAULT_THRESHOLD, baseline_document, environment, find_regressions, run_benchmarks,
+)
+
+class Command(BaseCommand):
+    help = "Run the micro-benchmarks and compare them with (or save them as) a JSON baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS), metavar='NAME',
+                            help="Only run this benchmark (repeatable)")
+        parser.add_argument('--list', action='store_true', help="List the benchmarks and exit")
+        parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS, help="Timed rounds per benchmark")
+        parser.add_argument('--min-time', type=float, default=DEFAULT_MIN_TIME,
+                            help="Minimum seconds per round; iterations are scaled to fit")
+        parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="Seed for the generated data")
+        parser.add_argument('--branches', type=int, default=DEFAULT_BRANCHES, help="Generated branches")
+        parser.add_argument('--doses', type=int, default=DEFAULT_DOSES, help="Generated doses to serialize")
+        parser.add_argument('--baseline', default=str(Path(settings.BASE_DIR) / 'bench_baseline.json'),
+                            help="Baseline file (default: bench_baseline.json in the project)")
+        parser.add_argument('--save', action='store_true', help="Store these results in the baseline")
+        parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help="Fail when a benchmark is this fraction slower than the baseline")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for name in BENCHMARKS:
+                self.stdout.write(name)
+            return
+        if options['rounds'] < 2:
+            raise CommandError("--rounds must be at least 2 to measure variance")
+        results = run_benchmarks(options['only'], options['rounds'], options['min_time'], options['seed'],
+                                 options['branches'], options['doses'])
+        path = Path(options['baseline'])
+        baseline = json.loads(path.read_text()) if path.exists() else None
+
+        if options['json']:
+            self.stdout.write(json.dumps(baseline_document(results), indent=2))
+        else:
+            previous = (baseline or {}).get('results', {})
+            self.stdout.write(f"{'benchmark':34} {'ops/sec':>12} {'+/-':>7} {'iters':>7} {'vs baseline':>12}")
+            for r in results:
+                base = previous.get(r.name, {}).get('ops_per_sec')
+                change = f"{r.ops_per_sec / base - 1:+.1%}" if base else '-'
+                self.stdout.write(f"{r.name:34} {r.ops_per_sec:12.1f} {r.variation:7.1%} {r.iterations:7d} {change:>12}")
+
+        if options['save']:
+            document = baseline_document(results)
+            if baseline and baseline.get('environment') == document['environment']:
+                # Keep benchmarks that weren't run this time
+                document['results'] = {**baseline.get('results', {}), **document['results']}
+            path.write_text(json.dumps(document, indent=2) + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Saved {len(results)} result(s) to {path}"))
+            return
+        if baseline is None:
+            self.stdout.write(f"No baseline at {path}; run with --save to create one")
+            return
+        if baseline.get('environment') != environment():
+            self.stdout.write(self.style.WARNING(
+                f"Baseline was recorded on {baseline.get('environment')}; comparisons may not be meaningful"))
+        regressions = find_regressions(results, baseline, options['threshold'])
+        if regressions:
+            raise CommandError("Regressed beyond {:.0%}: {}".format(options['threshold'], ', '.join(
+                f"{r.name} {r.baseline:.1f} -> {r.current:.1f} ops/sec ({r.change:+.1%})" for r in regressions)))
+        self.stdout.write(self.style.SUCCESS(f"No regressions beyond {options['threshold']:.0%}"))
@@ -0,0 +1,51 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from config.database import SQLITE_PROFILES
+from core.sqlite_benchmark import (
+    DEFAULT_SECONDS, DEFAULT_THREADS, DEFAULT_USERS, DEFAULT_WRITE_RATIO, compare_profiles,
+)
+
+class Command(BaseCommand):
+    help = "Compare mixed read/write throughput of the SQLite connection profiles on copies of the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', action='append', choices=SQLITE_PROFILES,
+                            help="Profile to run (repeatable; default all)")
+        parser.add_argument('--threads', type=int, default=DEFAULT_THREADS)
+        parser.add_argument('--seconds', type=float, default=DEFAULT_SECONDS, help="Duration per profile")
+        parser.add_argument('--write-ratio', type=float, default=DEFAULT_WRITE_RATIO,
+                            help="Share of operations that record a dose (default %(default)s)")
+        parser.add_argument('--users', type=int, default=DEFAULT_USERS,
+                            help="Users to spread the load over; created in the copy if missing")
+        parser.add_argument('--source', help="SQLite file to copy (default: the configured database)")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("benchmark_sqlite only runs against an SQLite database")
+        if not 0 <= options['write_ratio'] <= 1:
+            raise CommandError("--write-ratio must be between 0 and 1")
+        results = compare_profiles(
+            options['profile'] or SQLITE_PROFILES,
+            source=options['source'],
+            threads=options['threads'],
+            seconds=options['seconds'],
+            write_ratio=options['write_ratio'],
+            users=options['users'],
+        )
+        rows = [result.as_dict() for result in results]
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2))
+            return
+        self.stdout.write(f"{'profile':<12}{'reads/s':>10}{'writes/s':>10}{'errors':>8}{'read p95':>11}{'write p95':>11}")
+        for row in rows:
+            p95 = lambda v: f"{v:.1f}ms" if v is not None else '-'
+            self.stdout.write(
+                f"{row['profile']:<12}{row['reads_per_second']:>10}{row['writes_per_second']:>10}"
+                f"{row['errors']:>8}{p95(row['read_p95_ms']):>11}{p95(row['write_p95_ms']):>11}"
+            )
+        if len(results) == 2 and results[0].reads + results[0].writes:
+            base, tuned = results
+            ratio = (tuned.reads + tuned.writes) / tuned.seconds / ((base.reads + base.writes) / base.seconds)
+            self.stdout.write(self.style.SUCCESS(f"{tuned.profile} vs {base.profile}: {ratio:.2f}x operations/s"))
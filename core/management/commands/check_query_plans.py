@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from core.query_plans import HOT_QUERIES, Sample, explain_hot_queries
+
+class Command(BaseCommand):
+    help = "EXPLAIN the hot queries and flag full table scans and unindexed sorts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="User id to plan the per-user queries for (default: one with doses)")
+        parser.add_argument('--query', action='append', choices=sorted(HOT_QUERIES), metavar='NAME',
+                            help="Only check this query (repeatable)")
+        parser.add_argument('--analyze', action='store_true',
+                            help="Run ANALYZE first so the planner has current statistics")
+        parser.add_argument('--plans', action='store_true', help="Print every plan, not just flagged ones")
+        parser.add_argument('--strict', action='store_true', help="Exit with an error if anything is flagged")
+
+    def handle(self, *args, **options):
+        if options['analyze']:
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        reports = explain_hot_queries(Sample.pick(options['user']), options['query'])
+        flagged = 0
+        for report in reports:
+            if report.problems:
+                flagged += 1
+                self.stdout.write(self.style.WARNING(f"FLAG {report.name}: {'; '.join(report.problems)}"))
+            else:
+                self.stdout.write(f"ok   {report.name}")
+            if report.problems or options['plans']:
+                for line in report.plan.splitlines():
+                    self.stdout.write(f"       {line}")
+        summary = f"{flagged} of {len(reports)} queries flagged ({connection.vendor})"
+        if flagged and options['strict']:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary) if not flagged else summary)
@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core.exports import EXPORTS, FORMATS, ExportError, parse_filters, stream_export
+
+class Command(BaseCommand):
+    help = "Stream appointments or doses to CSV/NDJSON (stdout unless --output is given)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--branch', help="Only rows for this branch id")
+        parser.add_argument('--start', help="First date to include (YYYY-MM-DD)")
+        parser.add_argument('--end', help="Last date to include (YYYY-MM-DD)")
+        parser.add_argument('--output', '-o', help="File to write (default stdout)")
+
+    def handle(self, *args, **options):
+        try:
+            chunks = stream_export(options['kind'], options['format'], **parse_filters(options))
+        except ExportError as exc:
+            raise CommandError(str(exc))
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        started = time.perf_counter()
+        with open(options['output'], 'w', encoding='utf-8', newline='') as out:
+            for chunk in chunks:
+                out.write(chunk)
+        self.stderr.write(f"Wrote {options['output']} in {time.perf_counter() - started:.1f}s")
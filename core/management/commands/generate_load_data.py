@@ -0,0 +1,58 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from core.synthetic import (
+    DEFAULT_APPOINTMENTS, DEFAULT_BATCH_SIZE, DEFAULT_BRANCHES, DEFAULT_CHUNK_USERS, DEFAULT_HISTORY_YEARS,
+    DEFAULT_TODAY, DEFAULT_USERS, LoadGenerator,
+)
+
+class Command(BaseCommand):
+    help = "Fill the database with a deterministic, production-sized synthetic data set for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=DEFAULT_USERS, help="Users to create (default %(default)s)")
+        parser.add_argument('--branches', type=int, default=DEFAULT_BRANCHES,
+                            help="Branches to create; 0 books at the existing ones (default %(default)s)")
+        parser.add_argument('--appointments', type=int, default=DEFAULT_APPOINTMENTS,
+                            help="Approximate appointments to create (default %(default)s)")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed; the same seed gives the same data")
+        parser.add_argument('--today', type=date.fromisoformat, default=DEFAULT_TODAY,
+                            help="Date histories end and bookings start from, YYYY-MM-DD (default %(default)s)")
+        parser.add_argument('--history-years', type=float, default=DEFAULT_HISTORY_YEARS,
+                            help="How far back vaccination histories go (default %(default)s)")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_USERS,
+                            help="Users per transaction (default %(default)s)")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help="Rows per INSERT (default %(default)s)")
+        parser.add_argument('--no-statuses', action='store_true',
+                            help="Skip rebuilding the vaccination status table afterwards")
+
+    def handle(self, *args, **options):
+        for name in ('users', 'branches', 'appointments'):
+            if options[name] < 0:
+                raise CommandError(f"--{name} cannot be negative")
+        for name in ('chunk_size', 'batch_size'):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1")
+        if options['history_years'] <= 0:
+            raise CommandError("--history-years must be positive")
+        generator = LoadGenerator(
+            users=options['users'], branches=options['branches'], appointments=options['appointments'],
+            seed=options['seed'], history_years=options['history_years'], chunk_users=options['chunk_size'],
+            batch_size=options['batch_size'], today=options['today'],
+        )
+
+        def report(stats):
+            if options['verbosity'] > 0:
+                rows = stats.users + stats.appointments + stats.doses
+                self.stdout.write(f"  {stats.users} users, {stats.appointments} appointments, {stats.doses} doses"
+                                  f" ({rows / stats.seconds:,.0f} rows/s)")
+
+        try:
+            stats = generator.run(progress=report, statuses=not options['no_statuses'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        summary = (f"Created {stats.users} users, {options['branches']} branches, {stats.appointments} appointments"
+                   f" and {stats.doses} doses")
+        if stats.statuses is not None:
+            summary += f"; rebuilt {stats.statuses} status rows"
+        self.stdout.write(self.style.SUCCESS(f"{summary} in {stats.seconds:.1f}s"))
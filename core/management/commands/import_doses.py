@@ -0,0 +1,48 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from core.dose_import import (
+    DEFAULT_BATCH_SIZE, DEFAULT_CHUNK_SIZE, FORMATS, USER_FIELDS,
+    DoseImportError, detect_format, import_doses, text_stream,
+)
+
+class Command(BaseCommand):
+    help = "Bulk import historical doses from a CSV or NDJSON file ('-' reads stdin)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help="Default: from the file extension, else csv")
+        parser.add_argument('--user-field', choices=USER_FIELDS, default='username',
+                            help="User attribute the 'user' column refers to (default %(default)s)")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help="Rows per INSERT (default %(default)s)")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help="Rows per transaction (default %(default)s)")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or detect_format(path)
+        try:
+            binary = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        except OSError as exc:
+            raise CommandError(f"Cannot open {path}: {exc}")
+        try:
+            result = import_doses(
+                text_stream(binary), fmt,
+                user_field=options['user_field'],
+                batch_size=options['batch_size'],
+                chunk_size=options['chunk_size'],
+            )
+        except DoseImportError as exc:
+            raise CommandError(str(exc))
+        finally:
+            if binary is not sys.stdin.buffer:
+                binary.close()
+
+        for error in result.errors:
+            self.stderr.write(f"  line {error['line']}: {error['error']}")
+        if result.rejected > len(result.errors):
+            self.stderr.write(f"  ... and {result.rejected - len(result.errors)} more")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.imported} of {result.rows} rows ({result.rejected} rejected) "
+            f"in {result.elapsed:.1f}s, {result.rows_per_second:.0f} rows/s"
+        ))
@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core.models import Vaccine
+from core.vaccine_schedule import REBUILD_CHUNK_USERS, rebuild_statuses
+
+class Command(BaseCommand):
+    help = "Rebuild the materialised per-user vaccination status table from dose history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=REBUILD_CHUNK_USERS,
+                            help="Users per transaction (default %(default)s)")
+        parser.add_argument('--vaccine', type=int, help="Only rebuild rows for this vaccine id")
+
+    def handle(self, *args, **options):
+        vaccine = None
+        if options['vaccine'] is not None:
+            try:
+                vaccine = Vaccine.objects.get(pk=options['vaccine'])
+            except Vaccine.DoesNotExist:
+                raise CommandError(f"Vaccine {options['vaccine']} does not exist")
+        started = time.perf_counter()
+
+        def report(written):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {written} rows")
+
+        written = rebuild_statuses(chunk_size=options['chunk_size'], vaccine=vaccine, progress=report)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} status rows in {elapsed:.1f}s"))
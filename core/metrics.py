@@ -0,0 +1,168 @@
+"""
+Per-view latency histograms in the Prometheus text format.
+
+core.request_timing hands every request's profile to view_metrics, which
+keeps, per (view name, method, status), a latency histogram plus totals
+for database time, query count and application-cache hits and misses.
+Updates take one short lock.
+
+Each worker process counts on its own. With METRICS_DIR set to a directory
+shared by all workers (for example gunicorn's), every process writes its
+counters to metrics-<pid>.json there at most every METRICS_FLUSH_SECONDS,
+and the metrics view adds all the files up, so one scrape covers every
+worker. Files of exited workers are kept so counters never go backwards;
+empty the directory when the server (re)starts.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+from django.conf import settings
+
+# Upper bounds in seconds; one more bucket catches everything slower
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_FLUSH_SECONDS = 5
+FILE_PREFIX = 'metrics-'
+
+# Per series: bucket counts, then count, sum, db_seconds, db_queries, cache_hits, cache_misses
+COUNT, SUM, DB_SECONDS, DB_QUERIES, CACHE_HITS, CACHE_MISSES = range(len(BUCKETS) + 1, len(BUCKETS) + 7)
+WIDTH = len(BUCKETS) + 7
+
+
+def metrics_enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+def metrics_dir():
+    directory = getattr(settings, 'METRICS_DIR', None)
+    return Path(directory) if directory else None
+
+
+class ViewMetrics:
+
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def observe(self, view, method, status, profile):
+        key = (view or '<unresolved>', method, str(status))
+        bucket = bisect_left(BUCKETS, profile.duration)
+        with self._lock:
+            values = self._series.get(key)
+            if values is None:
+                values = self._series[key] = [0] * WIDTH
+            values[bucket] += 1
+            values[COUNT] += 1
+            values[SUM] += profile.duration
+            values[DB_SECONDS] += profile.sql_time
+            values[DB_QUERIES] += profile.query_count
+            values[CACHE_HITS] += profile.cache_hits
+            values[CACHE_MISSES] += profile.cache_misses
+        self.maybe_flush()
+
+    def snapshot(self):
+        """{(view, method, status): values} copied under the lock."""
+        with self._lock:
+            return {key: list(values) for key, values in self._series.items()}
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def maybe_flush(self):
+        interval = getattr(settings, 'METRICS_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS)
+        if metrics_dir() is not None and time.monotonic() - self._last_flush >= interval:
+            self.flush()
+
+    def flush(self):
+        """Write this process's counters to METRICS_DIR (if set)."""
+        directory = metrics_dir()
+        self._last_flush = time.monotonic()
+        if directory is None:
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        rows = [[*key, values] for key, values in self.snapshot().items()]
+        # Write then rename, so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(rows, fh)
+        os.replace(tmp, directory / f'{FILE_PREFIX}{os.getpid()}.json')
+
+
+view_metrics = ViewMetrics()
+
+
+def _merge(total, series):
+    for key, values in series.items():
+        current = total.get(key)
+        if current is None:
+            total[key] = list(values)
+        else:
+            total[key] = [a + b for a, b in zip(current, values)]
+
+
+def collect():
+    """Counters of every worker sharing METRICS_DIR, or of this process alone."""
+    view_metrics.flush()
+    directory = metrics_dir()
+    if directory is None:
+        return view_metrics.snapshot()
+    total = {}
+    for path in sorted(directory.glob(f'{FILE_PREFIX}*.json')):
+        try:
+            rows = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue  # removed or replaced while reading
+        _merge(total, {tuple(row[:3]): row[3] for row in rows if len(row) == 4 and len(row[3]) == WIDTH})
+    return total
+
+
+def _label(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(key):
+    view, method, status = key
+    return f'view="{_label(view)}",method="{_label(method)}",status="{_label(status)}"'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(series):
+    """The text exposition format (version 0.0.4) for collect()'s result."""
+    families = [
+        ('http_request_db_seconds_total', 'counter', 'Time spent in database queries.', DB_SECONDS),
+        ('http_request_db_queries_total', 'counter', 'Database queries run.', DB_QUERIES),
+    ]
+    lines = [
+        '# HELP http_request_duration_seconds Request latency by view, method and status.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    ordered = sorted(series.items())
+    for key, values in ordered:
+        labels = _labels(key)
+        cumulative = 0
+        for bound, count in zip((*map(str, BUCKETS), '+Inf'), values):
+            cumulative += count
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'http_request_duration_seconds_sum{{{labels}}} {_number(values[SUM])}')
+        lines.append(f'http_request_duration_seconds_count{{{labels}}} {values[COUNT]}')
+    for name, kind, help_text, index in families:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for key, values in ordered:
+            lines.append(f'{name}{{{_labels(key)}}} {_number(values[index])}')
+    lines += [
+        '# HELP http_request_cache_lookups_total Application cache lookups by result.',
+        '# TYPE http_request_cache_lookups_total counter',
+    ]
+    for key, values in ordered:
+        labels = _labels(key)
+        lines.append(f'http_request_cache_lookups_total{{{labels},result="hit"}} {values[CACHE_HITS]}')
+        lines.append(f'http_request_cache_lookups_total{{{labels},result="miss"}} {values[CACHE_MISSES]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_alter_dose_appointment"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="branch",
+            name="slot_capacity",
+            field=models.PositiveSmallIntegerField(
+                default=4,
+                help_text="Appointments that can be booked into each time slot",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["branch", "datetime"], name="appt_branch_datetime_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_branch_slot_capacity"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SlotCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("slot_start", models.DateTimeField()),
+                ("booked", models.PositiveIntegerField(default=0)),
+                (
+                    "branch",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="slot_counters",
+                        to="core.branch",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("branch", "slot_start")},
+            },
+        ),
+    ]
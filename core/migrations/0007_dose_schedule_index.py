@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_slotcounter"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="dose",
+            index=models.Index(
+                fields=["user", "vaccine", "date_administered"],
+                name="dose_user_vaccine_date_idx",
+            ),
+        ),
+    ]
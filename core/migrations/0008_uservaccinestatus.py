@@ -0,0 +1,118 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:43
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+PRIMARY_DOSE_INTERVAL_DAYS = 28
+DAYS_PER_YEAR = 365.25
+BATCH_SIZE = 500
+
+
+def populate_statuses(apps, schema_editor):
+    # The schedule rules as they stood when this migration was written;
+    # deliberately not imported from core.vaccine_schedule.
+    Vaccine = apps.get_model("core", "Vaccine")
+    Dose = apps.get_model("core", "Dose")
+    UserVaccineStatus = apps.get_model("core", "UserVaccineStatus")
+    rules = {}
+    for vaccine_id, series, booster, recurrence in Vaccine.objects.values_list(
+        "id", "primary_series_doses", "booster_interval_years", "recurrence_interval_years"
+    ):
+        repeat_years = booster or recurrence
+        rules[vaccine_id] = (series or 1, round(repeat_years * DAYS_PER_YEAR) if repeat_years else None)
+    totals = (
+        Dose.objects.order_by()
+        .values_list("user_id", "vaccine_id")
+        .annotate(n=Count("id"), last=Max("date_administered"))
+    )
+    rows = []
+    for user_id, vaccine_id, n, last in totals.iterator(chunk_size=2000):
+        series, repeat_days = rules[vaccine_id]
+        if n < series:
+            next_due = last + timedelta(days=PRIMARY_DOSE_INTERVAL_DAYS)
+        elif repeat_days:
+            next_due = last + timedelta(days=repeat_days)
+        else:
+            next_due = None
+        rows.append(
+            UserVaccineStatus(
+                user_id=user_id,
+                vaccine_id=vaccine_id,
+                dose_count=n,
+                last_dose_date=last,
+                next_due_date=next_due,
+                series_complete=n >= series,
+                completed=next_due is None,
+            )
+        )
+        if len(rows) == BATCH_SIZE:
+            UserVaccineStatus.objects.bulk_create(rows)
+            rows = []
+    UserVaccineStatus.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_dose_schedule_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserVaccineStatus",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("dose_count", models.PositiveSmallIntegerField()),
+                ("last_dose_date", models.DateField()),
+                ("next_due_date", models.DateField(blank=True, null=True)),
+                ("series_complete", models.BooleanField(default=False)),
+                (
+                    "completed",
+                    models.BooleanField(
+                        default=False, help_text="No further doses are due"
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="vaccine_statuses",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "vaccine",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="user_statuses",
+                        to="core.vaccine",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "user vaccine statuses",
+                "indexes": [
+                    models.Index(
+                        fields=["user", "next_due_date"], name="uvs_user_next_due_idx"
+                    )
+                ],
+                "unique_together": {("user", "vaccine")},
+            },
+        ),
+        migrations.RunPython(populate_statuses, migrations.RunPython.noop),
+    ]
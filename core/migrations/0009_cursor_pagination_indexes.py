@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0008_uservaccinestatus"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(fields=["datetime", "id"], name="appt_datetime_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="dose",
+            index=models.Index(
+                fields=["date_administered", "id"], name="dose_date_id_idx"
+            ),
+        ),
+    ]
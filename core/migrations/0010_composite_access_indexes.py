@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_cursor_pagination_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["user", "datetime"], name="appt_user_datetime_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["user", "vaccine", "datetime"], name="appt_user_vaccine_dt_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="dose",
+            index=models.Index(
+                fields=["user", "date_administered"], name="dose_user_date_idx"
+            ),
+        ),
+    ]
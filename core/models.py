@@ -1,9 +1,10 @@
 from django.db import models
 from django.contrib.auth import get_user_model
-from datetime import datetime, timedelta
+from datetime import datetime
 from django.utils import timezone
-import re
 import json
+from .schedule import compile_schedule, period_day_mask
+from .status_cache import branch_status_cache
 
 User = get_user_model()
 
@@ -24,6 +25,49 @@ class Vaccine(models.Model):
     def __str__(self):
         return self.name
 
+def local_now():
+    return timezone.localtime() if timezone.is_aware(timezone.now()) else datetime.now()
+
+
+def attach_status(branches, at=None):
+    """
+    Compute status_info() for many branches against one reference time and
+    store it on each instance as `current_status`. Returns the branches.
+    """
+    branches = list(branches)
+    statuses = branch_status_cache.get_many(branches, at or local_now())
+    for branch, status in zip(branches, statuses):
+        branch.current_status = status
+    return branches
+
+
+class BranchQuerySet(models.QuerySet):
+    _with_status = False
+    _status_at = None
+
+    def with_status(self, at=None):
+        """
+        Evaluate open/closing/closed for every branch in one pass when the
+        queryset is fetched. Each branch gets a `current_status` attribute.
+        """
+        clone = self._chain()
+        clone._with_status = True
+        clone._status_at = at
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._with_status = self._with_status
+        clone._status_at = self._status_at
+        return clone
+
+    def _fetch_all(self):
+        fetched = self._result_cache is None
+        super()._fetch_all()
+        if fetched and self._with_status and self._result_cache and isinstance(self._result_cache[0], Branch):
+            attach_status(self._result_cache, self._status_at)
+
+
 class Branch(models.Model):
     name = models.CharField(max_length=150)
     address = models.CharField(max_length=255)
@@ -32,141 +76,51 @@ class Branch(models.Model):
     email = models.EmailField()
     opening_hours = models.JSONField(default=list, blank=True)
     image_url = models.URLField(blank=True, null=True)
+    slot_capacity = models.PositiveSmallIntegerField(default=4, help_text="Appointments that can be booked into each time slot")
+
+    objects = BranchQuerySet.as_manager()
 
     def __str__(self):
         return self.name
         
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Compile the weekly schedule up front so the first status lookup is cheap
+        self._schedule_source = self.opening_hours
+        self._schedule = compile_schedule(self.opening_hours)
+
+    @property
+    def schedule(self):
+        """
+        Compiled WeeklySchedule for opening_hours. Memoised on the instance and
+        recompiled whenever opening_hours is reassigned or the branch is saved.
+        """
+        cached = getattr(self, '_schedule', None)
+        if cached is None or self._schedule_source is not self.opening_hours:
+            self._schedule_source = self.opening_hours
+            cached = self._schedule = compile_schedule(self.opening_hours)
+        return cached
+
     def is_24_7(self):
         """
         Detect a 24/7 schedule: any dict entry whose open is 00:00 and close is 23:59 (or 24:00),
         regardless of days string (we accept Mon-Sun, Sun-Mon, etc.).
         """
-        if not isinstance(self.opening_hours, list):
-            return False
-        for entry in self.opening_hours:
-            if isinstance(entry, dict):
-                o = entry.get("open", "").strip()
-                c = entry.get("close", "").strip()
-                if o in ("00:00", "0:00") and c in ("23:59", "24:00"):
-                    return True
-        return False
+        return self.schedule.always_open
 
     def open_until_display(self):
         """
         Return 'Open until HH:MM' for today, or 'Open 24/7' if applicable.
         """
-        if self.is_24_7():
-            return "Open 24/7"
-        if not self.opening_hours or not isinstance(self.opening_hours, list):
-            return ""
-        day_names = ["Mon","Tue","Wed","Thu","Fri","Sat","Sun"]
-        today_idx = datetime.now().weekday()
-        today = day_names[today_idx]
-
-        def today_in_days(spec: str):
-            # Support ranges (Mon-Fri), wrap ranges (Fri-Mon), and comma lists (Mon,Wed,Fri)
-            for part in [p.strip() for p in spec.split(',') if p.strip()]:
-                if '-' in part:
-                    start, end = [x.strip() for x in part.split('-', 1)]
-                    if start in day_names and end in day_names:
-                        si, ei = day_names.index(start), day_names.index(end)
-                        if si <= ei:
-                            if si <= today_idx <= ei:
-                                return True
-                        else:  # wrap
-                            if today_idx >= si or today_idx <= ei:
-                                return True
-                else:
-                    if part == today:
-                        return True
-            return False
-
-        for entry in self.opening_hours:
-            if isinstance(entry, dict):
-                if today_in_days(entry.get("days","")) and entry.get("close"):
-                    return f"Open until {entry['close']}"
-        return ""
-
-    def status_info(self):
+        return self.schedule.open_until_display(datetime.now().weekday())
+
+    def status_info(self, now=None):
         """
         Returns dict: {'text': 'Open until 20:00', 'class': 'status-open'|'status-closing'|'status-closed'}
         Assumes opening_hours is list of dicts: {"days":"Mon-Fri","open":"09:00","close":"20:00"}.
         Handles wrap ranges (Fri-Mon) and 24/7 (00:00-23:59).
         """
-        # 24/7
-        if self.is_24_7():
-            return {"text": "Open 24/7", "class": "status-open"}
-
-        if not isinstance(self.opening_hours, list):
-            return None
-
-        day_names = ["Mon","Tue","Wed","Thu","Fri","Sat","Sun"]
-        now = timezone.localtime() if timezone.is_aware(timezone.now()) else datetime.now()
-        today_idx = now.weekday()
-        today = day_names[today_idx]
-
-        def day_matches(spec: str):
-            # supports "Mon-Fri", "Fri-Mon" (wrap), "Mon,Wed,Fri", single day
-            for part in [p.strip() for p in spec.split(",") if p.strip()]:
-                if "-" in part:
-                    start, end = [x.strip() for x in part.split("-", 1)]
-                    if start in day_names and end in day_names:
-                        si, ei = day_names.index(start), day_names.index(end)
-                        if si <= ei:
-                            if si <= today_idx <= ei:
-                                return True
-                        else:  # wrap (e.g. Fri-Mon)
-                            if today_idx >= si or today_idx <= ei:
-                                return True
-                else:
-                    if part == today:
-                        return True
-            return False
-
-        def as_dt(hhmm: str):
-            try:
-                h, m = hhmm.split(":")
-                return now.replace(hour=int(h), minute=int(m), second=0, microsecond=0)
-            except Exception:
-                return None
-
-        best = None
-        for entry in self.opening_hours:
-            if not isinstance(entry, dict):
-                continue
-            days = entry.get("days")
-            o = entry.get("open")
-            c = entry.get("close")
-            if not (days and o and c):
-                continue
-            if not day_matches(days):
-                continue
-            open_dt = as_dt(o)
-            close_dt = as_dt(c)
-            if not (open_dt and close_dt):
-                continue
-            # Overnight span (open > close) -> treat close as next day
-            if close_dt <= open_dt:
-                close_dt = close_dt + timedelta(days=1)
-            best = (open_dt, close_dt)
-            break  # first matching block
-
-        if not best:
-            return {"text": "Closed", "class": "status-closed"}
-
-        open_dt, close_dt = best
-        # If now before opening
-        if now < open_dt:
-            return {"text": "Closed", "class": "status-closed"}
-        # If within open window
-        if open_dt <= now < close_dt:
-            remaining = close_dt - now
-            close_str = close_dt.strftime("%H:%M")
-            if remaining <= timedelta(hours=1):
-                return {"text": f"Open until {close_str}", "class": "status-closing"}
-            return {"text": f"Open until {close_str}", "class": "status-open"}
-
-        return {"text": "Closed", "class": "status-closed"}
+        return branch_status_cache.get(self, now or local_now())
 
     def get_opening_hours_display(self):
         """Process opening hours data for display"""
@@ -196,37 +150,7 @@ class Branch(models.Model):
     
     def is_current_day_period(self, days_string):
         """Check if current day falls within the given days string"""
-        current_day = datetime.now().strftime('%a')  # Mon, Tue, Wed, etc.
-        days_lower = days_string.lower()
-        
-        day_mappings = {
-            'monday': 'mon', 'tuesday': 'tue', 'wednesday': 'wed', 
-            'thursday': 'thu', 'friday': 'fri', 'saturday': 'sat', 'sunday': 'sun'
-        }
-        
-        current_day_short = current_day.lower()[:3]
-        
-        # Handle ranges like "Mon-Fri"
-        if '-' in days_lower:
-            start_day, end_day = days_lower.split('-')
-            start_day = start_day.strip()[:3]
-            end_day = end_day.strip()[:3]
-            
-            day_order = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
-            try:
-                start_idx = day_order.index(start_day)
-                end_idx = day_order.index(end_day)
-                current_idx = day_order.index(current_day_short)
-                
-                if start_idx <= end_idx:
-                    return start_idx <= current_idx <= end_idx
-                else:  # Wraps around week (e.g., Sat-Mon)
-                    return current_idx >= start_idx or current_idx <= end_idx
-            except ValueError:
-                pass
-        
-        # Handle specific days like "Sat", "Sun", or "Sat-Sun"
-        return current_day_short in days_lower
+        return bool(period_day_mask(days_string) & (1 << datetime.now().weekday()))
     
     def get_formatted_address(self):
         """Return address with commas replaced by line breaks"""
@@ -244,10 +168,35 @@ class Appointment(models.Model):
 
     class Meta:
         ordering = ['-datetime']
+        indexes = [
+            models.Index(fields=['branch', 'datetime'], name='appt_branch_datetime_idx'),
+            # A user's appointments by date (home, appointment_list, dose_create)
+            models.Index(fields=['user', 'datetime'], name='appt_user_datetime_idx'),
+            # Linkable appointments for a dose (dose_link_appointments)
+            models.Index(fields=['user', 'vaccine', 'datetime'], name='appt_user_vaccine_dt_idx'),
+            # Keyset for API cursor pagination
+            models.Index(fields=['datetime', 'id'], name='appt_datetime_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user} - {self.vaccine} @ {self.datetime:%Y-%m-%d %H:%M}"
 
+class SlotCounter(models.Model):
+    """
+    Appointments booked into one (branch, slot) pair. Booking writes reserve
+    capacity by locking or conditionally updating this row, so concurrent
+    requests for the same slot are serialised on it.
+    """
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='slot_counters')
+    slot_start = models.DateTimeField()
+    booked = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('branch', 'slot_start')
+
+    def __str__(self):
+        return f"{self.branch} @ {self.slot_start:%Y-%m-%d %H:%M}: {self.booked}"
+
 class Dose(models.Model):
     vaccine = models.ForeignKey(Vaccine, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='doses')
@@ -258,6 +207,53 @@ class Dose(models.Model):
     class Meta:
         unique_together = ('vaccine', 'user', 'dose_number')
         ordering = ['-date_administered']
+        indexes = [
+            # Covers the per-(user, vaccine) count/latest-date GROUP BY used by the schedule engine
+            models.Index(fields=['user', 'vaccine', 'date_administered'], name='dose_user_vaccine_date_idx'),
+            # A user's dose history by date (home, dose_list, profile)
+            models.Index(fields=['user', 'date_administered'], name='dose_user_date_idx'),
+            # Keyset for API cursor pagination
+            models.Index(fields=['date_administered', 'id'], name='dose_date_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user} - {self.vaccine} dose {self.dose_number}"
+
+
+class UserVaccineStatus(models.Model):
+    """
+    Materialised schedule progress per (user, vaccine), derived from Dose.
+    Kept current by the Dose signals; rebuild with `manage.py rebuild_vaccine_status`.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='vaccine_statuses')
+    vaccine = models.ForeignKey(Vaccine, on_delete=models.CASCADE, related_name='user_statuses')
+    dose_count = models.PositiveSmallIntegerField()
+    last_dose_date = models.DateField()
+    next_due_date = models.DateField(null=True, blank=True)
+    series_complete = models.BooleanField(default=False)
+    completed = models.BooleanField(default=False, help_text="No further doses are due")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'vaccine')
+        indexes = [
+            models.Index(fields=['user', 'next_due_date'], name='uvs_user_next_due_idx'),
+        ]
+        verbose_name_plural = 'user vaccine statuses'
+
+    def __str__(self):
+        return f"{self.user} - {self.vaccine}: {self.dose_count} dose(s)"
+
+    @property
+    def overdue(self):
+        return self.next_due_date is not None and self.next_due_date < timezone.localdate()
+
+    @property
+    def status(self):
+        if self.overdue:
+            return 'overdue'
+        if not self.series_complete:
+            return 'in_progress'
+        if self.completed:
+            return 'complete'
+        return 'up_to_date'
@@ -0,0 +1,150 @@
+"""
+Keyset (cursor) pagination for the large, growing API lists.
+
+Page-number pagination runs a COUNT(*) per request and skips rows with
+OFFSET, so walking a long history gets slower page by page. Cursor pages
+seek straight to the last row seen through a composite index, so the last
+page costs the same as the first. The small reference tables (vaccines,
+branches) keep the default page-number pagination.
+
+DRF's CursorPagination seeks on the first ordering column only and steps
+over ties with an OFFSET capped at 1000, so a run of more than 1000 rows
+sharing a date can't be walked. KeysetCursorPagination instead puts every
+ordering column in the cursor and seeks on the whole tuple:
+(date < d) OR (date = d AND id < i).
+"""
+from base64 import b64decode, b64encode
+from urllib import parse
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+def _reversed(ordering):
+    return tuple(f[1:] if f.startswith('-') else f'-{f}' for f in ordering)
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pages keyed on all of `ordering`, whose last column must be
+    unique (normally id). Each link carries the values of the row it
+    continues from: the last row of the page for `next`, the first for
+    `previous`.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.fields = [self._field(queryset.model, name.lstrip('-')) for name in self.ordering]
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor is not None else None
+
+        ordering = _reversed(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering, position))
+        # One extra row tells whether there is anything beyond this page
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, more
+        else:
+            self.has_next, self.has_previous = more, position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    @staticmethod
+    def _field(model, name):
+        try:
+            return model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return model._meta.pk if name == 'pk' else None
+
+    def _after(self, ordering, position):
+        """Rows strictly after `position` in `ordering`, as one Q."""
+        condition = Q()
+        equal = {}
+        for name, value in zip(ordering, position):
+            attr = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{attr}__{lookup}': value})
+            equal[attr] = value
+        # The OR alone makes SQLite scan the index from the top; bounding the
+        # leading column as well turns it into a range seek.
+        first = ordering[0]
+        bound = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": position[0]})
+        return bound & condition if len(ordering) > 1 else condition
+
+    def _position(self, instance):
+        values = []
+        for name in self.ordering:
+            name = name.lstrip('-')
+            value = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        return values
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        # From an empty page (the rows ran out under a reverse cursor) start over
+        position = self._position(self.page[-1]) if self.page else None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self._position(self.page[0]) if self.page else None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            tokens = parse.parse_qs(b64decode(encoded.encode('ascii')).decode('ascii'), keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            values = tokens.get('p')
+            position = None
+            if values is not None:
+                if len(values) != len(self.ordering):
+                    raise ValueError("Cursor doesn't match the ordering")
+                position = [field.to_python(value) if field is not None else value
+                            for field, value in zip(self.fields, values)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        tokens = {}
+        if cursor.reverse:
+            tokens['r'] = '1'
+        if cursor.position is not None:
+            tokens['p'] = cursor.position
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+
+class AppointmentCursorPagination(KeysetCursorPagination):
+    # Backed by the appt_datetime_id_idx index
+    ordering = ('-datetime', '-id')
+
+
+class DoseCursorPagination(KeysetCursorPagination):
+    # Backed by the dose_date_id_idx index
+    ordering = ('-date_administered', '-id')
+
+
+class UserCursorPagination(KeysetCursorPagination):
+    ordering = ('id',)
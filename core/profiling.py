@@ -0,0 +1,262 @@
+"""
+On-demand profiling of single requests.
+
+Staff users profile a request by adding ?_profile=1 or an "X-Profile: 1"
+header. The value picks the profiler:
+
+- "1" or "cprofile": cProfile, deterministic. Every call is counted, at
+  several times the request's normal cost. Python 3.12+ allows only one
+  active profiler per process, so while one request is under cProfile,
+  others asking for it get the sampler instead;
+- "sample": a background thread records the request thread's stack every
+  PROFILE_SAMPLE_INTERVAL seconds. The overhead is low and the timings are
+  approximate.
+
+PROFILE_SAMPLE_VIEWS ({url name: N}) also profiles a random 1 in N requests
+to those views for any user, with the sampling profiler.
+
+Each profile is written to PROFILE_DIR. A JSON summary holds the request,
+the timing and the top functions by cumulative time. Next to it is the raw
+profile: a .prof file for pstats or snakeviz, or collapsed stacks (.txt) for
+flame graph tools. Only the newest PROFILE_KEEP profiles are kept. Staff
+can browse them at /staff/profiles/.
+"""
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+PROFILE_FLAG = '_profile'
+PROFILE_HEADER = 'X-Profile'
+DEFAULT_KEEP = 50
+DEFAULT_SAMPLE_INTERVAL = 0.002
+TOP_FUNCTIONS = 20
+SAFE_NAME = re.compile(r'^[\w.-]+$')
+UNSAFE_CHARS = re.compile(r'[^\w.-]')
+
+
+def profile_dir():
+    directory = getattr(settings, 'PROFILE_DIR', None)
+    return Path(directory) if directory else Path(tempfile.gettempdir()) / 'vaccination-profiles'
+
+
+def _function(filename, line, name):
+    return f'{filename}:{line}({name})'
+
+
+# Held by the request being profiled with cProfile in this process
+_cprofile_slot = threading.Lock()
+
+
+class CProfileRun:
+    mode = 'cprofile'
+    suffix = '.prof'
+
+    @classmethod
+    def claim(cls):
+        """A run holding this process's cProfile slot, or None if it is taken."""
+        if not _cprofile_slot.acquire(blocking=False):
+            return None
+        return cls(slot=_cprofile_slot)
+
+    def __init__(self, slot=None):
+        self._slot = slot
+
+    def __enter__(self):
+        self.profiler = cProfile.Profile()
+        try:
+            self.profiler.enable()
+        except BaseException:
+            self._release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.disable()
+        self._release()
+
+    def _release(self):
+        if self._slot is not None:
+            self._slot.release()
+            self._slot = None
+
+    def top(self, limit=TOP_FUNCTIONS):
+        stats = pstats.Stats(self.profiler).stats
+        rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+        return [{
+            'function': _function(*func),
+            'calls': calls,
+            'self_ms': round(own * 1000, 2),
+            'cumulative_ms': round(cumulative * 1000, 2),
+        } for func, (_primitive, calls, own, cumulative, _callers) in rows]
+
+    def save(self, path):
+        self.profiler.dump_stats(path)
+
+
+class SampledRun:
+    """Samples the calling thread's stack from a background thread."""
+    mode = 'sample'
+    suffix = '.txt'
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.thread_id = threading.get_ident()
+        # Frames above the caller are the same in every sample; leave them out
+        self.base_depth = len(self._stack(sys._getframe(1)))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    @staticmethod
+    def _stack(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[tuple(self._stack(frame)[self.base_depth:])] += 1
+
+    def top(self, limit=TOP_FUNCTIONS):
+        cumulative, own = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            if not stack:
+                continue
+            for func in set(stack):
+                cumulative[func] += count
+            own[stack[-1]] += count
+        ms = self.interval * 1000
+        return [{
+            'function': _function(*func),
+            'samples': count,
+            'self_ms': round(own[func] * ms, 2),
+            'cumulative_ms': round(count * ms, 2),
+        } for func, count in cumulative.most_common(limit)]
+
+    def save(self, path):
+        with open(path, 'w') as fh:
+            for stack, count in self.stacks.most_common():
+                fh.write(';'.join(f'{name} ({os.path.basename(filename)}:{line})'
+                                  for filename, line, name in stack) + f' {count}\n')
+
+
+def _rotate(directory, keep):
+    summaries = sorted(directory.glob('*.json'))
+    for summary in summaries[:max(len(summaries) - keep, 0)]:
+        for path in directory.glob(f'{summary.stem}.*'):
+            path.unlink(missing_ok=True)
+
+
+def save_profile(run, request, response, duration, view):
+    """Write `run` and its summary to PROFILE_DIR; returns the profile's name."""
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    now = datetime.now(timezone.utc)
+    label = UNSAFE_CHARS.sub('_', view or 'unresolved')
+    name = f'{now:%Y%m%dT%H%M%S%f}-{os.getpid()}-{label}'
+    artifact = f'{name}{run.suffix}'
+    run.save(directory / artifact)
+    user = getattr(request, 'user', None)
+    summary = {
+        'name': name,
+        'created': now.isoformat(),
+        'mode': run.mode,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'view': view,
+        'status': response.status_code,
+        'user': user.get_username() if user is not None and user.is_authenticated else None,
+        'duration_ms': round(duration * 1000, 2),
+        'artifact': artifact,
+        'top': run.top(),
+    }
+    (directory / f'{name}.json').write_text(json.dumps(summary))
+    _rotate(directory, getattr(settings, 'PROFILE_KEEP', DEFAULT_KEEP))
+    return name
+
+
+def recent_profiles():
+    """Summaries of the stored profiles, newest first."""
+    summaries = []
+    for path in sorted(profile_dir().glob('*.json'), reverse=True):
+        try:
+            summaries.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue  # rotated away or half written
+    return summaries
+
+
+def profile_artifact(name):
+    """Path of a stored raw profile, or None for an unknown or unsafe name."""
+    if not SAFE_NAME.match(name) or name.endswith('.json'):
+        return None
+    path = profile_dir() / name
+    return path if path.is_file() else None
+
+
+class ProfilingMiddleware:
+    """Profile requests on demand; see the module docstring. Needs request.user."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _view_name(self, request):
+        try:
+            return resolve(request.path_info, getattr(request, 'urlconf', None)).view_name
+        except Resolver404:
+            return None
+
+    def _run_for(self, request):
+        requested = request.GET.get(PROFILE_FLAG) or request.headers.get(PROFILE_HEADER)
+        if requested and request.user.is_staff:
+            run = CProfileRun.claim() if requested != 'sample' else None
+            return run or SampledRun(self._interval())
+        sampled = getattr(settings, 'PROFILE_SAMPLE_VIEWS', None)
+        if sampled:
+            every = sampled.get(self._view_name(request))
+            if every and random.randrange(every) == 0:
+                return SampledRun(self._interval())
+        return None
+
+    @staticmethod
+    def _interval():
+        return getattr(settings, 'PROFILE_SAMPLE_INTERVAL', DEFAULT_SAMPLE_INTERVAL)
+
+    def __call__(self, request):
+        run = self._run_for(request)
+        if run is None:
+            return self.get_response(request)
+        started = time.perf_counter()
+        with run:
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        name = save_profile(run, request, response, duration, match.view_name if match else None)
+        response['X-Profile-Id'] = name
+        return response
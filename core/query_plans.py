@@ -0,0 +1,104 @@
+"""
+EXPLAIN review of the hot queries behind the patient pages, booking and API.
+
+HOT_QUERIES builds each query the way the views do for a sample user,
+vaccine and branch. explain_hot_queries() runs EXPLAIN on each and flags
+full table scans and sorts the planner could not serve from an index.
+Plans depend on table statistics, so run `manage.py check_query_plans`
+against a production-sized copy of the data (after ANALYZE) to judge them.
+"""
+import re
+from collections import namedtuple
+from datetime import timedelta
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+from .models import Vaccine, Branch, Appointment, Dose
+from .vaccine_schedule import _dose_totals, upcoming_vaccinations
+
+# Reference tables are tiny (and cached in core.registry); scanning them is fine
+SMALL_TABLES = (Vaccine._meta.db_table, Branch._meta.db_table)
+
+# (pattern, problem) per database vendor. Sorts of only the trailing ORDER BY
+# terms (SQLite's "RIGHT PART", PostgreSQL's Incremental Sort) are left out:
+# the index supplies the leading order and only ties are sorted.
+PROBLEM_PATTERNS = {
+    'sqlite': [
+        (re.compile(r'\bSCAN (\w+)(?! USING (?:COVERING )?INDEX)(?!\w)'), 'full scan of {0}'),
+        (re.compile(r'USE TEMP B-TREE FOR (?!RIGHT PART)(.+)'), 'temp B-tree for {0}'),
+    ],
+    'postgresql': [
+        (re.compile(r'Seq Scan on (\w+)'), 'full scan of {0}'),
+        (re.compile(r'^\s*(?:->\s*)?Sort\s+\(', re.M), 'explicit sort'),
+    ],
+    'mysql': [
+        (re.compile(r'Table scan on (\w+)'), 'full scan of {0}'),
+        (re.compile(r'Sort: (.+)'), 'filesort on {0}'),
+    ],
+}
+
+PlanReport = namedtuple('PlanReport', 'name plan problems')
+
+
+class Sample(namedtuple('Sample', 'user_id vaccine_id branch_id now')):
+    """Ids to plug into the hot queries; any existing ids will do."""
+
+    @classmethod
+    def pick(cls, user_id=None):
+        if user_id is None:
+            user_id = Dose.objects.order_by().values_list('user_id', flat=True).first() or 1
+        vaccine_id = Vaccine.objects.order_by().values_list('pk', flat=True).first() or 1
+        branch_id = Branch.objects.order_by().values_list('pk', flat=True).first() or 1
+        return cls(user_id, vaccine_id, branch_id, timezone.now())
+
+
+def _slot_window(s):
+    return Appointment.objects.filter(
+        branch_id=s.branch_id, datetime__gte=s.now, datetime__lt=s.now + timedelta(days=7),
+    ).order_by().values_list('datetime', flat=True)
+
+
+# name -> queryset builder; each mirrors a query issued by a view or service
+HOT_QUERIES = {
+    'home: appointments': lambda s: Appointment.objects.select_related('vaccine', 'branch').filter(user_id=s.user_id),
+    'home: recent doses': lambda s: Dose.objects.select_related('vaccine').filter(user_id=s.user_id).order_by('-date_administered')[:5],
+    'appointment_list: upcoming': lambda s: Appointment.objects.select_related('vaccine', 'branch').filter(
+        user_id=s.user_id, datetime__gte=s.now).order_by('datetime'),
+    'appointment_list: past': lambda s: Appointment.objects.select_related('vaccine', 'branch').filter(
+        user_id=s.user_id, datetime__lt=s.now).order_by('-datetime'),
+    'dose_list': lambda s: Dose.objects.select_related('vaccine', 'appointment').filter(user_id=s.user_id).order_by('-date_administered'),
+    'dose_link_appointments': lambda s: Appointment.objects.filter(
+        user_id=s.user_id, vaccine_id=s.vaccine_id, datetime__lt=s.now,
+    ).exclude(doses__isnull=False).select_related('vaccine', 'branch'),
+    'slot capacity': _slot_window,
+    'next dose number': lambda s: Dose.objects.filter(user_id=s.user_id, vaccine_id=s.vaccine_id).values('user_id').annotate(
+        m=Max('dose_number')).values('m'),
+    'schedule: dose totals': lambda s: _dose_totals(Dose.objects.filter(user_id=s.user_id)),
+    'schedule: upcoming': lambda s: upcoming_vaccinations(s.user_id),
+    'api: appointment page': lambda s: Appointment.objects.order_by('-datetime', '-id')[:20],
+    'api: dose page': lambda s: Dose.objects.order_by('-date_administered', '-id')[:20],
+}
+
+
+def find_problems(plan, vendor=None):
+    """Full scans and unindexed sorts mentioned in an EXPLAIN plan."""
+    problems = []
+    for pattern, message in PROBLEM_PATTERNS.get(vendor or connection.vendor, []):
+        for match in pattern.finditer(plan):
+            groups = [g.strip() for g in match.groups()]
+            if groups and groups[0] in SMALL_TABLES:
+                continue
+            problems.append(message.format(*groups))
+    return problems
+
+
+def explain_hot_queries(sample=None, names=None):
+    """PlanReport for each hot query (or just those in `names`)."""
+    sample = sample or Sample.pick()
+    reports = []
+    for name, build in HOT_QUERIES.items():
+        if names and name not in names:
+            continue
+        plan = build(sample).explain()
+        reports.append(PlanReport(name, plan, find_problems(plan)))
+    return reports
@@ -0,0 +1,95 @@
+"""
+Version stamp for reference data (vaccines and branches).
+
+The stamp is a random token plus the time it was issued, kept in the
+"reference" cache and replaced (after commit) whenever a Vaccine or Branch
+is saved or deleted. It drives strong ETags and Last-Modified on the
+reference endpoints so unchanged data is answered with 304 Not Modified
+without a database query. Every worker must read the same stamp, or one
+that missed a bump keeps answering 304 for data that changed; so the
+"reference" alias defaults to a file-based cache in the temp directory,
+shared by all processes on the host. Deployments spread over several
+hosts point it at Redis or Memcached (REFERENCE_CACHE_BACKEND and
+REFERENCE_CACHE_LOCATION).
+
+Branch responses also embed the open/closed status, which changes on a
+schedule rather than on writes. Their validators add the current "status
+window": the stretch of the week between two consecutive status
+transitions of any branch. The transition instants are computed once per
+stamp.
+"""
+from bisect import bisect_right
+from datetime import timedelta
+from functools import lru_cache
+from uuid import uuid4
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from .models import Branch, local_now
+from .schedule import compile_schedule, minute_of_week
+
+STAMP_CACHE = 'reference'
+VERSION_KEY = 'reference-data:version'
+
+
+def stamp_cache():
+    return caches[STAMP_CACHE]
+
+
+def _new_stamp():
+    return uuid4().hex[:16], timezone.now().replace(microsecond=0)
+
+
+def current_version():
+    """(token, last_modified) of the current reference data."""
+    cache = stamp_cache()
+    stamp = cache.get(VERSION_KEY)
+    if stamp is None:
+        # First request after a restart or eviction: first writer wins
+        cache.add(VERSION_KEY, _new_stamp(), timeout=None)
+        stamp = cache.get(VERSION_KEY) or _new_stamp()
+    return stamp
+
+
+def bump_version():
+    """Issue a new stamp; call after any change that bypasses model signals."""
+    stamp_cache().set(VERSION_KEY, _new_stamp(), timeout=None)
+
+
+@lru_cache(maxsize=8)
+def _branch_transitions(version):
+    transitions = set()
+    for hours in Branch.objects.using(DEFAULT_DB_ALIAS).values_list('opening_hours', flat=True):
+        transitions.update(compile_schedule(hours).transitions)
+    return tuple(sorted(transitions))
+
+
+def _status_window(now):
+    """(window id, window start) for the branch statuses at `now` (local time)."""
+    transitions = _branch_transitions(current_version()[0])
+    monday = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    index = bisect_right(transitions, minute_of_week(now))
+    start = monday + timedelta(minutes=transitions[index - 1]) if index else monday
+    return f'{monday:%Y%m%d}.{index}', start
+
+
+# Validator callables for django.views.decorators.http.condition
+
+def reference_etag(request, *args, **kwargs):
+    return current_version()[0]
+
+
+def reference_last_modified(request, *args, **kwargs):
+    return current_version()[1]
+
+
+def branch_etag(request, *args, **kwargs):
+    window, _ = _status_window(local_now())
+    return f'{current_version()[0]}-{window}'
+
+
+def branch_last_modified(request, *args, **kwargs):
+    _, window_start = _status_window(local_now())
+    if timezone.is_naive(window_start):
+        window_start = timezone.make_aware(window_start)
+    return max(current_version()[1], window_start)
@@ -0,0 +1,117 @@
+"""
+Per-process registry of vaccines and branches.
+
+Both tables are tiny and read on nearly every booking request, so each
+process keeps one snapshot of them and reloads it only when the
+reference-data version (core.reference_data) changes. Form choice fields,
+id validation in forms and serializers, and views look vaccines and
+branches up here instead of querying.
+
+Saving or deleting a vaccine or branch also drops this process's snapshot
+at once (core.signals), so the writer sees its own change; a change that
+is then rolled back stays visible here until the next reload.
+
+The version stamp is shared by every process (see core.reference_data),
+and each lookup re-reads it, so another worker's change is picked up as
+soon as its bump lands after commit: edited rows (opening hours, prices)
+are reloaded and deleted ones are no longer found. In the short gap
+between that worker's commit and its bump, an id missing from the
+snapshot costs one existence query, and if the row is there, the snapshot
+is reloaded, so new rows are accepted straight away. Until the bump lands,
+edits and deletions made elsewhere are still served from the old snapshot.
+
+Snapshot containers are read-only. Lookups hand out shallow copies of the
+cached instances, so callers may assign to or save what they get back
+without changing the snapshot other requests see.
+"""
+import copy
+import threading
+from django.db import DEFAULT_DB_ALIAS
+from types import MappingProxyType
+from .models import Vaccine, Branch
+from .reference_data import current_version
+from .request_timing import record_cache_lookup
+
+
+class Snapshot:
+    __slots__ = ('version', 'vaccines', 'branches', '_vaccines_by_id', '_branches_by_id')
+
+    def __init__(self, version, vaccines, branches):
+        self.version = version
+        self.vaccines = tuple(vaccines)
+        self.branches = tuple(branches)
+        self._vaccines_by_id = MappingProxyType({v.pk: v for v in self.vaccines})
+        self._branches_by_id = MappingProxyType({b.pk: b for b in self.branches})
+
+    def by_id(self, model):
+        return self._vaccines_by_id if model is Vaccine else self._branches_by_id
+
+
+def _pk(value):
+    value = getattr(value, 'pk', value)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ReferenceRegistry:
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def snapshot(self):
+        version = current_version()[0]
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != version:
+                    snapshot = self._snapshot = self._load(version)
+                    record_cache_lookup(misses=1)
+                    return snapshot
+        record_cache_lookup(hits=1)
+        return snapshot
+
+    def _load(self, version):
+        self.loads += 1
+        # From the primary: a lagging replica would pin stale rows to the new version
+        branches = list(Branch.objects.using(DEFAULT_DB_ALIAS).order_by('name'))
+        for branch in branches:
+            branch.schedule  # compile once per snapshot
+        return Snapshot(version, Vaccine.objects.using(DEFAULT_DB_ALIAS).order_by('name'), branches)
+
+    def clear(self):
+        self._snapshot = None
+
+    def all(self, model):
+        """Every vaccine or branch, ordered by name (shared instances; read only)."""
+        snapshot = self.snapshot()
+        return snapshot.vaccines if model is Vaccine else snapshot.branches
+
+    def get(self, model, value):
+        """A copy of the vaccine or branch with pk `value`, or None."""
+        pk = _pk(value)
+        snapshot = self.snapshot()
+        instance = snapshot.by_id(model).get(pk)
+        if instance is None and pk is not None and model.objects.using(DEFAULT_DB_ALIAS).filter(pk=pk).exists():
+            # Added since the snapshot was taken, by a process whose version
+            # bump this one can't see
+            with self._lock:
+                if self._snapshot is snapshot:
+                    self._snapshot = self._load(snapshot.version)
+                snapshot = self._snapshot
+            record_cache_lookup(misses=1)
+            instance = snapshot.by_id(model).get(pk)
+        return copy.copy(instance) if instance is not None else None
+
+    def vaccine(self, value):
+        return self.get(Vaccine, value)
+
+    def branch(self, value):
+        return self.get(Branch, value)
+
+
+reference_registry = ReferenceRegistry()
@@ -0,0 +1,210 @@
+"""
+Per-request SQL and template timing.
+
+RequestTimingMiddleware profiles a sample of requests (REQUEST_TIMING_SAMPLE_RATE,
+0 to 1) to the HTML views and the API alike. For each sampled request it
+records:
+
+- the number of queries and total SQL time, on every database alias;
+- the slowest statements;
+- duplicate queries, grouped by fingerprint (the SQL with literals and IN
+  lists collapsed). The same fingerprint many times is the N+1 signature;
+- time spent rendering templates (through TimedDjangoTemplates, the template
+  backend in settings).
+
+The result is sent back in a Server-Timing header (shown by browser dev
+tools) and logged as one JSON line on the "core.request_timing" logger.
+With METRICS_ENABLED every other request is timed too, keeping only totals,
+for the latency histograms in core.metrics. Application caches report their
+hits and misses against the request with record_cache_lookup().
+"""
+import json
+import logging
+import random
+import re
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from hashlib import sha1
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from .metrics import metrics_enabled, view_metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_RATE = 0.05
+SLOWEST = 3
+DUPLICATES = 5
+SQL_PREVIEW = 200
+
+_current = ContextVar('request_profile', default=None)
+
+_IN_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """A short id for `sql` that ignores parameter values and IN-list lengths."""
+    shape = _SPACE.sub(' ', _LITERAL.sub('?', _IN_LIST.sub('(...)', sql))).strip()
+    return sha1(shape.encode()).hexdigest()[:10]
+
+
+class RequestProfile:
+    """
+    What one request spent its time on. Totals are always kept; individual
+    statements only for a `detailed` (sampled) profile.
+    """
+
+    def __init__(self, detailed=True):
+        self.detailed = detailed
+        self.started = time.perf_counter()
+        self.duration = None
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.queries = []  # (seconds, alias, sql)
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._template_depth = 0
+
+    def slowest(self, limit=SLOWEST):
+        return sorted(self.queries, key=lambda q: q[0], reverse=True)[:limit]
+
+    def duplicates(self, limit=DUPLICATES):
+        """[(fingerprint, count, seconds, sql)] for statements run more than once."""
+        groups = {}
+        for seconds, _alias, sql in self.queries:
+            key = fingerprint(sql)
+            count, total, _sql = groups.get(key, (0, 0.0, sql))
+            groups[key] = (count + 1, total + seconds, sql)
+        repeated = [(key, count, total, sql) for key, (count, total, sql) in groups.items() if count > 1]
+        return sorted(repeated, key=lambda d: (d[1], d[2]), reverse=True)[:limit]
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.query_count += 1
+            self.sql_time += elapsed
+            if self.detailed:
+                self.queries.append((elapsed, context['connection'].alias, sql))
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+
+    def server_timing(self):
+        return ', '.join([
+            f'sql;dur={self.sql_time * 1000:.1f};desc="{self.query_count} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'total;dur={self.duration * 1000:.1f}',
+        ])
+
+    def as_dict(self):
+        return {
+            'duration_ms': round(self.duration * 1000, 2),
+            'queries': self.query_count,
+            'sql_ms': round(self.sql_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'slowest': [
+                {'ms': round(seconds * 1000, 2), 'db': alias, 'sql': sql[:SQL_PREVIEW]}
+                for seconds, alias, sql in self.slowest()
+            ],
+            'duplicates': [
+                {'fingerprint': key, 'count': count, 'ms': round(total * 1000, 2), 'sql': sql[:SQL_PREVIEW]}
+                for key, count, total, sql in self.duplicates()
+            ],
+        }
+
+
+def current_profile():
+    """The RequestProfile of the request being served, if it is profiled."""
+    return _current.get()
+
+
+def record_cache_lookup(hits=0, misses=0):
+    """Count lookups in an application cache against the current request."""
+    profile = _current.get()
+    if profile is not None:
+        profile.cache_hits += hits
+        profile.cache_misses += misses
+
+
+def sample_rate():
+    return getattr(settings, 'REQUEST_TIMING_SAMPLE_RATE', DEFAULT_SAMPLE_RATE)
+
+
+class RequestTimingMiddleware:
+    """
+    Profile a sample of requests (see the module docstring), and time every
+    request for core.metrics when METRICS_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = sample_rate()
+        detailed = rate > 0 and random.random() < rate
+        if not detailed and not metrics_enabled():
+            return self.get_response(request)
+        profile = RequestProfile(detailed)
+        token = _current.set(profile)
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(profile.record_query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        profile.finish()
+        match = request.resolver_match
+        view = match.view_name if match else None
+        if metrics_enabled():
+            view_metrics.observe(view, request.method, response.status_code, profile)
+        if detailed:
+            response['Server-Timing'] = profile.server_timing()
+            logger.info(json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'view': view,
+                'status': response.status_code,
+                **profile.as_dict(),
+            }))
+        return response
+
+
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        profile = _current.get()
+        if profile is None:
+            return super().render(context, request)
+        # Only the outermost render counts; nested renders are part of it
+        profile._template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile._template_depth -= 1
+            if not profile._template_depth:
+                profile.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing renders for RequestTimingMiddleware."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
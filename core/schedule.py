@@ -0,0 +1,286 @@
+"""
+Compiled weekly opening-hours schedules for branches.
+
+Branch.opening_hours is stored as a list of {"days": "Mon-Fri", "open": "09:00",
+"close": "20:00"} dicts. Rather than re-splitting the day strings on every
+status lookup, the JSON is compiled once into minute-of-week intervals and the
+compiled object is shared by every Branch with the same hours.
+"""
+from bisect import bisect_right
+from functools import lru_cache
+import json
+
+DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+CLOSING_SOON_MINUTES = 60
+
+STATUS_OPEN = "status-open"
+STATUS_CLOSING = "status-closing"
+STATUS_CLOSED = "status-closed"
+
+
+def _range_mask(start_idx, end_idx):
+    """Bitmask of weekday indexes from start to end inclusive, wrapping past Sunday."""
+    if start_idx <= end_idx:
+        days = range(start_idx, end_idx + 1)
+    else:
+        days = list(range(start_idx, 7)) + list(range(0, end_idx + 1))
+    mask = 0
+    for idx in days:
+        mask |= 1 << idx
+    return mask
+
+
+def parse_day_spec(spec):
+    """
+    Return a 7-bit weekday mask (bit 0 = Monday) for a days string.
+    Supports ranges (Mon-Fri), wrap ranges (Fri-Mon) and comma lists (Mon,Wed,Fri).
+    """
+    if not isinstance(spec, str):
+        return 0
+    mask = 0
+    for part in [p.strip() for p in spec.split(",") if p.strip()]:
+        if "-" in part:
+            start, end = [x.strip() for x in part.split("-", 1)]
+            if start in DAY_NAMES and end in DAY_NAMES:
+                mask |= _range_mask(DAY_NAMES.index(start), DAY_NAMES.index(end))
+        elif part in DAY_NAMES:
+            mask |= 1 << DAY_NAMES.index(part)
+    return mask
+
+
+def parse_hhmm(value):
+    """Return minutes since midnight for 'HH:MM', or None if it is not a valid time of day."""
+    try:
+        h, m = value.split(":")
+        h, m = int(h), int(m)
+    except Exception:
+        return None
+    if not (0 <= h <= 23 and 0 <= m <= 59):
+        return None
+    return h * 60 + m
+
+
+@lru_cache(maxsize=256)
+def period_day_mask(days_string):
+    """
+    Weekday mask for the looser days matching used by the opening hours table
+    (case-insensitive, full day names allowed, substring fallback).
+    """
+    day_order = [d.lower() for d in DAY_NAMES]
+    days_lower = days_string.lower()
+    if '-' in days_lower:
+        start_day, end_day = days_lower.split('-')
+        start_day = start_day.strip()[:3]
+        end_day = end_day.strip()[:3]
+        if start_day in day_order and end_day in day_order:
+            return _range_mask(day_order.index(start_day), day_order.index(end_day))
+    mask = 0
+    for idx, day in enumerate(day_order):
+        if day in days_lower:
+            mask |= 1 << idx
+    return mask
+
+
+def _is_24_7_entry(entry):
+    o = entry.get("open", "")
+    c = entry.get("close", "")
+    if not (isinstance(o, str) and isinstance(c, str)):
+        return False
+    return o.strip() in ("00:00", "0:00") and c.strip() in ("23:59", "24:00")
+
+
+def format_minutes(minutes):
+    minutes %= MINUTES_PER_DAY
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class WeeklySchedule:
+    """
+    Immutable, compiled form of a branch's opening hours.
+
+    Each weekday has at most one opening window: the first entry whose days
+    match that weekday. Windows are stored as parallel sorted tuples of
+    minute-of-week offsets (Monday 00:00 = 0). An overnight window (e.g.
+    22:00-06:00) keeps its start on the day it opens and ends past midnight.
+    """
+
+    __slots__ = ("valid", "always_open", "starts", "ends", "close_labels", "day_windows", "transitions")
+
+    def __init__(self, valid, always_open, starts, ends, close_labels, day_windows=((),) * 7):
+        self.valid = valid
+        self.always_open = always_open
+        self.starts = starts
+        self.ends = ends
+        self.close_labels = close_labels
+        # Every matching (open, close) block per weekday, in minutes from that
+        # day's midnight; used for booking slots rather than status text.
+        self.day_windows = day_windows
+        self.transitions = self._transitions() if valid and not always_open else ()
+
+    def _transitions(self):
+        """
+        Sorted minute-of-week instants at which status_at_minute() can change:
+        opening, the start of the closing-soon hour, and closing (or midnight,
+        after which an overnight window is no longer reported).
+        """
+        points = set()
+        for start, end in zip(self.starts, self.ends):
+            day_end = (start // MINUTES_PER_DAY + 1) * MINUTES_PER_DAY
+            shown_until = min(end, day_end)
+            points.add(start)
+            if start < end - CLOSING_SOON_MINUTES < shown_until:
+                points.add(end - CLOSING_SOON_MINUTES)
+            points.add(shown_until % MINUTES_PER_WEEK)
+        return tuple(sorted(points))
+
+    @classmethod
+    def compile(cls, opening_hours):
+        if not isinstance(opening_hours, list):
+            return cls(False, False, (), (), (None,) * 7)
+
+        entries = [e for e in opening_hours if isinstance(e, dict)]
+        always_open = any(_is_24_7_entry(e) for e in entries)
+
+        windows = [None] * 7
+        close_labels = [None] * 7
+        day_windows = [[] for _ in range(7)]
+        for entry in entries:
+            days = entry.get("days")
+            mask = parse_day_spec(days)
+            if not mask:
+                continue
+            close = entry.get("close")
+            for idx in range(7):
+                if mask & (1 << idx) and close and close_labels[idx] is None:
+                    close_labels[idx] = close
+            o = parse_hhmm(entry.get("open")) if entry.get("open") else None
+            c = parse_hhmm(close) if close else None
+            bookable_close = MINUTES_PER_DAY if close == "24:00" else c
+            if o is not None and bookable_close is not None:
+                span = (o, bookable_close if bookable_close > o else bookable_close + MINUTES_PER_DAY)
+                for idx in range(7):
+                    if mask & (1 << idx) and span not in day_windows[idx]:
+                        day_windows[idx].append(span)
+            if o is None or c is None:
+                continue
+            if c <= o:
+                c += MINUTES_PER_DAY
+            for idx in range(7):
+                if mask & (1 << idx) and windows[idx] is None:
+                    windows[idx] = (idx * MINUTES_PER_DAY + o, idx * MINUTES_PER_DAY + c)
+
+        if always_open:
+            day_windows = [[(0, MINUTES_PER_DAY)] for _ in range(7)]
+
+        present = [w for w in windows if w is not None]
+        return cls(
+            True,
+            always_open,
+            tuple(w[0] for w in present),
+            tuple(w[1] for w in present),
+            tuple(close_labels),
+            tuple(tuple(sorted(w)) for w in day_windows),
+        )
+
+    def window_for(self, minute_of_week):
+        """
+        Return (start, end) of the window that opened today at or before
+        minute_of_week, or None. Spill-over from yesterday's overnight window
+        does not count, matching how branches have always been reported.
+        """
+        i = bisect_right(self.starts, minute_of_week) - 1
+        if i < 0:
+            return None
+        start = self.starts[i]
+        if start // MINUTES_PER_DAY != int(minute_of_week) // MINUTES_PER_DAY:
+            return None
+        return start, self.ends[i]
+
+    def status_at(self, now):
+        """
+        Status dict for a datetime: {'text': ..., 'class': 'status-open'|'status-closing'|'status-closed'}.
+        Returns None when the hours could not be interpreted at all.
+        """
+        return self.status_at_minute(minute_of_week(now))
+
+    def status_at_minute(self, minute):
+        if self.always_open:
+            return {"text": "Open 24/7", "class": STATUS_OPEN}
+        if not self.valid:
+            return None
+        window = self.window_for(minute)
+        if window is None or not (window[0] <= minute < window[1]):
+            return {"text": "Closed", "class": STATUS_CLOSED}
+        text = f"Open until {format_minutes(window[1])}"
+        if window[1] - minute <= CLOSING_SOON_MINUTES:
+            return {"text": text, "class": STATUS_CLOSING}
+        return {"text": text, "class": STATUS_OPEN}
+
+    def minutes_until_change(self, minute):
+        """
+        Minutes from minute_of_week until the status can next change, or None
+        if it never does (24/7 or uninterpretable hours).
+        """
+        if not self.transitions:
+            return None
+        i = bisect_right(self.transitions, minute)
+        if i < len(self.transitions):
+            return self.transitions[i] - minute
+        return self.transitions[0] + MINUTES_PER_WEEK - minute
+
+    @property
+    def has_hours(self):
+        """True when at least one bookable opening window could be parsed."""
+        return any(self.day_windows)
+
+    def open_until_display(self, weekday):
+        if self.always_open:
+            return "Open 24/7"
+        label = self.close_labels[weekday]
+        return f"Open until {label}" if label else ""
+
+
+def minute_of_week(dt):
+    """Fractional minutes since Monday 00:00 for a datetime."""
+    return (
+        dt.weekday() * MINUTES_PER_DAY
+        + dt.hour * 60
+        + dt.minute
+        + (dt.second + dt.microsecond / 1_000_000) / 60
+    )
+
+
+def statuses_at(schedules, now):
+    """
+    Evaluate many schedules against a single reference time.
+
+    The minute-of-week is computed once and each distinct compiled schedule is
+    evaluated once (branches with identical hours share a WeeklySchedule), so
+    the cost per branch is a dictionary lookup regardless of how many there are.
+    """
+    minute = minute_of_week(now)
+    memo = {}
+    results = []
+    for schedule in schedules:
+        key = id(schedule)
+        if key not in memo:
+            memo[key] = schedule.status_at_minute(minute)
+        status = memo[key]
+        results.append(dict(status) if status is not None else None)
+    return results
+
+
+@lru_cache(maxsize=1024)
+def _compile_cached(key):
+    return WeeklySchedule.compile(json.loads(key))
+
+
+def compile_schedule(opening_hours):
+    """Compile opening hours, sharing one WeeklySchedule between identical hours."""
+    try:
+        key = json.dumps(opening_hours, sort_keys=True)
+    except (TypeError, ValueError):
+        return WeeklySchedule.compile(opening_hours)
+    return _compile_cached(key)
@@ -1,10 +1,102 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from .models import Vaccine, Branch, Appointment, Dose
+from .booking import SlotUnavailable, book_appointment, reschedule_appointment
+from .doses import record_dose
+from .registry import reference_registry
+from .slots import slot_error
 
 User = get_user_model()
 
 
+def parse_expand(value):
+    """'user,appointment.branch' -> {'user': {}, 'appointment': {'branch': {}}}"""
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for name in filter(None, (part.strip() for part in path.split('.'))):
+            node = node.setdefault(name, {})
+    return tree
+
+
+class ExpandableFieldsMixin:
+    """
+    Sparse fieldsets and opt-in nesting for list/detail serializers.
+
+    `expandable_fields` maps a relation to (output field, serializer class).
+    Nested objects are only included when the relation is named in
+    ?expand= (dotted paths reach into nested serializers, e.g.
+    ?expand=appointment.branch); otherwise only the related id is returned.
+    ?fields=id,datetime limits the output to the listed fields (expanded
+    objects are always kept).
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, expand=None, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if expand is None:
+            # Top-level serializer: read the options from the request
+            params = request.query_params if request is not None else {}
+            expand = parse_expand(params.get('expand'))
+            fields = [f.strip() for f in params.get('fields', '').split(',') if f.strip()]
+
+        expanded = []
+        for name, (field_name, serializer_class) in self.expandable_fields.items():
+            if name not in expand:
+                continue
+            options = {'source': name, 'read_only': True}
+            if issubclass(serializer_class, ExpandableFieldsMixin):
+                options['expand'] = expand[name]
+            self.fields[field_name] = serializer_class(**options)
+            expanded.append(field_name)
+
+        if fields:
+            keep = set(fields) | set(expanded)
+            for field_name in list(self.fields):
+                if field_name not in keep:
+                    self.fields.pop(field_name)
+
+    @classmethod
+    def select_related_for(cls, expand, prefix=''):
+        """select_related() paths covering the relations named in `expand`."""
+        related = []
+        for name, subtree in expand.items():
+            if name not in cls.expandable_fields:
+                continue
+            related.append(prefix + name)
+            serializer_class = cls.expandable_fields[name][1]
+            if issubclass(serializer_class, ExpandableFieldsMixin):
+                related += serializer_class.select_related_for(subtree, f'{prefix}{name}__')
+        return related
+
+
+class RegistryRelatedField(serializers.PrimaryKeyRelatedField):
+    """Vaccine/branch id field validated against core.registry instead of a query."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        instance = reference_registry.get(self.get_queryset().model, data)
+        if instance is not None:
+            return instance
+        try:
+            int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        self.fail('does_not_exist', pk_value=data)
+
+
+class RegistryRelationsMixin:
+    """Use RegistryRelatedField for the vaccine and branch foreign keys."""
+
+    def build_relational_field(self, field_name, relation_info):
+        field_class, field_kwargs = super().build_relational_field(field_name, relation_info)
+        if field_class is serializers.PrimaryKeyRelatedField and relation_info.related_model in (Vaccine, Branch):
+            field_class = RegistryRelatedField
+        return field_class, field_kwargs
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -41,36 +133,83 @@ class BranchSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'address', 'postcode', 'phone', 'email', 'opening_hours', 'image_url', 'status_info']
     
     def get_status_info(self, obj):
+        # Branches fetched via Branch.objects.with_status() already carry it
+        if hasattr(obj, 'current_status'):
+            return obj.current_status
         return obj.status_info()
 
 
-class AppointmentSerializer(serializers.ModelSerializer):
-    user_details = UserSerializer(source='user', read_only=True)
-    vaccine_details = VaccineSerializer(source='vaccine', read_only=True)
-    branch_details = BranchSerializer(source='branch', read_only=True)
-    
+class AppointmentSerializer(ExpandableFieldsMixin, RegistryRelationsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        'user': ('user_details', UserSerializer),
+        'vaccine': ('vaccine_details', VaccineSerializer),
+        'branch': ('branch_details', BranchSerializer),
+    }
+
     class Meta:
         model = Appointment
         exclude = ['created_at']  # status removed; return other fields implicitly
 
 
-class AppointmentCreateSerializer(serializers.ModelSerializer):
+class AppointmentCreateSerializer(RegistryRelationsMixin, serializers.ModelSerializer):
     class Meta:
         model = Appointment
         fields = ['user', 'vaccine', 'branch', 'datetime', 'notes']
 
+    def validate(self, attrs):
+        branch = attrs.get('branch', getattr(self.instance, 'branch', None))
+        when = attrs.get('datetime', getattr(self.instance, 'datetime', None))
+        if branch and when:
+            error = slot_error(branch, when, exclude_pk=getattr(self.instance, 'pk', None))
+            if error:
+                raise serializers.ValidationError({'datetime': error})
+        return attrs
+
+    def create(self, validated_data):
+        try:
+            return book_appointment(Appointment(**validated_data))
+        except SlotUnavailable as exc:
+            raise serializers.ValidationError({'datetime': str(exc)})
+
+    def update(self, instance, validated_data):
+        previous_branch, previous_datetime = instance.branch, instance.datetime
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        try:
+            return reschedule_appointment(instance, previous_branch, previous_datetime)
+        except SlotUnavailable as exc:
+            raise serializers.ValidationError({'datetime': str(exc)})
+
+
+class DoseSerializer(ExpandableFieldsMixin, RegistryRelationsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        'user': ('user_details', UserSerializer),
+        'vaccine': ('vaccine_details', VaccineSerializer),
+        'appointment': ('appointment_details', AppointmentSerializer),
+    }
 
-class DoseSerializer(serializers.ModelSerializer):
-    user_details = UserSerializer(source='user', read_only=True)
-    vaccine_details = VaccineSerializer(source='vaccine', read_only=True)
-    appointment_details = AppointmentSerializer(source='appointment', read_only=True)
-    
     class Meta:
         model = Dose
         fields = '__all__'
 
 
-class DoseCreateSerializer(serializers.ModelSerializer):
+class DoseCreateSerializer(RegistryRelationsMixin, serializers.ModelSerializer):
     class Meta:
         model = Dose
         fields = ['vaccine', 'user', 'appointment', 'date_administered', 'dose_number']
+        # Allocated by core.doses.record_dose; any value sent by the client is ignored
+        read_only_fields = ['dose_number']
+
+    def create(self, validated_data):
+        return record_dose(Dose(**validated_data))
+
+    def update(self, instance, validated_data):
+        renumber = any(
+            field in validated_data and validated_data[field] != getattr(instance, field)
+            for field in ('user', 'vaccine')
+        )
+        if not renumber:
+            return super().update(instance, validated_data)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        return record_dose(instance)
@@ -1,14 +1,167 @@
-from django.db.models.signals import post_migrate
+import logging
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import post_migrate, pre_save, post_save, post_delete
 from django.dispatch import receiver
 from .seed import seed_initial
-from .models import Vaccine, Branch
+from .models import Vaccine, Branch, Appointment, Dose, SlotCounter
+from .booking import release_slot
+from .connection_stats import connection_stats
+from .reference_data import bump_version
+from .registry import reference_registry
+from .slots import slot_start_for
+from .status_cache import branch_status_cache
+from .vaccine_schedule import SCHEDULE_FIELDS, rebuild_statuses, refresh_status
+
+logger = logging.getLogger(__name__)
 
 @receiver(post_migrate)
 def seed_after_migrate(sender, **kwargs):
     # Only run when core app migrations finish
     if sender.label != 'core':
         return
+    # Migrations may have rewritten reference data without model signals
+    bump_version()
     # If already have at least one vaccine and one branch, skip
     if Vaccine.objects.exists() and Branch.objects.exists():
         return
     seed_initial(verbose=True)
+
+
+@receiver(request_started)
+def count_request(sender, **kwargs):
+    connection_stats.request_started()
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    connection_stats.connection_opened(connection.alias)
+
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def invalidate_branch_status(sender, instance, **kwargs):
+    branch_status_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Vaccine)
+@receiver(post_delete, sender=Vaccine)
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def bump_reference_version(sender, instance, using=None, **kwargs):
+    # This process reloads straight away (it may be the writer, reading its
+    # own transaction); other processes follow the version bump, which waits
+    # for commit so a client can't cache the new ETag with old data.
+    reference_registry.clear()
+    transaction.on_commit(bump_version, using=using)
+
+
+@receiver(pre_save, sender=Appointment)
+def remember_appointment_slot(sender, instance, raw=False, using=None, **kwargs):
+    # Where an edited appointment was booked, so post_save can move its
+    # reservation when the branch or time changed.
+    instance._slot_before = None
+    if raw or instance._state.adding or instance.pk is None or getattr(instance, '_slot_reserved', False):
+        return
+    instance._slot_before = Appointment.objects.using(using).filter(pk=instance.pk).values_list(
+        'branch_id', 'datetime').first()
+
+
+def _count_into_slot(branch, when, using):
+    slot_start = slot_start_for(branch, when)
+    if slot_start is not None:
+        SlotCounter.objects.using(using).filter(
+            branch_id=branch.pk, slot_start=slot_start,
+        ).update(booked=F('booked') + 1)
+
+
+@receiver(post_save, sender=Appointment)
+def count_unreserved_appointment(sender, instance, created, raw=False, using=None, **kwargs):
+    # Appointments created or moved outside core.booking (admin, fixtures,
+    # shell) still take up capacity once a counter exists for their slot.
+    # core.booking has already moved the counters; the flag covers one save.
+    reserved = instance.__dict__.pop('_slot_reserved', False)
+    if raw or reserved:
+        return
+    if created:
+        _count_into_slot(instance.branch, instance.datetime, using)
+        return
+    before = getattr(instance, '_slot_before', None)
+    if before is None:
+        return
+    branch_id, when = before
+    if branch_id == instance.branch_id:
+        previous_branch = instance.branch
+        if slot_start_for(previous_branch, when) == slot_start_for(instance.branch, instance.datetime):
+            return
+    else:
+        previous_branch = Branch.objects.using(using).filter(pk=branch_id).first()
+    if previous_branch is not None:
+        release_slot(previous_branch, when, using=using)
+    _count_into_slot(instance.branch, instance.datetime, using)
+
+
+@receiver(post_delete, sender=Appointment)
+def release_appointment_slot(sender, instance, using=None, **kwargs):
+    try:
+        branch = instance.branch
+    except Branch.DoesNotExist:
+        return
+    release_slot(branch, instance.datetime, using=using)
+
+
+@receiver(pre_save, sender=Dose)
+@receiver(pre_save, sender=Vaccine)
+def remember_schedule_inputs(sender, instance, raw=False, using=None, **kwargs):
+    # Note what the row looked like before an update so post_save can tell
+    # which UserVaccineStatus rows it affects.
+    instance._schedule_before = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    fields = ('user_id', 'vaccine_id') if sender is Dose else SCHEDULE_FIELDS
+    instance._schedule_before = sender.objects.using(using).filter(pk=instance.pk).values_list(*fields).first()
+
+
+@receiver(post_save, sender=Dose)
+def refresh_dose_status(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    refresh_status(instance.user_id, instance.vaccine_id, using=using)
+    before = getattr(instance, '_schedule_before', None)
+    if before and before != (instance.user_id, instance.vaccine_id):
+        refresh_status(*before, using=using)
+
+
+@receiver(post_delete, sender=Dose)
+def refresh_deleted_dose_status(sender, instance, using=None, **kwargs):
+    refresh_status(instance.user_id, instance.vaccine_id, using=using)
+
+
+def _schedule_inputs(vaccine):
+    # Normalised, so a form posting "5" for a stored 5.0 doesn't count as a change
+    return tuple(Vaccine._meta.get_field(f).to_python(getattr(vaccine, f)) for f in SCHEDULE_FIELDS)
+
+
+def _rebuild_after_edit(vaccine, using):
+    doses = Dose.objects.using(using).filter(vaccine=vaccine).count()
+    if doses > settings.VACCINE_REBUILD_INLINE_MAX_DOSES:
+        logger.warning(
+            "%s has %d doses; not rebuilding its statuses in the request. "
+            "Run: manage.py rebuild_vaccine_status --vaccine %d", vaccine, doses, vaccine.pk,
+        )
+        return
+    rebuild_statuses(vaccine=vaccine)
+
+
+@receiver(post_save, sender=Vaccine)
+def rebuild_vaccine_statuses(sender, instance, created, raw=False, using=None, **kwargs):
+    before = getattr(instance, '_schedule_before', None)
+    if created or raw or before is None:
+        return
+    if before != _schedule_inputs(instance):
+        # After commit, so the chunked rebuild runs in its own short
+        # transactions instead of holding the admin's write lock throughout.
+        transaction.on_commit(lambda: _rebuild_after_edit(instance, using), using=using)
@@ -0,0 +1,140 @@
+"""
+Server-side appointment slot engine.
+
+Expands a branch's compiled opening hours into fixed-length slots and counts
+existing appointments against each branch's per-slot capacity. The browser
+still draws the time buttons, but bookings are validated here.
+"""
+from bisect import bisect_right
+from collections import Counter
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.utils import timezone
+from .models import Appointment
+
+SLOT_MINUTES = getattr(settings, 'APPOINTMENT_SLOT_MINUTES', 30)
+DEFAULT_RANGE_DAYS = 7
+MAX_RANGE_DAYS = 62
+
+
+class Slot:
+    __slots__ = ('start', 'capacity', 'booked')
+
+    def __init__(self, start, capacity, booked=0):
+        self.start = start
+        self.capacity = capacity
+        self.booked = booked
+
+    @property
+    def end(self):
+        return self.start + timedelta(minutes=SLOT_MINUTES)
+
+    @property
+    def remaining(self):
+        return max(self.capacity - self.booked, 0)
+
+    def as_dict(self):
+        return {
+            'start': self.start.isoformat(),
+            'end': self.end.isoformat(),
+            'capacity': self.capacity,
+            'remaining': self.remaining,
+        }
+
+
+def _localize(when):
+    if not settings.USE_TZ:
+        return when
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return timezone.localtime(when)
+
+
+def _local_midnight(day):
+    dt = datetime.combine(day, time.min)
+    return timezone.make_aware(dt) if settings.USE_TZ else dt
+
+
+def slot_starts(branch, start_date, end_date):
+    """
+    All slot start datetimes from start_date to end_date inclusive.
+    Overnight windows spill into the next date, so the day before the range
+    is expanded too and anything outside the range is dropped.
+    """
+    schedule = branch.schedule
+    range_start = _local_midnight(start_date)
+    range_end = _local_midnight(end_date + timedelta(days=1))
+    starts = set()
+    day = start_date - timedelta(days=1)
+    while day <= end_date:
+        midnight = _local_midnight(day)
+        for open_min, close_min in schedule.day_windows[day.weekday()]:
+            for minute in range(open_min, close_min, SLOT_MINUTES):
+                start = midnight + timedelta(minutes=minute)
+                if range_start <= start < range_end:
+                    starts.add(start)
+        day += timedelta(days=1)
+    return sorted(starts)
+
+
+def slot_start_for(branch, when):
+    """
+    The slot containing `when`, or None if the branch is closed then.
+    Branches without any parsable hours accept any time, bucketed on the
+    slot grid from midnight.
+    """
+    when = _localize(when)
+    if not branch.schedule.has_hours:
+        midnight = when.replace(hour=0, minute=0, second=0, microsecond=0)
+        offset = (when - midnight) // timedelta(minutes=SLOT_MINUTES)
+        return midnight + timedelta(minutes=offset * SLOT_MINUTES)
+    for start in slot_starts(branch, when.date(), when.date()):
+        if start <= when < start + timedelta(minutes=SLOT_MINUTES):
+            return start
+    return None
+
+
+def booked_counts(branch, starts, exclude_pk=None, using=None):
+    """
+    Appointments per slot start for one branch, fetched with a single query
+    over the (branch, datetime) index. `starts` must be sorted.
+    """
+    if not starts:
+        return Counter()
+    step = timedelta(minutes=SLOT_MINUTES)
+    qs = Appointment.objects.using(using).filter(branch=branch, datetime__gte=starts[0], datetime__lt=starts[-1] + step)
+    if exclude_pk is not None:
+        qs = qs.exclude(pk=exclude_pk)
+    counts = Counter()
+    for dt in qs.order_by().values_list('datetime', flat=True):
+        i = bisect_right(starts, dt) - 1
+        if i >= 0 and dt < starts[i] + step:
+            counts[starts[i]] += 1
+    return counts
+
+
+def available_slots(branch, start_date, end_date, now=None):
+    """
+    Slots for a branch over a date range with their remaining capacity.
+    Slots that have already started are left out.
+    """
+    starts = slot_starts(branch, start_date, end_date)
+    if now is None:
+        now = timezone.now()
+    starts = [s for s in starts if s >= now]
+    counts = booked_counts(branch, starts)
+    return [Slot(s, branch.slot_capacity, counts.get(s, 0)) for s in starts]
+
+
+def slot_error(branch, when, exclude_pk=None):
+    """
+    Return a validation message if an appointment at `when` cannot be booked
+    at `branch`, or None if it fits. exclude_pk skips the appointment being edited.
+    """
+    start = slot_start_for(branch, when)
+    if start is None:
+        return "The branch is closed at the selected time."
+    booked = booked_counts(branch, [start], exclude_pk=exclude_pk)[start]
+    if booked >= branch.slot_capacity:
+        return "This time slot is fully booked. Please choose another time."
+    return None
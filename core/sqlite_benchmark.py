@@ -0,0 +1,196 @@
+"""
+Threaded mixed read/write benchmark for the SQLite connection profiles.
+
+Each profile runs against its own copy of the database: worker threads
+repeatedly either read a user's appointments and doses (as the home page
+does) or record a dose through core.doses.record_dose, the same write path
+as the dose form. Throughput, lock errors and latency percentiles are
+reported per profile. Worker threads connect through Django with the
+profile's OPTIONS; the caller's own connection is left alone.
+"""
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from config.database import SQLITE_PROFILES, sqlite_options
+from .doses import record_dose
+from .models import Vaccine, Appointment, Dose
+
+DEFAULT_THREADS = 8
+DEFAULT_SECONDS = 5.0
+DEFAULT_WRITE_RATIO = 0.2
+DEFAULT_USERS = 200
+
+
+class BenchResult(namedtuple('BenchResult', 'profile threads seconds reads writes errors read_latencies write_latencies')):
+
+    @property
+    def reads_per_second(self):
+        return self.reads / self.seconds if self.seconds else 0.0
+
+    @property
+    def writes_per_second(self):
+        return self.writes / self.seconds if self.seconds else 0.0
+
+    @staticmethod
+    def _percentile(values, pct):
+        if not values:
+            return None
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+    def as_dict(self):
+        return {
+            'profile': self.profile,
+            'threads': self.threads,
+            'seconds': round(self.seconds, 2),
+            'reads': self.reads,
+            'writes': self.writes,
+            'errors': self.errors,
+            'reads_per_second': round(self.reads_per_second, 1),
+            'writes_per_second': round(self.writes_per_second, 1),
+            'read_p95_ms': self._percentile(self.read_latencies, 95),
+            'write_p95_ms': self._percentile(self.write_latencies, 95),
+        }
+
+
+def _closing(fn, *args):
+    # Each thread opens its own connections; close them before it exits
+    try:
+        return fn(*args)
+    finally:
+        connections.close_all()
+
+
+def _run_in_thread(fn, *args):
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(value=_closing(fn, *args)))
+    thread.start()
+    thread.join()
+    return result.get('value')
+
+
+@contextmanager
+def _database(path, options):
+    """Point new connections for the default alias (other threads) at `path`."""
+    saved = connections.settings[DEFAULT_DB_ALIAS]
+    # A new dict, so the calling thread's existing connection keeps its settings
+    connections.settings[DEFAULT_DB_ALIAS] = {**saved, 'NAME': str(path), 'OPTIONS': options}
+    try:
+        yield
+    finally:
+        connections.settings[DEFAULT_DB_ALIAS] = saved
+
+
+def copy_database(target, source=None):
+    """Copy the default database (or the SQLite file `source`) to `target`."""
+    target = sqlite3.connect(target)
+    try:
+        if source is not None:
+            src = sqlite3.connect(source)
+            src.backup(target)
+            src.close()
+        else:
+            connection = connections[DEFAULT_DB_ALIAS]
+            connection.ensure_connection()
+            connection.connection.backup(target)
+        # Start every profile from a rollback journal; WAL persists in the file
+        target.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        target.close()
+
+
+def _prepare(users):
+    # The copy is disposable: bring it up to date and make sure there is load to spread
+    call_command('migrate', verbosity=0)
+    User = get_user_model()
+    missing = users - User.objects.count()
+    if missing > 0:
+        password = make_password(None)
+        User.objects.bulk_create(
+            [User(username=f'bench-{i}', password=password) for i in range(missing)],
+            ignore_conflicts=True,
+        )
+    user_ids = list(User.objects.order_by('id').values_list('id', flat=True)[:users])
+    vaccine_ids = list(Vaccine.objects.values_list('id', flat=True))
+    return user_ids, vaccine_ids
+
+
+def _worker(deadline, user_ids, vaccine_ids, write_ratio, seed, stats, lock):
+    rng = random.Random(seed)
+    reads, writes, errors, read_times, write_times = 0, 0, 0, [], []
+    today = date.today()
+    while time.perf_counter() < deadline:
+        user_id = rng.choice(user_ids)
+        write = rng.random() < write_ratio
+        started = time.perf_counter()
+        try:
+            if write:
+                record_dose(Dose(user_id=user_id, vaccine_id=rng.choice(vaccine_ids), date_administered=today))
+            else:
+                list(Appointment.objects.select_related('vaccine', 'branch').filter(user_id=user_id)[:20])
+                list(Dose.objects.select_related('vaccine').filter(user_id=user_id).order_by('-date_administered')[:5])
+        except OperationalError:
+            errors += 1
+            continue
+        elapsed = time.perf_counter() - started
+        if write:
+            writes += 1
+            write_times.append(elapsed)
+        else:
+            reads += 1
+            read_times.append(elapsed)
+    with lock:
+        stats['reads'] += reads
+        stats['writes'] += writes
+        stats['errors'] += errors
+        stats['read_latencies'] += read_times
+        stats['write_latencies'] += write_times
+
+
+def run_profile(profile, path, threads=DEFAULT_THREADS, seconds=DEFAULT_SECONDS,
+                write_ratio=DEFAULT_WRITE_RATIO, users=DEFAULT_USERS, seed=0):
+    """Benchmark one profile against the SQLite file at `path` (modified in place)."""
+    with _database(path, sqlite_options(profile)):
+        user_ids, vaccine_ids = _run_in_thread(_prepare, users)
+        if not user_ids or not vaccine_ids:
+            raise ValueError("The benchmark needs at least one user and one vaccine")
+        stats = {'reads': 0, 'writes': 0, 'errors': 0, 'read_latencies': [], 'write_latencies': []}
+        lock = threading.Lock()
+        started = time.perf_counter()
+        deadline = started + seconds
+
+        def work(n):
+            _worker(deadline, user_ids, vaccine_ids, write_ratio, seed + n, stats, lock)
+        workers = [threading.Thread(target=_closing, args=(work, n)) for n in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+    return BenchResult(profile, threads, elapsed, stats['reads'], stats['writes'], stats['errors'],
+                       stats['read_latencies'], stats['write_latencies'])
+
+
+def compare_profiles(profiles=SQLITE_PROFILES, source=None, **options):
+    """Run each profile on a fresh copy of the database; returns BenchResults."""
+    results = []
+    workdir = Path(tempfile.mkdtemp(prefix='sqlite-bench-'))
+    try:
+        for profile in profiles:
+            path = workdir / f'{profile}.db'
+            copy_database(str(path), source)
+            results.append(run_profile(profile, path, **options))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
@@ -0,0 +1,97 @@
+"""
+Per-process cache of branch open/closed status.
+
+A branch's status only changes at a handful of instants a week (opening, one
+hour before closing, closing), so each cached result is kept until the next of
+those instants for that branch. Entries are also dropped when a branch is
+saved or deleted (see core.signals).
+"""
+from datetime import timedelta
+from .request_timing import record_cache_lookup
+from .schedule import minute_of_week, statuses_at
+
+# Upper bound for schedules whose status never changes (24/7, unparsable hours)
+MAX_TTL = timedelta(days=1)
+
+
+def _copy(status):
+    return dict(status) if status is not None else None
+
+
+class BranchStatusCache:
+    """
+    Maps branch pk -> (schedule, valid_from, expires_at, status), with the
+    validity window stored as POSIX timestamps.
+
+    A lookup is a hit when the branch still has the same compiled schedule and
+    the reference time falls inside the cached validity window. Counters are
+    best-effort under concurrent requests.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, branch, now):
+        """Status for one branch at `now`, computing and caching it on a miss."""
+        return self.get_many([branch], now)[0]
+
+    def get_many(self, branches, now):
+        """
+        Statuses for many branches at `now`. Misses are evaluated together so
+        branches sharing a schedule are only computed once.
+        """
+        ts = now.timestamp()
+        results = [None] * len(branches)
+        missing = []
+        for i, branch in enumerate(branches):
+            entry = self._entries.get(branch.pk) if branch.pk is not None else None
+            if entry is not None and entry[0] is branch.schedule and entry[1] <= ts < entry[2]:
+                results[i] = _copy(entry[3])
+            else:
+                missing.append(i)
+        self.hits += len(branches) - len(missing)
+        self.misses += len(missing)
+        record_cache_lookup(len(branches) - len(missing), len(missing))
+        if missing:
+            minute = minute_of_week(now)
+            computed = statuses_at([branches[i].schedule for i in missing], now)
+            for i, status in zip(missing, computed):
+                self._store(branches[i], ts, minute, status)
+                results[i] = status
+        return results
+
+    def _store(self, branch, ts, minute, status):
+        """Cache a status computed at `ts` until the branch's next transition."""
+        if branch.pk is None:
+            return
+        schedule = branch.schedule
+        delta = schedule.minutes_until_change(minute)
+        ttl = MAX_TTL if delta is None else min(timedelta(minutes=delta), MAX_TTL)
+        self._entries[branch.pk] = (schedule, ts, ts + ttl.total_seconds(), _copy(status))
+
+    def invalidate(self, pk=None):
+        """Drop one branch (or everything when pk is None)."""
+        if pk is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(pk, None)
+        self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'size': len(self._entries),
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+        }
+
+    def reset_stats(self):
+        self.hits = self.misses = self.invalidations = 0
+
+
+branch_status_cache = BranchStatusCache()
@@ -0,0 +1,252 @@
+"""
+Deterministic synthetic data for benchmarks and load testing.
+
+Everything is drawn from a random.Random the caller seeds, and dates are
+laid out around a fixed "today" (DEFAULT_TODAY unless given), so the same
+seed always gives the same rows, whatever day the generator runs. Opening hours follow the shapes real branches
+use: high-street weekday hours with shorter weekends, pharmacies open late,
+24/7 sites, overnight clinics that close after midnight, and part-week
+clinics (including ranges such as Sun-Thu).
+
+LoadGenerator builds a production-sized database (`manage.py
+generate_load_data`). Each user has a home branch and a vaccination history
+that follows the vaccines' real schedules (core.vaccine_schedule): a
+primary series a few weeks apart, then boosters or recurring doses at
+their intervals. Each past dose has an appointment in an open slot at the
+branch, except a share of walk-ins that have no appointment. A next dose
+that falls due in the coming weeks is booked as a future appointment.
+
+Rows get explicit ids and are written with bulk_create, one transaction
+per chunk of users. Users get an unusable password, so no password hashing
+is done. Signals don't fire, so afterwards the generator resets the id
+sequences, issues a new reference-data version and can rebuild
+UserVaccineStatus. SlotCounter rows are seeded lazily by the booking
+service as usual.
+"""
+import random
+import time as clock
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from .models import Appointment, Branch, Dose
+from .reference_data import bump_version
+from .registry import reference_registry
+from .schedule import MINUTES_PER_DAY
+from .slots import SLOT_MINUTES
+from .vaccine_schedule import PRIMARY_DOSE_INTERVAL_DAYS, load_rules, rebuild_statuses
+
+OPENING_HOURS_PATTERNS = [
+    # (weight, opening_hours)
+    (30, [{"days": "Mon-Fri", "open": "09:00", "close": "17:30"},
+          {"days": "Sat", "open": "09:00", "close": "13:00"}]),
+    (20, [{"days": "Mon-Fri", "open": "08:00", "close": "20:00"},
+          {"days": "Sat-Sun", "open": "10:00", "close": "16:00"}]),
+    (15, [{"days": "Mon-Fri", "open": "08:30", "close": "18:30"}]),
+    (10, [{"days": "Mon-Sat", "open": "07:00", "close": "22:00"},
+          {"days": "Sun", "open": "10:00", "close": "16:00"}]),
+    (8, [{"days": "Mon-Sun", "open": "00:00", "close": "23:59"}]),
+    (7, [{"days": "Sun-Thu", "open": "09:00", "close": "18:00"}]),
+    (5, [{"days": "Mon-Sun", "open": "22:00", "close": "06:00"}]),
+    (5, [{"days": "Tue", "open": "09:00", "close": "12:00"},
+         {"days": "Thu", "open": "14:00", "close": "19:00"},
+         {"days": "Sat", "open": "09:00", "close": "12:00"}]),
+]
+
+TOWNS = ["Ashford", "Bexley", "Carlton", "Dunmore", "Elmstead", "Fairhaven", "Greyford", "Holloway",
+         "Ivybridge", "Kingsmere", "Larkhill", "Millbrook", "Northwold", "Oakham", "Penrith", "Redcliffe"]
+STREETS = ["High Street", "Station Road", "Church Lane", "Market Square", "Mill Road", "Park Avenue"]
+
+
+def opening_hours(rng):
+    """A copy of one weighted opening-hours pattern."""
+    hours = rng.choices([p[1] for p in OPENING_HOURS_PATTERNS], weights=[p[0] for p in OPENING_HOURS_PATTERNS])[0]
+    return [dict(period) for period in hours]
+
+
+def make_branches(rng, count, start=0):
+    """`count` unsaved branches, numbered from `start` so names stay unique."""
+    branches = []
+    for n in range(start, start + count):
+        town = rng.choice(TOWNS)
+        branches.append(Branch(
+            name=f"{town} Vaccination Centre {n}",
+            address=f"{rng.randint(1, 250)} {rng.choice(STREETS)}, {town}",
+            postcode=f"{town[:2].upper()}{rng.randint(1, 99)} {rng.randint(1, 9)}{rng.choice('ABDEFGHJLNPQRSTUWXYZ')}{rng.choice('ABDEFGHJLNPQRSTUWXYZ')}",
+            phone=f"0{rng.randint(1000, 1999)} {rng.randint(100000, 999999)}",
+            email=f"branch{n}@example.org",
+            opening_hours=opening_hours(rng),
+            slot_capacity=rng.choice([2, 4, 4, 6, 8]),
+        ))
+    return branches
+
+
+FIRST_NAMES = ["Alex", "Sam", "Jordan", "Taylor", "Morgan", "Casey", "Riley", "Jamie", "Robin", "Avery",
+               "Priya", "Mohammed", "Olivia", "Noah", "Amelia", "Oliver", "Isla", "George", "Ava", "Leo"]
+LAST_NAMES = ["Smith", "Jones", "Taylor", "Brown", "Williams", "Wilson", "Johnson", "Davies", "Patel", "Khan",
+              "Robinson", "Wright", "Thompson", "Evans", "Walker", "White", "Roberts", "Green", "Hall", "Wood"]
+
+DEFAULT_USERS = 1_000_000
+DEFAULT_BRANCHES = 10_000
+DEFAULT_APPOINTMENTS = 20_000_000
+DEFAULT_HISTORY_YEARS = 5
+DEFAULT_CHUNK_USERS = 5000
+DEFAULT_BATCH_SIZE = 2000
+DEFAULT_TODAY = date(2025, 1, 1)  # histories end and bookings start here
+
+HOME_BRANCH_SHARE = 0.8  # appointments at the user's usual branch
+WALK_IN_SHARE = 0.1  # past doses given without an appointment
+BOOK_AHEAD_DAYS = 60  # a dose due this soon is already booked
+DOSE_DELAY_DAYS = 14  # how late after its due date a dose may be given
+
+LoadStats = namedtuple('LoadStats', 'users branches appointments doses statuses seconds')
+
+
+def _next_id(model):
+    # From the primary: a lagging replica could hand out ids already taken
+    return (model.objects.using(DEFAULT_DB_ALIAS).aggregate(m=Max('pk'))['m'] or 0) + 1
+
+
+def _slot_minutes(branch):
+    """Bookable slot offsets from midnight, per weekday."""
+    return tuple(
+        tuple(minute for start, end in windows for minute in range(start, end, SLOT_MINUTES))
+        for windows in branch.schedule.day_windows
+    )
+
+
+class LoadGenerator:
+
+    def __init__(self, users=DEFAULT_USERS, branches=DEFAULT_BRANCHES, appointments=DEFAULT_APPOINTMENTS,
+                 seed=0, history_years=DEFAULT_HISTORY_YEARS, chunk_users=DEFAULT_CHUNK_USERS,
+                 batch_size=DEFAULT_BATCH_SIZE, today=DEFAULT_TODAY):
+        self.users = users
+        self.branches = branches
+        self.appointments = appointments
+        self.rng = random.Random(seed)
+        self.history_days = round(history_years * 365.25)
+        self.chunk_users = chunk_users
+        self.batch_size = batch_size
+        self.today = today
+        self.tz = timezone.get_current_timezone()
+        self.password = make_password(None)
+
+    def run(self, progress=None, statuses=True):
+        """Generate everything; `progress(stats)` is called after each chunk."""
+        started = clock.perf_counter()
+        self.rules = list(load_rules().values())
+        if not self.rules:
+            raise ValueError("No vaccines to vaccinate with; run migrate (which seeds them) first")
+        branch_ids, slot_tables = self._create_branches()
+        if not branch_ids:
+            raise ValueError("No branches to book at")
+        self.branch_ids, self.slot_tables = branch_ids, slot_tables
+
+        User = get_user_model()
+        user_id = _next_id(User)
+        self.appointment_id = _next_id(Appointment)
+        self.dose_id = _next_id(Dose)
+        per_user = self.appointments / self.users if self.users else 0
+        counts = {'users': 0, 'appointments': 0, 'doses': 0}
+        while counts['users'] < self.users:
+            size = min(self.chunk_users, self.users - counts['users'])
+            users, appointments, doses = [], [], []
+            for uid in range(user_id, user_id + size):
+                users.append(self._user(User, uid))
+                self._history(uid, round(self.rng.uniform(0, 2 * per_user)), appointments, doses)
+            with transaction.atomic():
+                User.objects.bulk_create(users, batch_size=self.batch_size)
+                Appointment.objects.bulk_create(appointments, batch_size=self.batch_size)
+                Dose.objects.bulk_create(doses, batch_size=self.batch_size)
+            user_id += size
+            counts['users'] += size
+            counts['appointments'] += len(appointments)
+            counts['doses'] += len(doses)
+            if progress:
+                progress(LoadStats(counts['users'], len(branch_ids), counts['appointments'], counts['doses'],
+                                   None, clock.perf_counter() - started))
+
+        self._reset_sequences([User, Branch, Appointment, Dose])
+        written = rebuild_statuses() if statuses else None
+        return LoadStats(counts['users'], len(branch_ids), counts['appointments'], counts['doses'], written,
+                         clock.perf_counter() - started)
+
+    def _create_branches(self):
+        if self.branches:
+            first = _next_id(Branch)
+            created = make_branches(self.rng, self.branches, start=first)
+            for pk, branch in enumerate(created, first):
+                branch.pk = pk
+            Branch.objects.bulk_create(created, batch_size=self.batch_size)
+            # bulk_create sends no signals; announce the new reference data ourselves
+            reference_registry.clear()
+            bump_version()
+        else:
+            created = list(Branch.objects.using(DEFAULT_DB_ALIAS).order_by('pk'))
+        return [b.pk for b in created], [_slot_minutes(b) for b in created]
+
+    def _user(self, User, uid):
+        first, last = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+        joined = self.today - timedelta(days=self.rng.randint(0, self.history_days))
+        return User(
+            id=uid, username=f'load{uid}', email=f'load{uid}@example.org', first_name=first, last_name=last,
+            password=self.password, date_joined=timezone.make_aware(datetime.combine(joined, time(9)), self.tz),
+        )
+
+    def _slot(self, branch_index, day):
+        """(start, local date) of an open slot at the branch on `day`, or the next day it opens."""
+        table = self.slot_tables[branch_index]
+        for offset in range(7):
+            candidate = day + timedelta(days=offset)
+            minutes = table[candidate.weekday()]
+            if minutes:
+                minute = self.rng.choice(minutes)
+                # Overnight windows run past midnight into the next date
+                candidate += timedelta(days=minute // MINUTES_PER_DAY)
+                start = datetime.combine(candidate, time(*divmod(minute % MINUTES_PER_DAY, 60)))
+                return timezone.make_aware(start, self.tz), candidate
+        # No usable hours at all; booking doesn't restrict such branches either
+        return timezone.make_aware(datetime.combine(day, time(9)), self.tz), day
+
+    def _history(self, uid, budget, appointments, doses):
+        rng = self.rng
+        home = rng.randrange(len(self.branch_ids))
+        horizon = self.today + timedelta(days=BOOK_AHEAD_DAYS)
+        for rule in rng.sample(self.rules, len(self.rules)):
+            if budget <= 0:
+                return
+            day = self.today - timedelta(days=rng.randint(0, self.history_days))
+            number = 0
+            while budget > 0 and day <= horizon:
+                branch = home if rng.random() < HOME_BRANCH_SHARE else rng.randrange(len(self.branch_ids))
+                appointment_id = None
+                if day > self.today or rng.random() >= WALK_IN_SHARE:
+                    when, day = self._slot(branch, day)
+                    appointment_id = self.appointment_id
+                    self.appointment_id += 1
+                    appointments.append(Appointment(id=appointment_id, user_id=uid, vaccine_id=rule.vaccine_id,
+                                                    branch_id=self.branch_ids[branch], datetime=when))
+                    budget -= 1
+                # The slot may be on a later day than the one the dose fell due
+                if day > self.today:
+                    break  # booked, not yet given
+                number += 1
+                doses.append(Dose(id=self.dose_id, user_id=uid, vaccine_id=rule.vaccine_id,
+                                  appointment_id=appointment_id, dose_number=number, date_administered=day))
+                self.dose_id += 1
+                interval = PRIMARY_DOSE_INTERVAL_DAYS if number < rule.series_doses else rule.repeat_days
+                if interval is None:
+                    break  # schedule complete
+                day += timedelta(days=interval + rng.randint(0, DOSE_DELAY_DAYS))
+
+    def _reset_sequences(self, models):
+        connection = connections[DEFAULT_DB_ALIAS]
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
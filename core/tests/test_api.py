@@ -3,6 +3,8 @@ Tests for REST API endpoints in the core app
 """
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework.test import APIClient
@@ -27,6 +29,23 @@ class APIHealthTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('status', response.data)
 
+    def test_health_check_reveals_nothing_anonymously(self):
+        """Test the public check is a bare liveness probe"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.data, {'status': 'ok'})
+
+    def test_details_staff_only(self):
+        """Test cache and connection counters need a staff login"""
+        url = reverse('api_health_details')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(User.objects.create_user('member'))
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(User.objects.create_user('ops', is_staff=True))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('connections', response.data)
+        self.assertIn('branch_status', response.data['caches'])
+
 
 class VaccineViewSetTest(TestCase):
     """Test the Vaccine API endpoints"""
@@ -436,3 +455,218 @@ class APIFilteringAndPaginationTest(TestCase):
             self.assertIn('results', response.data)
         else:
             self.assertIsInstance(response.data, list)
+
+    def test_appointment_cursor_pagination_walks_all_rows(self):
+        """Test that following cursor links visits every appointment once, newest first"""
+        for i in range(15, 45):
+            Appointment.objects.create(
+                user=self.user,
+                vaccine=self.vaccine,
+                branch=self.branch,
+                datetime=timezone.now() + timedelta(days=i)
+            )
+        self.client.force_authenticate(user=self.user)
+        url = reverse('appointment-list')
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertNotIn('count', response.data)
+            seen.extend(a['datetime'] for a in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(seen), 45)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def walk(self, url, key='next'):
+        """Follow `key` links; returns the ids in walking order and the final response."""
+        ids, response = [], None
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            page = [row['id'] for row in response.data['results']]
+            ids.extend(page if key == 'next' else reversed(page))
+            url = response.data[key]
+        return ids, response
+
+    def test_dose_cursor_pagination_walks_rows_sharing_a_date(self):
+        """Test that more rows on one date than DRF's offset cutoff are all reached, in id order"""
+        staff = User.objects.create_user(username='staff', password='x', is_staff=True)
+        day = timezone.localdate() - timedelta(days=30)
+        Dose.objects.bulk_create([
+            Dose(user=self.user, vaccine=self.vaccine, date_administered=day, dose_number=n) for n in range(1, 1101)
+        ] + [
+            Dose(user=staff, vaccine=self.vaccine, date_administered=day - timedelta(days=n), dose_number=n)
+            for n in range(1, 11)
+        ])
+        expected = list(Dose.objects.order_by('-date_administered', '-id').values_list('id', flat=True))
+        self.client.force_authenticate(user=staff)
+        forwards, last = self.walk(reverse('dose-list'))
+        self.assertEqual(forwards, expected)
+        # previous links from the last page lead back over the same rows
+        backwards, _ = self.walk(last.data['previous'], 'previous')
+        self.assertEqual(backwards, expected[:-len(last.data['results'])][::-1])
+
+    def test_appointment_cursor_pagination_walks_rows_sharing_a_slot(self):
+        """Test that appointments in the same slot are paged by id"""
+        when = timezone.now().replace(microsecond=0) + timedelta(days=3)
+        Appointment.objects.bulk_create([
+            Appointment(user=self.user, vaccine=self.vaccine, branch=self.branch, datetime=when) for _ in range(50)
+        ])
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.walk(reverse('appointment-list'))[0],
+                         list(Appointment.objects.order_by('-datetime', '-id').values_list('id', flat=True)))
+
+    def test_malformed_cursor_is_404(self):
+        """Test that a cursor that doesn't decode to the ordering is rejected"""
+        self.client.force_authenticate(user=self.user)
+        for cursor in ('not-base64!', 'cD0x', 'cD1ub3QtYS1kYXRlJnA9MQ=='):
+            response = self.client.get(reverse('dose-list'), {'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, cursor)
+
+    def test_reference_tables_keep_page_numbers(self):
+        """Test that vaccines still use page-number pagination"""
+        response = self.client.get(reverse('vaccine-list'), {'page': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('count', response.data)
+
+
+class APIQueryBudgetTest(TestCase):
+    """Test that list endpoints run a constant number of queries"""
+
+    # One joined SELECT for the page (cursor pagination runs no COUNT)
+    LIST_QUERIES = 1
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.vaccine = Vaccine.objects.create(name="Budget Vaccine", price_per_dose=20.00)
+        self.branches = [
+            Branch.objects.create(
+                name=f"Budget Branch {i}",
+                address="123 Test St",
+                postcode="12345",
+                phone="123-456-7890",
+                email="test@branch.com",
+                opening_hours=[{"days": "Mon-Fri", "open": "09:00", "close": "17:00"}],
+            )
+            for i in range(3)
+        ]
+
+    def add_doses(self, count):
+        start = Dose.objects.filter(user=self.user).count()
+        for i in range(start, start + count):
+            appointment = Appointment.objects.create(
+                user=self.user,
+                vaccine=self.vaccine,
+                branch=self.branches[i % 3],
+                datetime=timezone.now() - timedelta(days=i + 1),
+            )
+            Dose.objects.create(
+                user=self.user,
+                vaccine=self.vaccine,
+                appointment=appointment,
+                date_administered=appointment.datetime.date(),
+                dose_number=i + 1,
+            )
+
+    def assert_constant(self, url_name, expand):
+        self.add_doses(2)
+        with self.assertNumQueries(self.LIST_QUERIES):
+            small = self.client.get(reverse(url_name), {'expand': expand})
+        self.add_doses(18)
+        with self.assertNumQueries(self.LIST_QUERIES):
+            full = self.client.get(reverse(url_name), {'expand': expand})
+        self.assertEqual(len(small.data['results']), 2)
+        self.assertEqual(len(full.data['results']), 20)
+        return full.data['results']
+
+    def test_appointment_list_query_budget(self):
+        """Test that nested user/vaccine/branch details don't add queries per row"""
+        results = self.assert_constant('appointment-list', 'user,vaccine,branch')
+        self.assertIn('text', results[0]['branch_details']['status_info'])
+
+    def test_dose_list_query_budget(self):
+        """Test that nested appointment details don't add queries per row"""
+        results = self.assert_constant('dose-list', 'user,vaccine,appointment.user,appointment.branch')
+        self.assertEqual(results[0]['appointment_details']['user_details']['username'], 'testuser')
+        self.assertIn('text', results[0]['appointment_details']['branch_details']['status_info'])
+
+    def test_unexpanded_list_query_budget(self):
+        """Test that the default (unexpanded) dose list joins nothing"""
+        self.add_doses(5)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dose-list'))
+        self.assertEqual(len(queries), self.LIST_QUERIES)
+        self.assertNotIn('JOIN', queries[0]['sql'])
+        self.assertNotIn('appointment_details', response.data['results'][0])
+
+
+class APIFieldSelectionTest(TestCase):
+    """Test ?fields= and ?expand= on the appointment and dose endpoints"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.vaccine = Vaccine.objects.create(name="Field Vaccine", price_per_dose=20.00)
+        self.branch = Branch.objects.create(
+            name="Field Branch",
+            address="123 Test St",
+            postcode="12345",
+            phone="123-456-7890",
+            email="test@branch.com"
+        )
+        self.appointment = Appointment.objects.create(
+            user=self.user,
+            vaccine=self.vaccine,
+            branch=self.branch,
+            datetime=timezone.now() - timedelta(days=1)
+        )
+        Dose.objects.create(
+            user=self.user,
+            vaccine=self.vaccine,
+            appointment=self.appointment,
+            date_administered=timezone.now().date(),
+            dose_number=1
+        )
+
+    def first(self, url_name, **params):
+        response = self.client.get(reverse(url_name), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['results'][0]
+
+    def test_nested_objects_are_opt_in(self):
+        """Test that related objects are ids unless expanded"""
+        appointment = self.first('appointment-list')
+        self.assertEqual(appointment['branch'], self.branch.id)
+        self.assertNotIn('branch_details', appointment)
+        self.assertNotIn('user_details', appointment)
+
+    def test_expand(self):
+        """Test that ?expand= embeds the named relations only"""
+        appointment = self.first('appointment-list', expand='branch')
+        self.assertEqual(appointment['branch_details']['name'], "Field Branch")
+        self.assertNotIn('vaccine_details', appointment)
+
+    def test_dotted_expand(self):
+        """Test that dotted paths expand relations of nested objects"""
+        dose = self.first('dose-list', expand='appointment.branch')
+        self.assertEqual(dose['appointment_details']['branch_details']['name'], "Field Branch")
+        self.assertNotIn('user_details', dose['appointment_details'])
+        self.assertNotIn('vaccine_details', dose)
+
+    def test_fields(self):
+        """Test that ?fields= trims the output"""
+        appointment = self.first('appointment-list', fields='id,datetime')
+        self.assertEqual(set(appointment), {'id', 'datetime'})
+
+    def test_fields_with_expand(self):
+        """Test that expanded objects are kept alongside the selected fields"""
+        dose = self.first('dose-list', fields='id', expand='vaccine')
+        self.assertEqual(set(dose), {'id', 'vaccine_details'})
+
+    def test_detail_supports_expand(self):
+        """Test that retrieve honours ?expand= as well"""
+        url = reverse('appointment-detail', kwargs={'pk': self.appointment.pk})
+        response = self.client.get(url, {'expand': 'vaccine'})
+        self.assertEqual(response.data['vaccine_details']['name'], "Field Vaccine")
@@ -0,0 +1,47 @@
+"""
+Tests for the micro-benchmark suite and its baselines
+"""
+from django.test import TestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from io import StringIO
+from pathlib import Path
+import json
+import tempfile
+from core.benchmarks import BENCHMARKS, BenchResult, find_regressions, run_benchmarks
+from core.models import Branch
+
+QUICK = {'rounds': 2, 'min_time': 0.001, 'branches': 20, 'doses': 20}
+
+
+class BenchmarkTests(TestCase):
+    """Test benchmarks run against generated data and detect regressions"""
+
+    def test_all_benchmarks_run(self):
+        branches = Branch.objects.count()
+        results = run_benchmarks(**QUICK)
+        self.assertEqual([r.name for r in results], list(BENCHMARKS))
+        self.assertTrue(all(r.ops_per_sec > 0 and r.iterations >= 1 for r in results))
+        # Generated rows are rolled back
+        self.assertEqual(Branch.objects.count(), branches)
+
+    def test_find_regressions(self):
+        baseline = {'results': {'a': {'ops_per_sec': 100.0}, 'b': {'ops_per_sec': 100.0}}}
+        results = [BenchResult('a', 2, 1, 80.0, 1.0), BenchResult('b', 2, 1, 70.0, 1.0), BenchResult('c', 2, 1, 1.0, 0)]
+        [regression] = find_regressions(results, baseline, threshold=0.25)
+        self.assertEqual(regression.name, 'b')
+        self.assertAlmostEqual(regression.change, -0.3)
+
+    def test_command_save_and_compare(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'baseline.json'
+            args = ['--only', 'branch.get_opening_hours_display', '--rounds', '2', '--min-time', '0.001',
+                    '--branches', '20', '--baseline', str(path)]
+            call_command('bench', *args, '--save', stdout=StringIO())
+            saved = json.loads(path.read_text())
+            self.assertIn('branch.get_opening_hours_display', saved['results'])
+
+            saved['results']['branch.get_opening_hours_display']['ops_per_sec'] *= 1000
+            path.write_text(json.dumps(saved))
+            with self.assertRaisesMessage(CommandError, 'branch.get_opening_hours_display'):
+                call_command('bench', *args, stdout=StringIO())
@@ -0,0 +1,166 @@
+"""
+Tests for the contention-safe booking service
+"""
+from django.test import TestCase, TransactionTestCase
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from datetime import date, datetime
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from core.booking import SlotUnavailable, book_appointment, reschedule_appointment
+from core.models import Vaccine, Branch, Appointment, SlotCounter
+
+User = get_user_model()
+
+MONDAY = date(2030, 1, 7)
+
+
+def local_dt(day, hour, minute=0):
+    return timezone.make_aware(datetime(day.year, day.month, day.day, hour, minute))
+
+
+def make_branch(capacity):
+    return Branch.objects.create(
+        name="Booking Branch",
+        address="1 Booking St",
+        postcode="BK 1",
+        phone="123",
+        email="booking@branch.com",
+        opening_hours=[{"days": "Mon-Fri", "open": "09:00", "close": "17:00"}],
+        slot_capacity=capacity,
+    )
+
+
+class BookingServiceTests(TestCase):
+    """Test reserving and releasing slot capacity"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='booker', password='testpass123')
+        self.vaccine = Vaccine.objects.create(name="Booking Vaccine", price_per_dose=20.00)
+        self.branch = make_branch(capacity=2)
+
+    def appointment(self, when, branch=None):
+        return Appointment(user=self.user, vaccine=self.vaccine, branch=branch or self.branch, datetime=when)
+
+    def counter(self, when):
+        return SlotCounter.objects.get(branch=self.branch, slot_start=when).booked
+
+    def test_book_reserves_capacity(self):
+        appt = book_appointment(self.appointment(local_dt(MONDAY, 9, 10)))
+        self.assertIsNotNone(appt.pk)
+        self.assertEqual(self.counter(local_dt(MONDAY, 9)), 1)
+
+    def test_full_slot_rejected(self):
+        book_appointment(self.appointment(local_dt(MONDAY, 9)))
+        book_appointment(self.appointment(local_dt(MONDAY, 9, 15)))
+        with self.assertRaises(SlotUnavailable):
+            book_appointment(self.appointment(local_dt(MONDAY, 9, 20)))
+        self.assertEqual(Appointment.objects.filter(branch=self.branch).count(), 2)
+
+    def test_closed_slot_rejected(self):
+        with self.assertRaises(SlotUnavailable):
+            book_appointment(self.appointment(local_dt(MONDAY, 20)))
+
+    def test_counter_seeded_from_existing_appointments(self):
+        self.appointment(local_dt(MONDAY, 10)).save()
+        self.appointment(local_dt(MONDAY, 10)).save()
+        with self.assertRaises(SlotUnavailable):
+            book_appointment(self.appointment(local_dt(MONDAY, 10)))
+
+    def test_unreserved_appointments_update_existing_counter(self):
+        book_appointment(self.appointment(local_dt(MONDAY, 11)))
+        self.appointment(local_dt(MONDAY, 11)).save()
+        self.assertEqual(self.counter(local_dt(MONDAY, 11)), 2)
+
+    def test_reschedule_moves_reservation(self):
+        appt = book_appointment(self.appointment(local_dt(MONDAY, 9)))
+        previous = appt.branch, appt.datetime
+        appt.datetime = local_dt(MONDAY, 14)
+        reschedule_appointment(appt, *previous)
+        self.assertEqual(self.counter(local_dt(MONDAY, 9)), 0)
+        self.assertEqual(self.counter(local_dt(MONDAY, 14)), 1)
+
+    def test_plain_save_moves_reservation(self):
+        # As the admin does: no reschedule_appointment, just save()
+        appt = book_appointment(self.appointment(local_dt(MONDAY, 9)))
+        book_appointment(self.appointment(local_dt(MONDAY, 14)))
+        appt.datetime = local_dt(MONDAY, 14, 20)
+        appt.save()
+        self.assertEqual(self.counter(local_dt(MONDAY, 9)), 0)
+        self.assertEqual(self.counter(local_dt(MONDAY, 14)), 2)
+        # Within the same slot nothing moves
+        appt.datetime = local_dt(MONDAY, 14, 10)
+        appt.save()
+        self.assertEqual(self.counter(local_dt(MONDAY, 14)), 2)
+
+    def test_plain_save_moves_reservation_between_branches(self):
+        other = make_branch(capacity=2)
+        appt = book_appointment(self.appointment(local_dt(MONDAY, 9)))
+        book_appointment(self.appointment(local_dt(MONDAY, 9), branch=other))
+        appt.branch = other
+        appt.save()
+        self.assertEqual(self.counter(local_dt(MONDAY, 9)), 0)
+        self.assertEqual(SlotCounter.objects.get(branch=other, slot_start=local_dt(MONDAY, 9)).booked, 2)
+
+    def test_delete_releases_capacity(self):
+        appt = book_appointment(self.appointment(local_dt(MONDAY, 9)))
+        appt.delete()
+        self.assertEqual(self.counter(local_dt(MONDAY, 9)), 0)
+
+    def test_view_books_with_single_insert(self):
+        self.client.login(username='booker', password='testpass123')
+        response = self.client.post(reverse('appointment_add'), {
+            'vaccine': self.vaccine.id,
+            'branch': self.branch.id,
+            'datetime': '2030-01-07T09:30',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Appointment.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(self.counter(local_dt(MONDAY, 9, 30)), 1)
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """Hammer one slot from many threads and check it is never overbooked"""
+
+    THREADS = 8
+    ATTEMPTS = 40
+    CAPACITY = 12
+
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'stress{i}', password='x') for i in range(self.THREADS)]
+        self.vaccine = Vaccine.objects.create(name="Stress Vaccine", price_per_dose=20.00)
+        self.branch = make_branch(capacity=self.CAPACITY)
+
+    def test_no_overbooking_under_contention(self):
+        when = local_dt(MONDAY, 12)
+        start = threading.Barrier(self.THREADS)
+
+        def worker(user):
+            booked = rejected = 0
+            start.wait()
+            try:
+                for _ in range(self.ATTEMPTS // self.THREADS):
+                    try:
+                        book_appointment(Appointment(user=user, vaccine=self.vaccine, branch=self.branch, datetime=when))
+                        booked += 1
+                    except SlotUnavailable:
+                        rejected += 1
+            finally:
+                connection.close()
+            return booked, rejected
+
+        began = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.THREADS) as pool:
+            results = list(pool.map(worker, self.users))
+        elapsed = time.perf_counter() - began
+
+        booked = sum(r[0] for r in results)
+        rejected = sum(r[1] for r in results)
+        self.assertEqual(booked + rejected, self.ATTEMPTS)
+        self.assertEqual(booked, self.CAPACITY)
+        self.assertEqual(Appointment.objects.filter(branch=self.branch, datetime=when).count(), self.CAPACITY)
+        self.assertEqual(SlotCounter.objects.get(branch=self.branch).booked, self.CAPACITY)
+        self.assertLess(elapsed, 30)
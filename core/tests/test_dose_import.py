@@ -0,0 +1,166 @@
+"""
+Tests for bulk dose import
+"""
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+from datetime import date
+from io import StringIO
+import json
+import tempfile
+from core.dose_import import DoseImportError, import_doses
+from core.models import Vaccine, Dose, UserVaccineStatus
+
+User = get_user_model()
+
+
+class DoseImportTests(TestCase):
+    """Test streaming CSV/NDJSON import"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='x')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='x')
+        self.vaccine = Vaccine.objects.create(name="Import Vaccine", price_per_dose=20.00, primary_series_doses=2)
+
+    def csv(self, *rows):
+        return StringIO("user,vaccine,date_administered\n" + "".join(f"{','.join(r)}\n" for r in rows))
+
+    def numbers(self, user):
+        return list(Dose.objects.filter(user=user).order_by('date_administered').values_list('dose_number', flat=True))
+
+    def test_numbers_follow_date_order(self):
+        result = import_doses(self.csv(
+            ('alice', 'Import Vaccine', '2023-03-01'),
+            ('alice', 'import vaccine', '2023-01-01'),
+            ('bob', 'Import Vaccine', '2023-02-01'),
+        ))
+        self.assertEqual((result.rows, result.imported, result.rejected), (3, 3, 0))
+        self.assertEqual(self.numbers(self.alice), [1, 2])
+        self.assertEqual(self.numbers(self.bob), [1])
+
+    def test_numbers_continue_from_existing_doses(self):
+        Dose.objects.create(user=self.alice, vaccine=self.vaccine, date_administered=date(2022, 1, 1), dose_number=1)
+        import_doses(self.csv(('alice', 'Import Vaccine', '2023-01-01')))
+        self.assertEqual(self.numbers(self.alice), [1, 2])
+
+    def test_older_history_renumbers_the_series(self):
+        later = Dose.objects.create(user=self.alice, vaccine=self.vaccine, date_administered=date(2024, 1, 1), dose_number=1)
+        Dose.objects.create(user=self.alice, vaccine=self.vaccine, date_administered=date(2024, 6, 1), dose_number=2)
+        Dose.objects.create(user=self.bob, vaccine=self.vaccine, date_administered=date(2024, 1, 1), dose_number=1)
+        result = import_doses(self.csv(
+            ('alice', 'Import Vaccine', '2019-05-01'),
+            ('alice', 'Import Vaccine', '2024-03-01'),
+            ('bob', 'Import Vaccine', '2024-02-01'),
+        ))
+        self.assertEqual(result.imported, 3)
+        self.assertEqual(
+            list(Dose.objects.filter(user=self.alice).order_by('dose_number').values_list('date_administered', flat=True)),
+            [date(2019, 5, 1), date(2024, 1, 1), date(2024, 3, 1), date(2024, 6, 1)],
+        )
+        later.refresh_from_db()
+        self.assertEqual(later.dose_number, 2)
+        self.assertEqual(self.numbers(self.bob), [1, 2])
+
+    def test_rejects_are_counted_and_reported(self):
+        result = import_doses(self.csv(
+            ('alice', 'Import Vaccine', '2023-01-01'),
+            ('carol', 'Import Vaccine', '2023-01-01'),
+            ('alice', 'No Such Vaccine', '2023-01-01'),
+            ('alice', 'Import Vaccine', 'yesterday'),
+            ('alice', 'Import Vaccine', '2999-01-01'),
+            ('alice', '', '2023-01-01'),
+        ))
+        self.assertEqual((result.imported, result.rejected), (1, 5))
+        self.assertEqual([e['line'] for e in result.errors], [4, 5, 6, 7, 3])
+
+    def test_ndjson_with_email_keys(self):
+        lines = [
+            json.dumps({'user': 'Bob@Example.com', 'vaccine': 'Import Vaccine', 'date_administered': '2023-01-01'}),
+            '',
+            'not json',
+        ]
+        result = import_doses(StringIO("\n".join(lines)), 'ndjson', user_field='email')
+        self.assertEqual((result.imported, result.rejected), (1, 1))
+        self.assertEqual(self.numbers(self.bob), [1])
+
+    def test_small_chunks_number_consistently(self):
+        days = [f'2023-01-{d:02d}' for d in range(1, 8)]
+        result = import_doses(self.csv(*[('alice', 'Import Vaccine', d) for d in days]), chunk_size=2, batch_size=1)
+        self.assertEqual(result.imported, 7)
+        self.assertEqual(self.numbers(self.alice), list(range(1, 8)))
+
+    def test_status_table_updated(self):
+        import_doses(self.csv(('alice', 'Import Vaccine', '2023-01-01'), ('alice', 'Import Vaccine', '2023-02-01')))
+        row = UserVaccineStatus.objects.get(user=self.alice, vaccine=self.vaccine)
+        self.assertEqual((row.dose_count, row.series_complete), (2, True))
+
+    def test_missing_header_rejected(self):
+        with self.assertRaises(DoseImportError):
+            import_doses(StringIO("username,vaccine\nalice,Import Vaccine\n"))
+
+    def test_command_reports_throughput(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write("user,vaccine,date_administered\nalice,Import Vaccine,2023-01-01\nzed,Import Vaccine,2023-01-01\n")
+            f.flush()
+            out, err = StringIO(), StringIO()
+            call_command('import_doses', f.name, stdout=out, stderr=err)
+        self.assertIn('Imported 1 of 2 rows (1 rejected)', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+        self.assertIn("Unknown user 'zed'", err.getvalue())
+
+    def test_command_rejects_invalid_utf8(self):
+        with tempfile.NamedTemporaryFile('wb', suffix='.csv') as f:
+            f.write(b"user,vaccine,date_administered\nalice,Import \xe9 Vaccine,2023-01-01\n")
+            f.flush()
+            with self.assertRaisesMessage(CommandError, 'not valid UTF-8'):
+                call_command('import_doses', f.name, stdout=StringIO(), stderr=StringIO())
+
+    def test_command_missing_file(self):
+        with self.assertRaises(CommandError):
+            call_command('import_doses', '/nonexistent/doses.csv', stdout=StringIO())
+
+
+class DoseImportEndpointTests(TestCase):
+    """Test the upload endpoint"""
+
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='x', is_staff=True)
+        self.patient = User.objects.create_user(username='patient', password='x')
+        Vaccine.objects.create(name="Upload Vaccine", price_per_dose=20.00)
+        self.client = APIClient()
+
+    def upload(self, name='doses.csv', content=b"user,vaccine,date_administered\npatient,Upload Vaccine,2023-01-01\n"):
+        return self.client.post(reverse('dose-bulk-import'), {'file': SimpleUploadedFile(name, content)}, format='multipart')
+
+    def test_staff_can_upload(self):
+        self.client.force_authenticate(user=self.staff)
+        response = self.upload()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['imported'], 1)
+        self.assertEqual(Dose.objects.filter(user=self.patient).count(), 1)
+
+    def test_ndjson_detected_from_extension(self):
+        self.client.force_authenticate(user=self.staff)
+        line = json.dumps({'user': 'patient', 'vaccine': 'Upload Vaccine', 'date_administered': '2023-01-01'})
+        response = self.upload('doses.ndjson', line.encode())
+        self.assertEqual(response.data['imported'], 1)
+
+    def test_non_staff_forbidden(self):
+        self.client.force_authenticate(user=self.patient)
+        self.assertEqual(self.upload().status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(Dose.objects.exists())
+
+    def test_invalid_utf8_is_400(self):
+        self.client.force_authenticate(user=self.staff)
+        response = self.upload(content=b"user,vaccine,date_administered\npatient,Upload \xff Vaccine,2023-01-01\n")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Dose.objects.exists())
+
+    def test_bad_header_is_400(self):
+        self.client.force_authenticate(user=self.staff)
+        response = self.upload(content=b"who,what\n")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
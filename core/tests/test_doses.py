@@ -0,0 +1,95 @@
+"""
+Tests for race-free dose recording
+"""
+from django.test import TestCase, TransactionTestCase
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from unittest.mock import patch
+import threading
+from core import doses
+from core.doses import record_dose
+from core.models import Vaccine, Dose
+
+User = get_user_model()
+
+
+class RecordDoseTests(TestCase):
+    """Test dose number allocation"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='doser', password='testpass123')
+        self.vaccine = Vaccine.objects.create(name="Dose Vaccine", price_per_dose=20.00)
+        self.other_vaccine = Vaccine.objects.create(name="Other Dose Vaccine", price_per_dose=20.00)
+
+    def dose(self, vaccine=None):
+        return Dose(user=self.user, vaccine=vaccine or self.vaccine, date_administered=date(2024, 1, 1))
+
+    def test_numbers_increment_per_vaccine(self):
+        self.assertEqual(record_dose(self.dose()).dose_number, 1)
+        self.assertEqual(record_dose(self.dose()).dose_number, 2)
+        self.assertEqual(record_dose(self.dose(self.other_vaccine)).dose_number, 1)
+
+    def test_lost_race_is_renumbered(self):
+        """A stale MAX(dose_number) read collides on the constraint and is retried"""
+        record_dose(self.dose())
+        stale = iter([1])
+        real = doses.next_dose_number
+
+        def next_number(*args, **kwargs):
+            return next(stale, None) or real(*args, **kwargs)
+
+        with patch('core.doses.next_dose_number', side_effect=next_number):
+            dose = record_dose(self.dose())
+        self.assertEqual(dose.dose_number, 2)
+
+    def test_api_allocates_dose_number(self):
+        record_dose(self.dose())
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.post(reverse('dose-list'), {
+            'user': self.user.id,
+            'vaccine': self.vaccine.id,
+            'date_administered': '2024-02-01',
+            'dose_number': 1,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['dose_number'], 2)
+
+    def test_view_uses_service(self):
+        self.client.login(username='doser', password='testpass123')
+        for _ in range(2):
+            self.client.post(reverse('dose_add'), {'vaccine': self.vaccine.id, 'date_administered': '2024-03-01'})
+        numbers = sorted(Dose.objects.filter(user=self.user).values_list('dose_number', flat=True))
+        self.assertEqual(numbers, [1, 2])
+
+
+class ConcurrentDoseTests(TransactionTestCase):
+    """Record doses for one user and vaccine from many threads at once"""
+
+    THREADS = 6
+    PER_THREAD = 4
+
+    def test_concurrent_recording_never_fails(self):
+        user = User.objects.create_user(username='batch', password='x')
+        vaccine = Vaccine.objects.create(name="Batch Vaccine", price_per_dose=20.00)
+        start = threading.Barrier(self.THREADS)
+
+        def worker(_):
+            start.wait()
+            try:
+                for _ in range(self.PER_THREAD):
+                    record_dose(Dose(user=user, vaccine=vaccine, date_administered=date(2024, 1, 1)))
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as pool:
+            list(pool.map(worker, range(self.THREADS)))
+
+        total = self.THREADS * self.PER_THREAD
+        numbers = sorted(Dose.objects.filter(user=user, vaccine=vaccine).values_list('dose_number', flat=True))
+        self.assertEqual(numbers, list(range(1, total + 1)))
@@ -0,0 +1,117 @@
+"""
+Tests for streaming appointment and dose exports
+"""
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+from datetime import date
+from io import StringIO
+import csv
+import json
+from core.dose_import import import_doses
+from core.exports import columns, stream_export
+from core.models import Vaccine, Branch, Appointment, Dose
+from core.tests.test_booking import local_dt
+
+User = get_user_model()
+
+
+class ExportTestCase(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='x')
+        self.bob = User.objects.create_user(username='bob', password='x')
+        self.vaccine = Vaccine.objects.create(name="Export Vaccine", price_per_dose=20.00)
+        self.north = Branch.objects.create(name="North", address="1 St", postcode="N1", phone="1", email="n@b.com")
+        self.south = Branch.objects.create(name="South", address="2 St", postcode="S1", phone="2", email="s@b.com")
+        self.appt = Appointment.objects.create(
+            user=self.alice, vaccine=self.vaccine, branch=self.north, datetime=local_dt(date(2024, 3, 1), 10),
+        )
+        Appointment.objects.create(user=self.bob, vaccine=self.vaccine, branch=self.south, datetime=local_dt(date(2024, 3, 5), 23))
+        Dose.objects.create(user=self.alice, vaccine=self.vaccine, date_administered=date(2024, 3, 1), dose_number=1, appointment=self.appt)
+        Dose.objects.create(user=self.bob, vaccine=self.vaccine, date_administered=date(2024, 4, 1), dose_number=1)
+
+
+class ExportTests(ExportTestCase):
+    """Test export generation and filters"""
+
+    def csv_rows(self, kind, **filters):
+        return list(csv.DictReader(StringIO(''.join(stream_export(kind, 'csv', **filters)))))
+
+    def test_csv_has_joined_names(self):
+        rows = self.csv_rows('appointments')
+        self.assertEqual([r['user'] for r in rows], ['alice', 'bob'])
+        self.assertEqual(rows[0]['branch'], 'North')
+        self.assertEqual(rows[0]['vaccine'], 'Export Vaccine')
+        self.assertEqual(list(rows[0]), columns('appointments'))
+
+    def test_ndjson(self):
+        lines = ''.join(stream_export('doses', 'ndjson')).splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual(records[0]['branch'], 'North')
+        self.assertIsNone(records[1]['branch'])
+        self.assertEqual(records[1]['date_administered'], '2024-04-01')
+
+    def test_branch_and_date_filters(self):
+        self.assertEqual(len(self.csv_rows('appointments', branch=self.south.id)), 1)
+        self.assertEqual([r['user'] for r in self.csv_rows('doses', branch=self.north)], ['alice'])
+        # end is inclusive of the whole local day
+        self.assertEqual(len(self.csv_rows('appointments', start=date(2024, 3, 5), end=date(2024, 3, 5))), 1)
+        self.assertEqual(len(self.csv_rows('doses', end=date(2024, 3, 31))), 1)
+
+    def test_no_model_instances(self):
+        with self.assertNumQueries(1):
+            chunks = list(stream_export('doses', 'csv'))
+        self.assertEqual(len(chunks), 2)
+
+    def test_dose_export_reimports(self):
+        exported = ''.join(stream_export('doses', 'csv'))
+        Dose.objects.all().delete()
+        result = import_doses(StringIO(exported))
+        self.assertEqual((result.imported, result.rejected), (2, 0))
+
+    def test_command_streams_to_stdout(self):
+        out = StringIO()
+        call_command('export_data', 'doses', '--format', 'ndjson', '--start', '2024-04-01', stdout=out)
+        self.assertEqual([json.loads(l)['user'] for l in out.getvalue().splitlines()], ['bob'])
+
+
+class ExportEndpointTests(ExportTestCase):
+    """Test the streaming export endpoints"""
+
+    def get(self, name, user, **params):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client.get(reverse(name), params)
+
+    def test_staff_export_streams_csv(self):
+        staff = User.objects.create_user(username='staff', password='x', is_staff=True)
+        response = self.get('appointment-export', staff)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(len(body.splitlines()), 3)
+
+    def test_ndjson_format(self):
+        staff = User.objects.create_user(username='staff', password='x', is_staff=True)
+        response = self.get('dose-export', staff, format='ndjson', branch=self.north.id)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+
+    def test_patients_only_get_their_own_rows(self):
+        response = self.get('dose-export', self.bob)
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([r['user'] for r in rows], ['bob'])
+
+    def test_bad_filter_is_400(self):
+        response = self.get('appointment-export', self.bob, start='March')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_requires_authentication(self):
+        response = APIClient().get(reverse('dose-export'))
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
@@ -0,0 +1,108 @@
+"""
+Tests for the synthetic load-data generator
+"""
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from datetime import date
+from io import StringIO
+from core.models import Appointment, Branch, Dose, UserVaccineStatus
+from core.slots import slot_start_for
+from core.synthetic import LoadGenerator
+
+SMALL = {'users': 60, 'branches': 15, 'appointments': 600, 'chunk_users': 25}
+
+
+def snapshot():
+    return (
+        list(User.objects.filter(username__startswith='load').order_by('pk').values_list('username', 'first_name', 'date_joined')),
+        list(Branch.objects.order_by('pk').values_list('name', 'opening_hours')),
+        list(Appointment.objects.order_by('pk').values_list('user_id', 'vaccine_id', 'branch_id', 'datetime')),
+        list(Dose.objects.order_by('pk').values_list('user_id', 'vaccine_id', 'appointment_id', 'dose_number', 'date_administered')),
+    )
+
+
+class LoadGeneratorTests(TestCase):
+    """Test the generated data set is sized, realistic and reproducible"""
+
+    def test_volumes(self):
+        branches = Branch.objects.count()
+        stats = LoadGenerator(seed=1, **SMALL).run()
+        self.assertEqual(User.objects.filter(username__startswith='load').count(), 60)
+        self.assertEqual(Branch.objects.count(), branches + 15)
+        self.assertEqual(Appointment.objects.count(), stats.appointments)
+        self.assertEqual(Dose.objects.count(), stats.doses)
+        # Roughly the requested number of appointments, plus walk-in doses
+        self.assertTrue(400 <= stats.appointments <= 800, stats.appointments)
+        self.assertTrue(Dose.objects.filter(appointment=None).exists())
+        self.assertEqual(UserVaccineStatus.objects.count(), stats.statuses)
+        self.assertTrue(stats.statuses)
+
+    def test_same_seed_same_data(self):
+        LoadGenerator(seed=7, **SMALL).run(statuses=False)
+        first = snapshot()
+        Dose.objects.all().delete()
+        Appointment.objects.all().delete()
+        User.objects.all().delete()
+        Branch.objects.filter(name__contains='Vaccination Centre').delete()
+        LoadGenerator(seed=7, **SMALL).run(statuses=False)
+        self.assertEqual(first, snapshot())
+
+    def test_passwords_unusable(self):
+        LoadGenerator(seed=1, **SMALL).run(statuses=False)
+        self.assertFalse(any(user.has_usable_password() for user in User.objects.filter(username__startswith='load')))
+
+    def test_doses_follow_schedules(self):
+        LoadGenerator(seed=2, **SMALL).run(statuses=False)
+        series = {}
+        for dose in Dose.objects.order_by('date_administered', 'dose_number'):
+            series.setdefault((dose.user_id, dose.vaccine_id), []).append(dose)
+        for doses in series.values():
+            self.assertEqual([d.dose_number for d in doses], list(range(1, len(doses) + 1)))
+            for earlier, later in zip(doses, doses[1:]):
+                self.assertGreaterEqual((later.date_administered - earlier.date_administered).days, 28)
+
+    def test_appointments_fit_opening_hours(self):
+        LoadGenerator(seed=3, **SMALL).run(statuses=False)
+        branches = {b.pk: b for b in Branch.objects.all()}
+        for appointment in Appointment.objects.all():
+            start = slot_start_for(branches[appointment.branch_id], appointment.datetime)
+            self.assertEqual(start, appointment.datetime)
+        # Doses with an appointment were given on the appointment's date
+        for dose in Dose.objects.exclude(appointment=None).select_related('appointment')[:100]:
+            self.assertEqual(dose.date_administered, dose.appointment.datetime.date())
+
+    def test_no_doses_after_today(self):
+        # Open on Tuesdays only, and "today" is a Monday: anything falling due
+        # since last Tuesday is booked for tomorrow, not given
+        Branch.objects.all().delete()
+        Branch.objects.create(name="Tuesday Clinic", address="1 Tue St", postcode="T1", phone="1",
+                              email="tue@example.com", opening_hours=[{"days": "Tue", "open": "09:00", "close": "12:00"}])
+        today = date(2024, 6, 3)
+        LoadGenerator(seed=4, users=100, branches=0, appointments=2000, history_years=1, today=today).run(statuses=False)
+        self.assertTrue(Appointment.objects.filter(datetime__date__gt=today, doses=None).exists())
+        self.assertFalse(Dose.objects.filter(date_administered__gt=today).exists())
+        self.assertFalse(Dose.objects.filter(appointment__datetime__date__gt=today).exists())
+
+    def test_sequences_reset(self):
+        LoadGenerator(seed=1, **SMALL).run(statuses=False)
+        user = User.objects.create_user('after-load')
+        self.assertGreater(user.pk, User.objects.exclude(pk=user.pk).order_by('-pk')[0].pk)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('generate_load_data', '--users', '10', '--branches', '2', '--appointments', '50',
+                     '--chunk-size', '4', '--no-statuses', stdout=out)
+        self.assertIn('Created 10 users, 2 branches', out.getvalue())
+        self.assertEqual(UserVaccineStatus.objects.count(), 0)
+        with self.assertRaises(CommandError):
+            call_command('generate_load_data', '--users', '-1', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('generate_load_data', '--today', 'yesterday', stdout=StringIO())
+
+    def test_command_today(self):
+        call_command('generate_load_data', '--users', '10', '--branches', '2', '--appointments', '50',
+                     '--today', '2024-06-03', '--no-statuses', stdout=StringIO())
+        self.assertLessEqual(Dose.objects.latest('date_administered').date_administered, date(2024, 6, 3))
+        self.assertFalse(User.objects.filter(username__startswith='load', date_joined__date__gt=date(2024, 6, 3)).exists())
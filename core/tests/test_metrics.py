@@ -0,0 +1,73 @@
+"""
+Tests for the per-view latency histograms and the metrics endpoint
+"""
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from types import SimpleNamespace
+import json
+import tempfile
+from core.metrics import BUCKETS, CACHE_HITS, CACHE_MISSES, COUNT, DB_QUERIES, WIDTH, collect, render_prometheus, view_metrics
+
+User = get_user_model()
+
+BRANCH_LIST = ('branch_list', 'GET', '200')
+
+
+def profile(duration, queries=0):
+    return SimpleNamespace(duration=duration, sql_time=0.0, query_count=queries, cache_hits=1, cache_misses=0)
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_DIR=None, REQUEST_TIMING_SAMPLE_RATE=0)
+class ViewMetricsTests(TestCase):
+    """Test requests are counted per view, method and status"""
+
+    def setUp(self):
+        view_metrics.reset()
+        self.addCleanup(view_metrics.reset)
+
+    def test_requests_observed(self):
+        self.client.get(reverse('branch_list'))
+        self.client.get(reverse('branch_list'))
+        self.client.get(reverse('vaccine-list'))
+        series = collect()
+        self.assertEqual(series[BRANCH_LIST][COUNT], 2)
+        self.assertGreater(series[BRANCH_LIST][DB_QUERIES], 0)
+        self.assertGreater(series[BRANCH_LIST][CACHE_HITS] + series[BRANCH_LIST][CACHE_MISSES], 0)
+        self.assertEqual(series[('vaccine-list', 'GET', '200')][COUNT], 1)
+
+    def test_prometheus_histogram(self):
+        view_metrics.observe('home', 'GET', 200, profile(0.003))
+        view_metrics.observe('home', 'GET', 200, profile(0.2, queries=4))
+        view_metrics.observe('home', 'GET', 200, profile(30))
+        text = render_prometheus(collect())
+        labels = 'view="home",method="GET",status="200"'
+        self.assertIn(f'http_request_duration_seconds_bucket{{{labels},le="0.005"}} 1', text)
+        self.assertIn(f'http_request_duration_seconds_bucket{{{labels},le="0.25"}} 2', text)
+        self.assertIn(f'http_request_duration_seconds_bucket{{{labels},le="10.0"}} 2', text)
+        self.assertIn(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3', text)
+        self.assertIn(f'http_request_duration_seconds_count{{{labels}}} 3', text)
+        self.assertIn(f'http_request_db_queries_total{{{labels}}} 4', text)
+        self.assertIn(f'http_request_cache_lookups_total{{{labels},result="hit"}} 3', text)
+
+    def test_workers_aggregated_through_directory(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            other = [0] * WIDTH
+            other[len(BUCKETS)] = other[COUNT] = 5
+            with open(f'{directory}/metrics-1.json', 'w') as fh:
+                json.dump([[*BRANCH_LIST, other]], fh)
+            self.client.get(reverse('branch_list'))
+            self.assertEqual(collect()[BRANCH_LIST][COUNT], 6)
+
+    def test_endpoint_access(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        with self.settings(METRICS_TOKEN='scrape-me'):
+            response = self.client.get(url, HTTP_AUTHORIZATION='Bearer scrape-me')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.client.force_login(User.objects.create_user(username='ops', password='x', is_staff=True))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('# TYPE http_request_duration_seconds histogram', response.content.decode())
@@ -0,0 +1,86 @@
+"""
+Tests for on-demand request profiling
+"""
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from pathlib import Path
+import pstats
+import tempfile
+from core.profiling import CProfileRun, recent_profiles
+
+User = get_user_model()
+
+
+class ProfilingTests(TestCase):
+    """Test the profiling trigger, storage and staff page"""
+
+    def setUp(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.dir = Path(workdir.name)
+        self.enterContext(override_settings(PROFILE_DIR=workdir.name, PROFILE_SAMPLE_INTERVAL=0.0005))
+        self.staff = User.objects.create_user(username='ops', password='x', is_staff=True)
+        self.url = reverse('branch_list')
+
+    def test_staff_cprofile(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url, {'_profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        [summary] = recent_profiles()
+        self.assertEqual(summary['name'], response['X-Profile-Id'])
+        self.assertEqual((summary['mode'], summary['view'], summary['user']), ('cprofile', 'branch_list', 'ops'))
+        self.assertTrue(summary['top'])
+        self.assertGreater(pstats.Stats(str(self.dir / summary['artifact'])).total_calls, 0)
+
+    def test_staff_sampling_header(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url, HTTP_X_PROFILE='sample')
+        [summary] = recent_profiles()
+        self.assertEqual(summary['mode'], 'sample')
+        self.assertTrue((self.dir / summary['artifact']).is_file())
+        self.assertIn('X-Profile-Id', response)
+
+    def test_concurrent_cprofile_falls_back_to_sampling(self):
+        self.client.force_login(self.staff)
+        with CProfileRun.claim():
+            self.assertIsNone(CProfileRun.claim())
+            response = self.client.get(self.url, {'_profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['mode'] for p in recent_profiles()], ['sample'])
+        # The slot is free again once the first run ends
+        self.client.get(self.url, {'_profile': '1'})
+        self.assertEqual(recent_profiles()[0]['mode'], 'cprofile')
+
+    def test_flag_ignored_for_non_staff(self):
+        response = self.client.get(self.url, {'_profile': '1'})
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(recent_profiles(), [])
+
+    def test_one_in_n_sampling(self):
+        with self.settings(PROFILE_SAMPLE_VIEWS={'branch_list': 1}):
+            self.client.get(self.url)
+            self.client.get(reverse('home'))
+        self.assertEqual([p['view'] for p in recent_profiles()], ['branch_list'])
+
+    def test_rotation(self):
+        self.client.force_login(self.staff)
+        with self.settings(PROFILE_KEEP=2):
+            for _ in range(3):
+                self.client.get(self.url, {'_profile': '1'})
+        self.assertEqual(len(recent_profiles()), 2)
+        self.assertEqual(len(list(self.dir.iterdir())), 4)
+
+    def test_staff_page_and_download(self):
+        page = reverse('request_profiles')
+        self.assertEqual(self.client.get(page).status_code, 302)
+        self.client.force_login(self.staff)
+        self.client.get(self.url, {'_profile': '1'})
+        response = self.client.get(page)
+        self.assertContains(response, 'GET /branches/?_profile=1')
+        artifact = recent_profiles()[0]['artifact']
+        download = self.client.get(reverse('request_profile_download', args=[artifact]))
+        self.assertEqual(download.status_code, 200)
+        self.assertIn('attachment', download['Content-Disposition'])
+        missing = reverse('request_profile_download', args=[recent_profiles()[0]['name'] + '.json'])
+        self.assertEqual(self.client.get(missing).status_code, 404)
@@ -0,0 +1,53 @@
+"""
+Tests for the hot-query EXPLAIN review
+"""
+from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection
+from io import StringIO
+from unittest import skipUnless
+from core.query_plans import HOT_QUERIES, explain_hot_queries, find_problems
+
+
+class FindProblemsTests(TestCase):
+    """Test plan parsing"""
+
+    def test_sqlite_scans_and_sorts(self):
+        plan = (
+            "2 0 0 SCAN core_dose\n"
+            "5 0 0 SCAN core_appointment USING INDEX appt_datetime_id_idx\n"
+            "6 0 0 SCAN core_vaccine\n"
+            "9 0 0 USE TEMP B-TREE FOR ORDER BY\n"
+            "12 0 0 USE TEMP B-TREE FOR RIGHT PART OF ORDER BY"
+        )
+        self.assertEqual(find_problems(plan, 'sqlite'), ['full scan of core_dose', 'temp B-tree for ORDER BY'])
+
+    def test_postgresql(self):
+        plan = (
+            "Sort  (cost=10.0..10.1 rows=5 width=40)\n"
+            "  Sort Key: date_administered DESC\n"
+            "  ->  Seq Scan on core_dose  (cost=0.00..9.0 rows=5 width=40)"
+        )
+        self.assertEqual(find_problems(plan, 'postgresql'), ['full scan of core_dose', 'explicit sort'])
+
+
+@skipUnless(connection.vendor == 'sqlite', "Expected plans are SQLite's")
+class HotQueryPlanTests(TestCase):
+    """Test the hot queries are served by indexes"""
+
+    def test_no_problems(self):
+        reports = explain_hot_queries()
+        self.assertEqual(len(reports), len(HOT_QUERIES))
+        self.assertEqual({r.name: r.problems for r in reports if r.problems}, {})
+
+    def test_user_history_uses_composite_indexes(self):
+        plans = {r.name: r.plan for r in explain_hot_queries()}
+        self.assertIn('appt_user_datetime_idx', plans['appointment_list: past'])
+        self.assertIn('appt_user_vaccine_dt_idx', plans['dose_link_appointments'])
+        self.assertIn('dose_user_date_idx', plans['dose_list'])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('check_query_plans', '--strict', '--query', 'dose_list', '--plans', stdout=out)
+        self.assertIn('ok   dose_list', out.getvalue())
+        self.assertIn('0 of 1 queries flagged', out.getvalue())
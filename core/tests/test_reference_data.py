@@ -0,0 +1,276 @@
+"""
+Tests for conditional GET on vaccine and branch reference data
+"""
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.core.cache.backends.filebased import FileBasedCache
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+from rest_framework import status
+from datetime import datetime, timedelta
+from tempfile import TemporaryDirectory
+from unittest import mock
+from core.catalogue import catalogue_url
+from core.forms import AppointmentForm
+from core.models import Vaccine, Branch, Appointment
+from core.reference_data import _status_window, bump_version, current_version
+from core.registry import reference_registry
+from core.serializers import AppointmentCreateSerializer
+
+HOURS = [{"days": "Mon-Fri", "open": "09:00", "close": "17:00"}]
+ALWAYS_OPEN = [{"days": "Mon-Sun", "open": "00:00", "close": "23:59"}]
+
+
+class ReferenceDataTestCase(TestCase):
+
+    def setUp(self):
+        bump_version()
+        self.client = APIClient()
+        self.vaccine = Vaccine.objects.create(name="Cached Vaccine", price_per_dose=20.00)
+        self.branch = Branch.objects.create(
+            name="Cached Branch", address="1 St", postcode="C1", phone="1", email="c@b.com", opening_hours=HOURS,
+        )
+
+    def revalidate(self, url, response, queries=0):
+        with self.assertNumQueries(queries):
+            return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+
+class VersionTests(ReferenceDataTestCase):
+    """Test the version stamp and its signals"""
+
+    def test_stable_until_changed(self):
+        self.assertEqual(current_version(), current_version())
+
+    def test_bumped_after_commit(self):
+        for change in (
+            lambda: Vaccine.objects.create(name="New Vaccine", price_per_dose=1),
+            lambda: self.vaccine.save(),
+            lambda: self.branch.delete(),
+        ):
+            before = current_version()
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                change()
+                self.assertEqual(current_version(), before)
+            self.assertTrue(callbacks)
+            self.assertNotEqual(current_version(), before)
+
+    def test_status_window_follows_transitions(self):
+        Branch.objects.exclude(pk=self.branch.pk).delete()
+        tz = timezone.get_current_timezone()
+        monday = lambda h, m=0: datetime(2024, 1, 1, h, m, tzinfo=tz)
+        self.assertEqual(_status_window(monday(10))[0], _status_window(monday(15))[0])
+        self.assertNotEqual(_status_window(monday(15))[0], _status_window(monday(16, 30))[0])
+        self.assertEqual(_status_window(monday(16, 30))[1], monday(16))
+
+
+class ConditionalGetTests(ReferenceDataTestCase):
+    """Test ETag / Last-Modified handling on the reference endpoints"""
+
+    def test_vaccine_list_304_without_queries(self):
+        url = reverse('vaccine-list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(self.revalidate(url, response).status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_change_invalidates_etag(self):
+        url = reverse('vaccine-detail', args=[self.vaccine.pk])
+        response = self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Vaccine.objects.filter(pk=self.vaccine.pk).get().save()
+        refreshed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(refreshed.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(refreshed['ETag'], response['ETag'])
+
+    def test_if_modified_since(self):
+        url = reverse('vaccine-list')
+        self.client.get(url)
+        since = http_date(current_version()[1].timestamp())
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_branch_list_304_within_status_window(self):
+        url = reverse('branch-list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.revalidate(url, response).status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_branch_etag_changes_with_status(self):
+        url = reverse('branch-detail', args=[self.branch.pk])
+        tz = timezone.get_current_timezone()
+        with mock.patch('core.reference_data.local_now', return_value=datetime(2024, 1, 1, 10, tzinfo=tz)):
+            morning = self.client.get(url)['ETag']
+        with mock.patch('core.reference_data.local_now', return_value=datetime(2024, 1, 1, 18, tzinfo=tz)):
+            evening = self.client.get(url, HTTP_IF_NONE_MATCH=morning)
+        self.assertEqual(evening.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(evening['ETag'], morning)
+
+    def test_branch_hours_304(self):
+        url = reverse('branch_hours', args=[self.branch.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['opening_hours'], HOURS)
+        self.assertEqual(self.revalidate(url, response).status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class SharedStampTests(ReferenceDataTestCase):
+    """Test a bump in one worker process reaches the others"""
+
+    def setUp(self):
+        super().setUp()
+        location = TemporaryDirectory()
+        self.addCleanup(location.cleanup)
+        # Two handles on the same directory, as two workers have
+        self.worker_a = FileBasedCache(location.name, {'TIMEOUT': None})
+        self.worker_b = FileBasedCache(location.name, {'TIMEOUT': None})
+
+    def worker(self, cache):
+        return mock.patch('core.reference_data.stamp_cache', return_value=cache)
+
+    def test_bump_seen_by_other_workers(self):
+        url = reverse('vaccine-detail', args=[self.vaccine.pk])
+        with self.worker(self.worker_a):
+            response = self.client.get(url)
+            old_catalogue = catalogue_url()
+            self.assertEqual(self.revalidate(url, response).status_code, status.HTTP_304_NOT_MODIFIED)
+        with self.worker(self.worker_b), self.captureOnCommitCallbacks(execute=True):
+            self.vaccine.price_per_dose = 25
+            self.vaccine.save()
+        with self.worker(self.worker_a):
+            refreshed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(refreshed.status_code, status.HTTP_200_OK)
+            self.assertEqual(refreshed.json()['price_per_dose'], '25.00')
+            self.assertNotEqual(catalogue_url(), old_catalogue)
+
+    def test_rows_deleted_by_other_workers_are_rejected(self):
+        with self.worker(self.worker_a):
+            self.assertIsNotNone(reference_registry.branch(self.branch.pk))
+        # Deleted through worker B: the row goes (no signals here), then B bumps
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM core_branch WHERE id = %s', [self.branch.pk])
+        with self.worker(self.worker_b):
+            bump_version()
+        with self.worker(self.worker_a):
+            self.assertIsNone(reference_registry.branch(self.branch.pk))
+            serializer = AppointmentCreateSerializer(data={
+                'vaccine': self.vaccine.pk, 'branch': self.branch.pk, 'datetime': '2030-01-07T10:00:00Z',
+            })
+            self.assertFalse(serializer.is_valid())
+            self.assertIn('branch', serializer.errors)
+
+
+class CatalogueTests(ReferenceDataTestCase):
+    """Test the versioned wizard catalogue"""
+
+    def test_wizard_pages_link_catalogue_without_querying_it(self):
+        user = get_user_model().objects.create_user(username='patient', password='x')
+        self.client.force_login(user)
+        for name in ('appointment_add', 'dose_add'):
+            self.client.get(reverse(name))
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse(name))
+            self.assertContains(response, catalogue_url())
+            self.assertNotContains(response, 'Cached Vaccine')
+            sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+            self.assertNotIn('FROM "core_vaccine"', sql)
+            self.assertNotIn('FROM "core_branch"', sql)
+
+    def test_hashed_url_is_immutable(self):
+        response = self.client.get(catalogue_url())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('immutable', response['Cache-Control'])
+        body = response.content.decode()
+        self.assertTrue(body.startswith('window.wizardCatalogue = '))
+        self.assertIn('"Cached Branch"', body)
+
+    def test_new_content_gets_new_url(self):
+        old = catalogue_url()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vaccine.price_per_dose = 25
+            self.vaccine.save()
+        self.assertNotEqual(catalogue_url(), old)
+        self.assertRedirects(self.client.get(old), catalogue_url())
+
+    def test_unchanged_content_keeps_url(self):
+        old = catalogue_url()
+        bump_version()
+        self.assertEqual(catalogue_url(), old)
+
+
+class RegistryTests(ReferenceDataTestCase):
+    """Test the in-process vaccine/branch registry"""
+
+    def test_snapshot_reused_until_version_changes(self):
+        reference_registry.snapshot()
+        with self.assertNumQueries(0):
+            self.assertEqual(reference_registry.vaccine(self.vaccine.pk).name, "Cached Vaccine")
+            self.assertIsNone(reference_registry.branch('nonsense'))
+        # An unknown id is checked against the database once
+        with self.assertNumQueries(1):
+            self.assertIsNone(reference_registry.branch(0))
+        bump_version()
+        with self.assertNumQueries(2):
+            reference_registry.snapshot()
+
+    def test_writes_are_visible_immediately(self):
+        self.assertEqual(reference_registry.branch(self.branch.pk).name, "Cached Branch")
+        self.branch.name = "Renamed Branch"
+        self.branch.save()
+        self.assertEqual(reference_registry.branch(self.branch.pk).name, "Renamed Branch")
+
+    def test_rows_added_by_other_processes_are_found(self):
+        reference_registry.snapshot()
+        # Written without signals, as another worker's save looks from here
+        Branch.objects.bulk_create([Branch(name="Elsewhere", address="1 Far St", postcode="F1",
+                                           phone="1", email="far@example.com", opening_hours=ALWAYS_OPEN)])
+        added = Branch.objects.get(name="Elsewhere")
+        with self.assertNumQueries(3):  # existence check, then the reload
+            self.assertEqual(reference_registry.branch(added.pk).name, "Elsewhere")
+        with self.assertNumQueries(0):
+            self.assertIn(added.pk, [b.pk for b in reference_registry.all(Branch)])
+        self.assertEqual(self.client.get(reverse('branch_detail', args=[added.pk])).status_code, 200)
+
+    def test_lookups_are_copies(self):
+        reference_registry.vaccine(self.vaccine.pk).name = "Changed"
+        self.assertEqual(reference_registry.vaccine(self.vaccine.pk).name, "Cached Vaccine")
+
+    def test_form_choices_and_validation_without_queries(self):
+        reference_registry.snapshot()
+        with self.assertNumQueries(0):
+            form = AppointmentForm()
+            choices = list(form.fields['vaccine'].choices)
+            form = AppointmentForm({'vaccine': self.vaccine.pk, 'branch': 'x', 'datetime': '2030-01-07T10:00'})
+            self.assertFalse(form.is_valid())
+        self.assertIn((self.vaccine.pk, "Cached Vaccine"), [(c[0].value if c[0] else '', c[1]) for c in choices])
+        self.assertEqual(set(form.errors), {'branch'})
+
+    def test_booking_only_queries_for_the_write(self):
+        self.branch.opening_hours = ALWAYS_OPEN
+        self.branch.save()
+        user = get_user_model().objects.create_user(username='patient', password='x')
+        self.client.force_login(user)
+        when = (timezone.localtime() + timedelta(days=7)).replace(hour=10, minute=0)
+        data = {'vaccine': self.vaccine.pk, 'branch': self.branch.pk, 'datetime': when.strftime('%Y-%m-%dT%H:%M')}
+        reference_registry.snapshot()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('appointment_add'), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Appointment.objects.filter(user=user, branch=self.branch).exists())
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertNotIn('FROM "core_vaccine"', sql)
+        self.assertNotIn('FROM "core_branch"', sql)
+
+    def test_serializer_validates_ids_from_registry(self):
+        user = get_user_model().objects.create_user(username='patient', password='x')
+        reference_registry.snapshot()
+        serializer = AppointmentCreateSerializer(data={
+            'user': user.pk, 'vaccine': 0, 'branch': self.branch.pk, 'datetime': '2030-01-07T10:00',
+        })
+        with self.assertNumQueries(2):  # the user id, and whether vaccine 0 was added elsewhere
+            self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors['vaccine'][0].code, 'does_not_exist')
@@ -0,0 +1,107 @@
+"""
+Tests for primary/replica routing, with a second SQLite file as the replica
+"""
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.db import connection, connections, transaction
+from django.db.utils import load_backend
+from django.urls import reverse
+from pathlib import Path
+from unittest import skipUnless
+import tempfile
+from config.database import replica_settings
+from config.routers import PIN_COOKIE, PrimaryReplicaRouter, routing_scope
+from core.models import Vaccine, Appointment
+from core.sqlite_benchmark import copy_database
+from core.tests.test_booking import MONDAY, local_dt, make_branch
+
+User = get_user_model()
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class RouterTests(SimpleTestCase):
+    """Test routing decisions"""
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.enterContext(routing_scope())
+
+    def test_reads_go_to_replica_until_a_write(self):
+        self.assertEqual(self.router.db_for_read(Vaccine), 'replica')
+        self.assertEqual(self.router.db_for_write(Vaccine), 'default')
+        self.assertEqual(self.router.db_for_read(Vaccine), 'default')
+
+    def test_pinned_scope(self):
+        with routing_scope(pinned=True):
+            self.assertEqual(self.router.db_for_read(Vaccine), 'default')
+        self.assertEqual(self.router.db_for_read(Vaccine), 'replica')
+
+    def test_no_replicas(self):
+        with self.settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.router.db_for_read(Vaccine), 'default')
+
+    def test_replicas_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'core'))
+        self.assertTrue(self.router.allow_migrate('default', 'core'))
+
+    def test_replica_settings(self):
+        replicas = replica_settings({'REPLICA_DATABASE_URLS': 'sqlite:////tmp/r1.db, sqlite:////tmp/r2.db'})
+        self.assertEqual(list(replicas), ['replica1', 'replica2'])
+        self.assertEqual(replicas['replica2']['NAME'], '/tmp/r2.db')
+        self.assertEqual(replicas['replica1']['TEST'], {'MIRROR': 'default'})
+
+
+@skipUnless(connection.vendor == 'sqlite', "The replica is an SQLite copy")
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """Test reads hit a (stale) replica file and writers read their writes"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='replica', password='x')
+        self.vaccine = Vaccine.objects.create(name="Replica Vaccine", price_per_dose=20.00)
+        self.branch = make_branch(capacity=5)
+        self.client.force_login(self.user)
+
+        # Snapshot the primary; later writes never reach the "replica"
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        path = Path(workdir.name) / 'replica.db'
+        copy_database(str(path))
+        # Registered as a connection only (not in DATABASES), which the test framework allows
+        replica_config = {**connections.settings['default'], 'NAME': str(path)}
+        connections['replica'] = load_backend(replica_config['ENGINE']).DatabaseWrapper(replica_config, 'replica')
+        self.addCleanup(self.drop_replica)
+        self.enterContext(routing_scope())
+
+    def drop_replica(self):
+        connections['replica'].close()
+        del connections['replica']
+
+    def test_reads_use_replica_until_write(self):
+        with routing_scope():
+            Appointment.objects.create(user=self.user, vaccine=self.vaccine, branch=self.branch,
+                                       datetime=local_dt(MONDAY, 10))
+            self.assertEqual(Appointment.objects.count(), 1)
+        with routing_scope():
+            self.assertEqual(Appointment.objects.count(), 0)
+            with transaction.atomic():
+                self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_redirect_after_write_reads_primary(self):
+        response = self.client.post(reverse('appointment_add'), {
+            'vaccine': self.vaccine.id,
+            'branch': self.branch.id,
+            'datetime': '2030-01-07T09:30',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.client.get(response.url).status_code, 200)
+
+        # Once the pin expires, reads go back to the lagging replica
+        del self.client.cookies[PIN_COOKIE]
+        self.assertEqual(self.client.get(response.url).status_code, 404)
+
+    def test_read_only_request_not_pinned(self):
+        response = self.client.get(reverse('appointment_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
@@ -0,0 +1,66 @@
+"""
+Tests for per-request SQL and template timing
+"""
+from django.test import TestCase, override_settings
+from django.db import connection
+from django.urls import reverse
+import json
+from core.models import Vaccine
+from core.request_timing import RequestProfile, fingerprint
+
+
+class FingerprintTests(TestCase):
+    """Test statements differing only in values share a fingerprint"""
+
+    def test_literals_and_in_lists(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s) LIMIT 21'),
+            fingerprint('SELECT *  FROM t WHERE id IN (%s, %s, %s) LIMIT 5'),
+        )
+        self.assertNotEqual(fingerprint('SELECT a FROM t'), fingerprint('SELECT b FROM t'))
+
+
+@override_settings(REQUEST_TIMING_SAMPLE_RATE=1.0)
+class RequestTimingTests(TestCase):
+    """Test the Server-Timing header and log line"""
+
+    def get(self, url):
+        with self.assertLogs('core.request_timing', 'INFO') as logs:
+            response = self.client.get(url)
+        return response, json.loads(logs.records[0].getMessage())
+
+    def test_html_view(self):
+        response, entry = self.get(reverse('branch_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('sql;dur=', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+        self.assertEqual(entry['view'], 'branch_list')
+        self.assertGreater(entry['queries'], 0)
+        self.assertGreater(entry['template_ms'], 0)
+        self.assertLessEqual(len(entry['slowest']), 3)
+
+    def test_api_view(self):
+        response, entry = self.get(reverse('vaccine-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Server-Timing', response)
+        self.assertEqual(entry['view'], 'vaccine-list')
+        self.assertEqual(entry['status'], 200)
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=0)
+    def test_unsampled(self):
+        with self.assertNoLogs('core.request_timing', 'INFO'):
+            response = self.client.get(reverse('branch_list'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_duplicates(self):
+        profile = RequestProfile()
+        ids = list(Vaccine.objects.values_list('id', flat=True)[:3])
+        with connection.execute_wrapper(profile.record_query):
+            for pk in ids:
+                Vaccine.objects.get(pk=pk)
+            list(Vaccine.objects.all())
+        profile.finish()
+        [(_key, count, _ms, sql)] = profile.duplicates()
+        self.assertEqual(count, 3)
+        self.assertIn('WHERE', sql)
+        self.assertEqual(profile.as_dict()['queries'], 4)
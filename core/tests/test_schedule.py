@@ -0,0 +1,228 @@
+"""
+Tests for compiled branch opening-hours schedules
+"""
+from django.test import TestCase
+from datetime import datetime
+from core.models import Branch
+from core.schedule import (
+    WeeklySchedule, compile_schedule, parse_day_spec, parse_hhmm, period_day_mask
+)
+from core.status_cache import BranchStatusCache, branch_status_cache
+
+# 2024-01-01 was a Monday
+MONDAY = datetime(2024, 1, 1)
+
+
+def at(day_offset, hour, minute=0):
+    return MONDAY.replace(day=1 + day_offset, hour=hour, minute=minute)
+
+
+class DaySpecParsingTests(TestCase):
+    """Test parsing of days strings into weekday masks"""
+
+    def test_simple_range(self):
+        self.assertEqual(parse_day_spec("Mon-Fri"), 0b0011111)
+
+    def test_wrap_range(self):
+        self.assertEqual(parse_day_spec("Fri-Mon"), 0b1110001)
+
+    def test_comma_list(self):
+        self.assertEqual(parse_day_spec("Mon, Wed,Fri"), 0b0010101)
+
+    def test_invalid_spec(self):
+        self.assertEqual(parse_day_spec("Weekdays"), 0)
+        self.assertEqual(parse_day_spec(None), 0)
+
+    def test_parse_hhmm(self):
+        self.assertEqual(parse_hhmm("09:30"), 570)
+        self.assertEqual(parse_hhmm("9:05"), 545)
+        self.assertIsNone(parse_hhmm("24:00"))
+        self.assertIsNone(parse_hhmm("noon"))
+
+    def test_period_day_mask_accepts_full_names(self):
+        self.assertEqual(period_day_mask("Saturday-Sunday"), 0b1100000)
+        self.assertEqual(period_day_mask("sat"), 0b0100000)
+
+
+class WeeklyScheduleTests(TestCase):
+    """Test WeeklySchedule status lookups"""
+
+    def setUp(self):
+        self.schedule = WeeklySchedule.compile([
+            {"days": "Mon-Fri", "open": "09:00", "close": "20:00"},
+            {"days": "Sat-Sun", "open": "10:00", "close": "18:00"},
+        ])
+
+    def test_open(self):
+        self.assertEqual(
+            self.schedule.status_at(at(0, 12)),
+            {"text": "Open until 20:00", "class": "status-open"},
+        )
+
+    def test_closing_soon(self):
+        self.assertEqual(self.schedule.status_at(at(5, 17, 30))["class"], "status-closing")
+
+    def test_closed_before_and_after(self):
+        self.assertEqual(self.schedule.status_at(at(2, 8, 59))["class"], "status-closed")
+        self.assertEqual(self.schedule.status_at(at(2, 20))["class"], "status-closed")
+
+    def test_first_matching_block_wins(self):
+        schedule = WeeklySchedule.compile([
+            {"days": "Mon", "open": "08:00", "close": "12:00"},
+            {"days": "Mon-Fri", "open": "13:00", "close": "17:00"},
+        ])
+        self.assertEqual(schedule.status_at(at(0, 14))["class"], "status-closed")
+        self.assertEqual(schedule.status_at(at(1, 14))["class"], "status-open")
+
+    def test_not_a_list(self):
+        self.assertIsNone(WeeklySchedule.compile("Mon-Fri 9-5").status_at(at(0, 12)))
+
+    def test_identical_hours_share_compiled_schedule(self):
+        hours = [{"days": "Mon-Fri", "open": "09:00", "close": "17:00"}]
+        self.assertIs(compile_schedule(hours), compile_schedule(list(hours)))
+
+
+class BranchScheduleTests(TestCase):
+    """Test Branch methods backed by the compiled schedule"""
+
+    def make_branch(self, hours):
+        return Branch.objects.create(
+            name="Schedule Branch",
+            address="1 Clock Tower Sq",
+            postcode="CT 1",
+            phone="123",
+            email="clock@branch.com",
+            opening_hours=hours,
+        )
+
+    def test_overnight_span(self):
+        """Clock Town style 22:00-06:00 hours run past midnight from the opening day"""
+        branch = self.make_branch([{"days": "Mon-Sun", "open": "22:00", "close": "06:00"}])
+        self.assertEqual(branch.status_info(now=at(0, 21)), {"text": "Closed", "class": "status-closed"})
+        self.assertEqual(branch.status_info(now=at(0, 23)), {"text": "Open until 06:00", "class": "status-open"})
+        self.assertEqual(branch.status_info(now=at(6, 23)), {"text": "Open until 06:00", "class": "status-open"})
+        # Only the window that opened today is considered
+        self.assertEqual(branch.status_info(now=at(1, 2))["class"], "status-closed")
+
+    def test_24_7(self):
+        branch = self.make_branch([{"days": "Sun-Mon", "open": "00:00", "close": "23:59"}])
+        self.assertTrue(branch.is_24_7())
+        self.assertEqual(branch.open_until_display(), "Open 24/7")
+        self.assertEqual(branch.status_info(now=at(3, 3)), {"text": "Open 24/7", "class": "status-open"})
+
+    def test_schedule_recompiled_when_hours_change(self):
+        branch = self.make_branch([{"days": "Mon-Fri", "open": "09:00", "close": "17:00"}])
+        self.assertEqual(branch.status_info(now=at(5, 12))["class"], "status-closed")
+        branch.opening_hours = [{"days": "Sat", "open": "09:00", "close": "17:00"}]
+        branch.save()
+        self.assertEqual(branch.status_info(now=at(5, 12))["class"], "status-open")
+        reloaded = Branch.objects.get(pk=branch.pk)
+        self.assertEqual(reloaded.status_info(now=at(5, 12))["class"], "status-open")
+
+
+class BulkStatusTests(TestCase):
+    """Test evaluating status for many branches at once"""
+
+    def setUp(self):
+        self.hours = [
+            [{"days": "Mon-Sun", "open": "22:00", "close": "06:00"}],
+            [{"days": "Mon-Fri", "open": "08:00", "close": "19:00"}, {"days": "Sat", "open": "09:00", "close": "17:00"}],
+            [{"days": "Sun-Mon", "open": "00:00", "close": "23:59"}],
+            "not a list",
+        ]
+        for i, hours in enumerate(self.hours):
+            Branch.objects.create(
+                name=f"Bulk Branch {i}",
+                address="1 Bulk Rd",
+                postcode="BK 1",
+                phone="123",
+                email="bulk@branch.com",
+                opening_hours=hours,
+            )
+
+    def test_with_status_matches_status_info(self):
+        for when in (at(0, 7), at(2, 18, 30), at(5, 23), at(6, 12)):
+            branches = list(Branch.objects.with_status(at=when))
+            self.assertTrue(branches)
+            for branch in branches:
+                self.assertEqual(branch.current_status, branch.status_info(now=when))
+
+    def test_with_status_survives_chaining(self):
+        branches = Branch.objects.with_status(at=at(0, 12)).filter(name__startswith="Bulk").order_by('name')
+        statuses = [b.current_status for b in branches]
+        self.assertEqual(statuses[0]["class"], "status-closed")
+        self.assertEqual(statuses[1]["class"], "status-open")
+        self.assertEqual(statuses[2]["text"], "Open 24/7")
+        self.assertIsNone(statuses[3])
+
+    def test_with_status_ignored_for_values(self):
+        rows = list(Branch.objects.with_status().values('name'))
+        self.assertTrue(all(isinstance(r, dict) for r in rows))
+
+    def test_plain_queryset_has_no_status(self):
+        self.assertFalse(hasattr(Branch.objects.first(), 'current_status'))
+
+
+class StatusTransitionTests(TestCase):
+    """Test computing when a schedule's status next changes"""
+
+    def test_transitions(self):
+        schedule = WeeklySchedule.compile([{"days": "Mon", "open": "09:00", "close": "17:00"}])
+        self.assertEqual(schedule.transitions, (540, 960, 1020))
+        self.assertEqual(schedule.minutes_until_change(0), 540)
+        self.assertEqual(schedule.minutes_until_change(600), 360)
+        self.assertEqual(schedule.minutes_until_change(970), 50)
+        # After Monday's close the next change is next Monday's opening
+        self.assertEqual(schedule.minutes_until_change(1020), 7 * 1440 - 480)
+
+    def test_overnight_window_stops_at_midnight(self):
+        schedule = WeeklySchedule.compile([{"days": "Mon", "open": "22:00", "close": "06:00"}])
+        self.assertEqual(schedule.transitions, (1320, 1440))
+
+    def test_24_7_never_changes(self):
+        schedule = WeeklySchedule.compile([{"days": "Mon-Sun", "open": "00:00", "close": "23:59"}])
+        self.assertIsNone(schedule.minutes_until_change(100))
+
+
+class BranchStatusCacheTests(TestCase):
+    """Test the transition-aware branch status cache"""
+
+    def setUp(self):
+        self.cache = BranchStatusCache()
+        self.branch = Branch.objects.create(
+            name="Cached Branch",
+            address="1 Cache Ln",
+            postcode="CC 1",
+            phone="123",
+            email="cache@branch.com",
+            opening_hours=[{"days": "Mon-Fri", "open": "09:00", "close": "17:00"}],
+        )
+
+    def test_hit_until_next_transition(self):
+        self.assertEqual(self.cache.get(self.branch, at(0, 10))["class"], "status-open")
+        self.assertEqual(self.cache.get(self.branch, at(0, 15, 59))["class"], "status-open")
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        # 16:00 is the start of the closing-soon hour, so the entry has expired
+        self.assertEqual(self.cache.get(self.branch, at(0, 16))["class"], "status-closing")
+        self.assertEqual(self.cache.stats()["misses"], 2)
+
+    def test_get_many_counts(self):
+        other = Branch.objects.get(pk=self.branch.pk)
+        self.cache.get_many([self.branch, other], at(1, 12))
+        self.cache.get_many([self.branch, other], at(1, 13))
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 2))
+        self.assertEqual(stats["hit_ratio"], 0.5)
+
+    def test_changed_hours_are_not_served_from_cache(self):
+        self.assertEqual(self.cache.get(self.branch, at(5, 12))["class"], "status-closed")
+        self.branch.opening_hours = [{"days": "Sat", "open": "09:00", "close": "17:00"}]
+        self.assertEqual(self.cache.get(self.branch, at(5, 12))["class"], "status-open")
+        self.assertEqual(self.cache.stats()["hits"], 0)
+
+    def test_save_invalidates_shared_cache(self):
+        branch_status_cache.get(self.branch, at(0, 10))
+        before = branch_status_cache.stats()["invalidations"]
+        self.branch.save()
+        self.assertEqual(branch_status_cache.stats()["invalidations"], before + 1)
+        self.assertNotIn(self.branch.pk, branch_status_cache._entries)
@@ -0,0 +1,145 @@
+"""
+Tests for the server-side appointment slot engine
+"""
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+from datetime import date, timedelta
+from core.forms import AppointmentForm
+from core.models import Vaccine, Branch, Appointment
+from core import slots
+from core.tests.test_booking import local_dt
+
+User = get_user_model()
+
+# A Monday comfortably in the future
+MONDAY = date(2030, 1, 7)
+
+
+class SlotEngineTests(TestCase):
+    """Test slot expansion and capacity counting"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='slotuser', password='testpass123')
+        self.vaccine = Vaccine.objects.create(name="Slot Vaccine", price_per_dose=20.00)
+        self.branch = Branch.objects.create(
+            name="Slot Branch",
+            address="1 Slot St",
+            postcode="SL 1",
+            phone="123",
+            email="slots@branch.com",
+            opening_hours=[{"days": "Mon-Fri", "open": "09:00", "close": "11:00"}],
+            slot_capacity=2,
+        )
+
+    def book(self, when, branch=None):
+        return Appointment.objects.create(user=self.user, vaccine=self.vaccine, branch=branch or self.branch, datetime=when)
+
+    def test_slot_starts_follow_opening_hours(self):
+        starts = slots.slot_starts(self.branch, MONDAY, MONDAY + timedelta(days=6))
+        self.assertEqual(len(starts), 5 * 4)
+        self.assertEqual(starts[0], local_dt(MONDAY, 9))
+        self.assertEqual(starts[3], local_dt(MONDAY, 10, 30))
+
+    def test_overnight_hours_spill_into_next_day(self):
+        branch = Branch.objects.create(
+            name="Night Branch", address="2 Slot St", postcode="SL 2", phone="123", email="night@branch.com",
+            opening_hours=[{"days": "Mon", "open": "23:00", "close": "01:00"}],
+        )
+        tuesday = MONDAY + timedelta(days=1)
+        self.assertEqual(slots.slot_starts(branch, tuesday, tuesday), [local_dt(tuesday, 0), local_dt(tuesday, 0, 30)])
+
+    def test_available_slots_single_query(self):
+        self.book(local_dt(MONDAY, 9))
+        self.book(local_dt(MONDAY, 9, 10))
+        self.book(local_dt(MONDAY, 10))
+        with self.assertNumQueries(1):
+            result = slots.available_slots(self.branch, MONDAY, MONDAY + timedelta(days=29), now=local_dt(MONDAY, 0))
+        by_start = {s.start: s.remaining for s in result}
+        self.assertEqual(by_start[local_dt(MONDAY, 9)], 0)
+        self.assertEqual(by_start[local_dt(MONDAY, 10)], 1)
+        self.assertEqual(by_start[local_dt(MONDAY, 10, 30)], 2)
+
+    def test_past_slots_are_skipped(self):
+        result = slots.available_slots(self.branch, MONDAY, MONDAY, now=local_dt(MONDAY, 10))
+        self.assertEqual([s.start for s in result], [local_dt(MONDAY, 10), local_dt(MONDAY, 10, 30)])
+
+    def test_slot_error_closed(self):
+        self.assertIsNotNone(slots.slot_error(self.branch, local_dt(MONDAY, 12)))
+        self.assertIsNotNone(slots.slot_error(self.branch, local_dt(MONDAY + timedelta(days=5), 9)))
+        self.assertIsNone(slots.slot_error(self.branch, local_dt(MONDAY, 9, 15)))
+
+    def test_slot_error_full(self):
+        first = self.book(local_dt(MONDAY, 9))
+        self.book(local_dt(MONDAY, 9, 15))
+        self.assertIn("fully booked", slots.slot_error(self.branch, local_dt(MONDAY, 9, 20)))
+        # Editing an existing booking does not count against itself
+        self.assertIsNone(slots.slot_error(self.branch, local_dt(MONDAY, 9), exclude_pk=first.pk))
+
+    def test_branch_without_structured_hours_accepts_any_time(self):
+        branch = Branch.objects.create(
+            name="Legacy Branch", address="3 Slot St", postcode="SL 3", phone="123", email="legacy@branch.com",
+            opening_hours=[{"day": "Monday", "hours": "9:00 AM - 5:00 PM"}], slot_capacity=1,
+        )
+        self.assertIsNone(slots.slot_error(branch, local_dt(MONDAY, 3, 7)))
+        self.book(local_dt(MONDAY, 3, 0), branch=branch)
+        self.assertIsNotNone(slots.slot_error(branch, local_dt(MONDAY, 3, 7)))
+
+
+class SlotValidationTests(TestCase):
+    """Test that the form, the API serializer and the slots endpoint use the engine"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='slotuser', password='testpass123')
+        self.vaccine = Vaccine.objects.create(name="Slot Vaccine", price_per_dose=20.00)
+        self.branch = Branch.objects.create(
+            name="Slot Branch", address="1 Slot St", postcode="SL 1", phone="123", email="slots@branch.com",
+            opening_hours=[{"days": "Mon-Fri", "open": "09:00", "close": "11:00"}],
+            slot_capacity=1,
+        )
+
+    def test_form_rejects_closed_time(self):
+        form = AppointmentForm(data={
+            'vaccine': self.vaccine.id,
+            'branch': self.branch.id,
+            'datetime': '2030-01-07T13:00',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('datetime', form.errors)
+
+    def test_form_accepts_open_slot(self):
+        form = AppointmentForm(data={
+            'vaccine': self.vaccine.id,
+            'branch': self.branch.id,
+            'datetime': '2030-01-07T09:30',
+        })
+        self.assertTrue(form.is_valid())
+
+    def test_api_rejects_full_slot(self):
+        Appointment.objects.create(user=self.user, vaccine=self.vaccine, branch=self.branch, datetime=local_dt(MONDAY, 9))
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.post(reverse('appointment-list'), {
+            'user': self.user.id,
+            'vaccine': self.vaccine.id,
+            'branch': self.branch.id,
+            'datetime': local_dt(MONDAY, 9).isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('datetime', response.data)
+
+    def test_slots_endpoint(self):
+        response = self.client.get(reverse('branch_slots', args=[self.branch.id]), {'start': '2030-01-07', 'days': 2})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['slot_minutes'], slots.SLOT_MINUTES)
+        self.assertEqual(len(data['slots']), 8)
+        self.assertEqual(data['slots'][0]['remaining'], 1)
+
+    def test_slots_endpoint_bad_params(self):
+        url = reverse('branch_slots', args=[self.branch.id])
+        self.assertEqual(self.client.get(url, {'start': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'days': 365}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('branch_slots', args=[999999])).status_code, 404)
@@ -0,0 +1,70 @@
+"""
+Tests for the SQLite production profile and its benchmark
+"""
+from django.test import SimpleTestCase, TestCase
+from django.core.management import call_command
+from django.db import connection
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+import json
+import tempfile
+from config.database import SQLITE_BUSY_TIMEOUT, sqlite_options
+from core.sqlite_benchmark import _database, _run_in_thread, copy_database, run_profile
+
+
+class SqliteOptionsTests(SimpleTestCase):
+    """Test profile selection"""
+
+    def test_default_profile_is_plain(self):
+        self.assertEqual(sqlite_options('default'), {})
+
+    def test_production_profile(self):
+        options = sqlite_options('production')
+        self.assertEqual(options['transaction_mode'], 'IMMEDIATE')
+        self.assertEqual(options['timeout'], SQLITE_BUSY_TIMEOUT)
+        self.assertIn('PRAGMA journal_mode=WAL', options['init_command'])
+        self.assertIn('PRAGMA synchronous=NORMAL', options['init_command'])
+
+    def test_profile_from_environment(self):
+        with mock.patch.dict('os.environ', SQLITE_PROFILE='production'):
+            self.assertEqual(sqlite_options()['transaction_mode'], 'IMMEDIATE')
+        with mock.patch.dict('os.environ', SQLITE_PROFILE='fast'), self.assertRaises(ValueError):
+            sqlite_options()
+
+
+@skipUnless(connection.vendor == 'sqlite', "SQLite only")
+class SqliteBenchmarkTests(TestCase):
+    """Test the profile is applied per connection and the benchmark runs"""
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.workdir.name) / 'bench.db'
+        copy_database(str(self.path))
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def pragmas(self, profile):
+        def read():
+            with connection.cursor() as cursor:
+                return [cursor.execute(f'PRAGMA {name}').fetchone()[0] for name in ('journal_mode', 'synchronous')]
+        with _database(self.path, sqlite_options(profile)):
+            return _run_in_thread(read)
+
+    def test_pragmas_applied_on_connect(self):
+        self.assertEqual(self.pragmas('default'), ['delete', 2])
+        self.assertEqual(self.pragmas('production'), ['wal', 1])
+
+    def test_run_profile(self):
+        result = run_profile('production', self.path, threads=2, seconds=0.3, users=5)
+        self.assertGreater(result.reads + result.writes, 0)
+        self.assertEqual(result.errors, 0)
+        self.assertEqual(result.as_dict()['profile'], 'production')
+
+    def test_command_json(self):
+        out = StringIO()
+        call_command('benchmark_sqlite', '--source', str(self.path), '--seconds', '0.2',
+                     '--threads', '2', '--users', '5', '--json', stdout=out)
+        rows = json.loads(out.getvalue())
+        self.assertEqual([row['profile'] for row in rows], ['default', 'production'])
@@ -0,0 +1,258 @@
+"""
+Tests for the vaccination schedule engine
+"""
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+from datetime import date, timedelta
+from io import StringIO
+from core.models import Vaccine, Dose, UserVaccineStatus
+from core.vaccine_schedule import (
+    PRIMARY_DOSE_INTERVAL_DAYS, STATUS_COMPLETE, STATUS_IN_PROGRESS, STATUS_OVERDUE, STATUS_UP_TO_DATE,
+    population_schedule, rebuild_statuses, user_schedule,
+)
+
+User = get_user_model()
+
+TODAY = date(2024, 6, 1)
+
+
+class ScheduleTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='scheduled', password='testpass123')
+        self.series = Vaccine.objects.create(name="Series Vaccine", price_per_dose=20.00, primary_series_doses=3)
+        self.booster = Vaccine.objects.create(
+            name="Booster Vaccine", price_per_dose=20.00, primary_series_doses=1, booster_interval_years=10,
+        )
+        self.annual = Vaccine.objects.create(name="Annual Vaccine", price_per_dose=20.00, recurrence_interval_years=1.0)
+        self.single = Vaccine.objects.create(name="Single Vaccine", price_per_dose=20.00)
+
+    def give(self, vaccine, *days, user=None):
+        user = user or self.user
+        start = Dose.objects.filter(user=user, vaccine=vaccine).count()
+        for number, day in enumerate(days, start=start + 1):
+            Dose.objects.create(user=user, vaccine=vaccine, date_administered=day, dose_number=number)
+
+    def by_vaccine(self, user=None):
+        return {p.vaccine_id: p for p in user_schedule(user or self.user, today=TODAY)}
+
+
+class UserScheduleTests(ScheduleTestCase):
+    """Test next-due dates for a single user"""
+
+    def test_incomplete_series_due_after_interval(self):
+        self.give(self.series, date(2024, 5, 20))
+        progress = self.by_vaccine()[self.series.id]
+        self.assertEqual(progress.next_due_date, date(2024, 5, 20) + timedelta(days=PRIMARY_DOSE_INTERVAL_DAYS))
+        self.assertFalse(progress.series_complete)
+        self.assertEqual(progress.status, STATUS_IN_PROGRESS)
+
+    def test_incomplete_series_overdue(self):
+        self.give(self.series, date(2024, 1, 1), date(2024, 2, 1))
+        progress = self.by_vaccine()[self.series.id]
+        self.assertTrue(progress.overdue)
+        self.assertEqual(progress.status, STATUS_OVERDUE)
+
+    def test_completed_series_without_interval_is_complete(self):
+        self.give(self.series, date(2023, 1, 1), date(2023, 2, 1), date(2023, 3, 1))
+        self.give(self.single, date(2020, 1, 1))
+        schedule = self.by_vaccine()
+        for vaccine in (self.series, self.single):
+            self.assertIsNone(schedule[vaccine.id].next_due_date)
+            self.assertEqual(schedule[vaccine.id].status, STATUS_COMPLETE)
+
+    def test_booster_due_after_interval(self):
+        self.give(self.booster, date(2020, 3, 1))
+        progress = self.by_vaccine()[self.booster.id]
+        self.assertEqual(progress.next_due_date, date(2030, 3, 1))
+        self.assertEqual(progress.status, STATUS_UP_TO_DATE)
+
+    def test_recurring_vaccine_uses_latest_dose(self):
+        self.give(self.annual, date(2022, 10, 1), date(2023, 10, 1))
+        progress = self.by_vaccine()[self.annual.id]
+        self.assertEqual(progress.last_dose_date, date(2023, 10, 1))
+        self.assertEqual(progress.next_due_date, date(2024, 9, 30))
+        self.assertFalse(progress.overdue)
+
+    def test_sorted_soonest_first(self):
+        self.give(self.single, date(2024, 1, 1))
+        self.give(self.booster, date(2020, 1, 1))
+        self.give(self.series, date(2024, 5, 1))
+        names = [p.vaccine_name for p in user_schedule(self.user, today=TODAY)]
+        self.assertEqual(names, ["Series Vaccine", "Booster Vaccine", "Single Vaccine"])
+
+    def test_query_count_independent_of_history(self):
+        self.give(self.series, date(2024, 1, 1), date(2024, 2, 1))
+        self.give(self.annual, *[date(2010 + i, 1, 1) for i in range(10)])
+        with self.assertNumQueries(2):
+            user_schedule(self.user, today=TODAY)
+
+
+class PopulationScheduleTests(ScheduleTestCase):
+    """Test batch evaluation across all users"""
+
+    def test_matches_per_user_results(self):
+        other = User.objects.create_user(username='other', password='x')
+        self.give(self.series, date(2024, 1, 1))
+        self.give(self.annual, date(2023, 1, 1))
+        self.give(self.booster, date(2015, 1, 1), user=other)
+        self.give(self.annual, date(2024, 3, 1), user=other)
+
+        batch = [p.as_dict() for p in population_schedule(today=TODAY, chunk_size=2)]
+        single = [
+            p.as_dict()
+            for user in (self.user, other)
+            for p in sorted(user_schedule(user, today=TODAY), key=lambda p: p.vaccine_id)
+        ]
+        self.assertEqual(batch, single)
+
+    def test_constant_queries(self):
+        users = [User.objects.create_user(username=f'pop{i}', password='x') for i in range(5)]
+        for user in users:
+            self.give(self.annual, date(2023, 1, 1), user=user)
+            self.give(self.series, date(2024, 1, 1), user=user)
+        with self.assertNumQueries(2):
+            results = list(population_schedule(today=TODAY))
+        self.assertEqual(len(results), 10)
+        self.assertEqual(sum(p.overdue for p in results), 10)
+
+
+class ScheduleEndpointTests(ScheduleTestCase):
+    """Test the schedule on the API and profile page"""
+
+    def test_api_returns_own_schedule(self):
+        self.give(self.series, date(2000, 1, 1))
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get(reverse('api_schedule'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['overdue'], 1)
+        self.assertEqual(response.data['results'][0]['vaccine'], self.series.id)
+        self.assertEqual(response.data['results'][0]['status'], STATUS_OVERDUE)
+
+    def test_api_requires_authentication(self):
+        response = APIClient().get(reverse('api_schedule'))
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+    def test_only_staff_can_view_other_users(self):
+        other = User.objects.create_user(username='other', password='x')
+        self.give(self.single, date(2024, 1, 1), user=other)
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        self.assertEqual(client.get(reverse('api_schedule'), {'user': other.id}).data['user'], self.user.id)
+        staff = User.objects.create_user(username='staff', password='x', is_staff=True)
+        client.force_authenticate(user=staff)
+        self.assertEqual(client.get(reverse('api_schedule'), {'user': other.id}).data['user'], other.id)
+
+    def test_profile_shows_schedule(self):
+        self.give(self.booster, date(2020, 3, 1))
+        self.client.login(username='scheduled', password='testpass123')
+        response = self.client.get(reverse('profile'))
+        self.assertContains(response, 'Vaccination Schedule')
+        self.assertContains(response, 'Up to date')
+
+
+class MaterialisedStatusTests(ScheduleTestCase):
+    """Test the UserVaccineStatus table stays in step with Dose"""
+
+    def status(self, vaccine, user=None):
+        return UserVaccineStatus.objects.get(user=user or self.user, vaccine=vaccine)
+
+    def test_dose_save_updates_row(self):
+        self.give(self.series, date(2024, 1, 1))
+        self.assertEqual(self.status(self.series).dose_count, 1)
+        self.assertEqual(self.status(self.series).next_due_date, date(2024, 1, 29))
+        self.give(self.series, date(2024, 2, 1), date(2024, 3, 1))
+        row = self.status(self.series)
+        self.assertEqual((row.dose_count, row.last_dose_date), (3, date(2024, 3, 1)))
+        self.assertTrue(row.completed)
+        self.assertEqual(row.status, STATUS_COMPLETE)
+
+    def test_dose_delete_updates_row(self):
+        self.give(self.annual, date(2022, 1, 1), date(2023, 1, 1))
+        Dose.objects.get(vaccine=self.annual, dose_number=2).delete()
+        self.assertEqual(self.status(self.annual).last_dose_date, date(2022, 1, 1))
+        Dose.objects.get(vaccine=self.annual).delete()
+        self.assertFalse(UserVaccineStatus.objects.filter(user=self.user).exists())
+
+    def test_moved_dose_refreshes_both_vaccines(self):
+        self.give(self.series, date(2024, 1, 1))
+        dose = Dose.objects.get(vaccine=self.series)
+        dose.vaccine = self.single
+        dose.save()
+        self.assertFalse(UserVaccineStatus.objects.filter(vaccine=self.series).exists())
+        self.assertEqual(self.status(self.single).dose_count, 1)
+
+    def test_changed_vaccine_rules_rebuild_rows(self):
+        self.give(self.single, date(2020, 1, 1))
+        self.assertIsNone(self.status(self.single).next_due_date)
+        self.single.booster_interval_years = 5
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.single.save()
+            # Nothing is rebuilt inside the saving transaction
+            self.assertIsNone(self.status(self.single).next_due_date)
+        self.assertTrue(callbacks)
+        self.assertEqual(self.status(self.single).next_due_date, date(2020, 1, 1) + timedelta(days=round(5 * 365.25)))
+
+    def test_unchanged_vaccine_rules_rebuild_nothing(self):
+        self.give(self.booster, date(2020, 1, 1))
+        UserVaccineStatus.objects.update(dose_count=99)
+        self.booster.name = "Renamed Vaccine"
+        self.booster.price_per_dose = 99
+        # The same interval, in another type
+        self.booster.booster_interval_years = '10'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booster.save()
+        self.assertEqual(self.status(self.booster).dose_count, 99)
+
+    @override_settings(VACCINE_REBUILD_INLINE_MAX_DOSES=0)
+    def test_large_rebuild_left_to_the_command(self):
+        self.give(self.single, date(2020, 1, 1))
+        self.single.booster_interval_years = 5
+        with self.assertLogs('core.signals', 'WARNING') as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.single.save()
+        self.assertIn(f'rebuild_vaccine_status --vaccine {self.single.pk}', logs.output[0])
+        self.assertIsNone(self.status(self.single).next_due_date)
+
+    def test_rebuild_matches_incremental_rows(self):
+        other = User.objects.create_user(username='other', password='x')
+        self.give(self.series, date(2024, 1, 1), date(2024, 2, 1))
+        self.give(self.booster, date(2015, 1, 1), user=other)
+        self.give(self.annual, date(2023, 5, 1), user=other)
+        fields = ('user_id', 'vaccine_id', 'dose_count', 'last_dose_date', 'next_due_date', 'series_complete', 'completed')
+        incremental = sorted(UserVaccineStatus.objects.values_list(*fields))
+        UserVaccineStatus.objects.all().delete()
+        self.assertEqual(rebuild_statuses(chunk_size=1), 3)
+        self.assertEqual(sorted(UserVaccineStatus.objects.values_list(*fields)), incremental)
+
+    def test_vaccine_rebuild_only_visits_its_users(self):
+        other = User.objects.create_user(username='other', password='x')
+        self.give(self.annual, date(2023, 1, 1), user=other)
+        self.give(self.single, date(2023, 1, 1))
+        UserVaccineStatus.objects.update(dose_count=99)
+        # One DISTINCT over the vaccine's doses picks the users; the user table isn't walked
+        with self.assertNumQueries(7):
+            self.assertEqual(rebuild_statuses(vaccine=self.annual), 1)
+        self.assertEqual(self.status(self.annual, user=other).dose_count, 1)
+        self.assertEqual(self.status(self.single).dose_count, 99)
+
+    def test_rebuild_command_replaces_stale_rows(self):
+        self.give(self.annual, date(2023, 1, 1))
+        UserVaccineStatus.objects.update(dose_count=99)
+        out = StringIO()
+        call_command('rebuild_vaccine_status', '--chunk-size', '2', stdout=out)
+        self.assertIn('Rebuilt 1 status rows', out.getvalue())
+        self.assertEqual(self.status(self.annual).dose_count, 1)
+
+    def test_dashboard_lists_due_vaccinations(self):
+        self.give(self.annual, date(2023, 1, 1))
+        self.give(self.single, date(2023, 1, 1))
+        self.client.login(username='scheduled', password='testpass123')
+        response = self.client.get(reverse('home'))
+        self.assertEqual([s.vaccine for s in response.context['due_vaccinations']], [self.annual])
+        self.assertContains(response, 'Upcoming Vaccinations')
@@ -0,0 +1,35 @@
+"""
+Transaction helpers shared by the write services (booking, dose recording).
+"""
+import random
+import time
+from django.db import IntegrityError, OperationalError, connections, router, transaction
+
+MAX_ATTEMPTS = 8
+RETRY_BACKOFF = 0.01  # seconds, doubled on each attempt
+
+
+def atomic_with_retries(fn, model, retry_integrity_errors=False):
+    """
+    Run fn(db) in a transaction on `model`'s write database and return its result.
+
+    On SQLite, "database is locked" errors are retried with jittered
+    exponential backoff when this is the outermost transaction. With
+    retry_integrity_errors, an IntegrityError (e.g. losing a race on a unique
+    constraint) rolls back and reruns fn as well.
+    """
+    db = router.db_for_write(model)
+    connection = connections[db]
+    retry_locks = connection.vendor == 'sqlite' and not connection.in_atomic_block
+    for attempt in range(MAX_ATTEMPTS):
+        last_attempt = attempt == MAX_ATTEMPTS - 1
+        try:
+            with transaction.atomic(using=db):
+                return fn(db)
+        except IntegrityError:
+            if not retry_integrity_errors or last_attempt:
+                raise
+        except OperationalError as exc:
+            if not retry_locks or 'locked' not in str(exc) or last_attempt:
+                raise
+        time.sleep(RETRY_BACKOFF * (2 ** attempt) * random.random())
@@ -3,7 +3,7 @@ from rest_framework.routers import DefaultRouter
 from . import views
 from .api_views import (
     UserViewSet, VaccineViewSet, BranchViewSet, 
-    AppointmentViewSet, DoseViewSet, api_health
+    AppointmentViewSet, DoseViewSet, api_health, api_health_details, api_schedule
 )
 
 # API router
@@ -32,8 +32,15 @@ urlpatterns = [
     path('branches/', views.branch_list, name='branch_list'),
     path('branches/<int:pk>/', views.branch_detail, name='branch_detail'), 
     path('branches/<int:pk>/hours/', views.branch_hours, name='branch_hours'),
+    path('branches/<int:pk>/slots/', views.branch_slots, name='branch_slots'),
+    path('wizard/catalogue.<slug:digest>.js', views.wizard_catalogue, name='wizard_catalogue'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('staff/profiles/', views.request_profiles, name='request_profiles'),
+    path('staff/profiles/<str:name>', views.request_profile_download, name='request_profile_download'),
     
     # API URLs
     path('api/health/', api_health, name='api_health'),
+    path('api/health/details/', api_health_details, name='api_health_details'),
+    path('api/schedule/', api_schedule, name='api_schedule'),
     path('api/', include(router.urls)),
 ]
@@ -0,0 +1,278 @@
+"""
+Vaccination schedule engine: series progress and next-due dates.
+
+Rules come from the Vaccine fields:
+
+* primary_series_doses: doses in the primary series (1 when unset). Until it
+  is complete, the next dose is due PRIMARY_DOSE_INTERVAL_DAYS after the last.
+* booster_interval_years / recurrence_interval_years: once the series is
+  complete, the next dose is due that long after the last one. Vaccines with
+  neither are complete after the primary series.
+
+Progress is derived from one GROUP BY over Dose (count and latest date per
+user and vaccine) plus one query for the rules, and the date arithmetic is
+done on day ordinals against a per-vaccine rule table, so evaluating the
+whole population does not issue queries per user.
+
+The results are materialised in UserVaccineStatus: refresh_status() keeps a
+single (user, vaccine) row current as doses change and rebuild_statuses()
+regenerates the table in chunks of users.
+"""
+from datetime import date
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.utils import timezone
+from .models import Dose, Vaccine, UserVaccineStatus
+
+REBUILD_CHUNK_USERS = 1000
+
+# Vaccine fields the rules are built from
+SCHEDULE_FIELDS = ('primary_series_doses', 'booster_interval_years', 'recurrence_interval_years')
+
+PRIMARY_DOSE_INTERVAL_DAYS = 28
+DAYS_PER_YEAR = 365.25
+
+STATUS_COMPLETE = 'complete'
+STATUS_IN_PROGRESS = 'in_progress'
+STATUS_UP_TO_DATE = 'up_to_date'
+STATUS_OVERDUE = 'overdue'
+
+
+class VaccineRule:
+    __slots__ = ('vaccine_id', 'name', 'series_doses', 'repeat_days')
+
+    def __init__(self, vaccine_id, name, series_doses, repeat_days):
+        self.vaccine_id = vaccine_id
+        self.name = name
+        self.series_doses = series_doses
+        self.repeat_days = repeat_days
+
+    @classmethod
+    def from_values(cls, vaccine_id, name, primary_series_doses, booster_interval_years, recurrence_interval_years):
+        repeat_years = booster_interval_years or recurrence_interval_years
+        return cls(
+            vaccine_id,
+            name,
+            primary_series_doses or 1,
+            round(repeat_years * DAYS_PER_YEAR) if repeat_years else None,
+        )
+
+    def next_due_ordinal(self, doses_received, last_ordinal):
+        """Ordinal date the next dose is due, or None when nothing more is due."""
+        if doses_received < self.series_doses:
+            return last_ordinal + PRIMARY_DOSE_INTERVAL_DAYS
+        if self.repeat_days:
+            return last_ordinal + self.repeat_days
+        return None
+
+
+class VaccineProgress:
+    """A user's progress through one vaccine's schedule."""
+
+    __slots__ = (
+        'user_id', 'vaccine_id', 'vaccine_name', 'doses_received', 'series_doses',
+        'last_dose_date', 'next_due_date', 'overdue',
+    )
+
+    def __init__(self, user_id, rule, doses_received, last_dose_date, today_ordinal):
+        last_ordinal = last_dose_date.toordinal()
+        due_ordinal = rule.next_due_ordinal(doses_received, last_ordinal)
+        self.user_id = user_id
+        self.vaccine_id = rule.vaccine_id
+        self.vaccine_name = rule.name
+        self.doses_received = doses_received
+        self.series_doses = rule.series_doses
+        self.last_dose_date = last_dose_date
+        self.next_due_date = date.fromordinal(due_ordinal) if due_ordinal is not None else None
+        self.overdue = due_ordinal is not None and due_ordinal < today_ordinal
+
+    @property
+    def series_complete(self):
+        return self.doses_received >= self.series_doses
+
+    @property
+    def status(self):
+        if self.overdue:
+            return STATUS_OVERDUE
+        if not self.series_complete:
+            return STATUS_IN_PROGRESS
+        if self.next_due_date is not None:
+            return STATUS_UP_TO_DATE
+        return STATUS_COMPLETE
+
+    def status_fields(self):
+        """Field values for the matching UserVaccineStatus row."""
+        return {
+            'dose_count': self.doses_received,
+            'last_dose_date': self.last_dose_date,
+            'next_due_date': self.next_due_date,
+            'series_complete': self.series_complete,
+            'completed': self.next_due_date is None,
+        }
+
+    def as_dict(self):
+        return {
+            'vaccine': self.vaccine_id,
+            'vaccine_name': self.vaccine_name,
+            'doses_received': self.doses_received,
+            'series_doses': self.series_doses,
+            'series_complete': self.series_complete,
+            'last_dose_date': self.last_dose_date.isoformat(),
+            'next_due_date': self.next_due_date.isoformat() if self.next_due_date else None,
+            'overdue': self.overdue,
+            'status': self.status,
+        }
+
+
+def load_rules():
+    """Schedule rules for every vaccine, keyed by vaccine id (one query)."""
+    rows = Vaccine.objects.order_by().values_list('id', 'name', *SCHEDULE_FIELDS)
+    return {row[0]: VaccineRule.from_values(*row) for row in rows}
+
+
+def _dose_totals(doses):
+    """(user_id, vaccine_id, dose count, latest date) per user and vaccine."""
+    return (
+        doses.order_by()
+        .values_list('user_id', 'vaccine_id')
+        .annotate(n=Count('id'), last=Max('date_administered'))
+    )
+
+
+def _sort_key(progress):
+    return (progress.next_due_date is None, progress.next_due_date or date.max, progress.vaccine_name)
+
+
+def user_schedule(user, today=None, rules=None):
+    """A user's progress for each vaccine they have received, soonest due first."""
+    today_ordinal = (today or timezone.localdate()).toordinal()
+    rules = rules if rules is not None else load_rules()
+    results = [
+        VaccineProgress(user_id, rules[vaccine_id], n, last, today_ordinal)
+        for user_id, vaccine_id, n, last in _dose_totals(Dose.objects.filter(user=user))
+    ]
+    return sorted(results, key=_sort_key)
+
+
+def population_schedule(today=None, doses=None, chunk_size=10000):
+    """
+    Yield VaccineProgress for every (user, vaccine) pair with at least one dose,
+    ordered by user. Streams the grouped rows in chunks.
+    """
+    today_ordinal = (today or timezone.localdate()).toordinal()
+    rules = load_rules()
+    totals = _dose_totals(doses if doses is not None else Dose.objects.all()).order_by('user_id', 'vaccine_id')
+    for user_id, vaccine_id, n, last in totals.iterator(chunk_size=chunk_size):
+        yield VaccineProgress(user_id, rules[vaccine_id], n, last, today_ordinal)
+
+
+def upcoming_vaccinations(user):
+    """A user's materialised statuses, soonest due first (completed ones last)."""
+    return UserVaccineStatus.objects.filter(user=user).select_related('vaccine').order_by(
+        F('next_due_date').asc(nulls_last=True), 'vaccine__name',
+    )
+
+
+def refresh_status(user_id, vaccine_id, using=None):
+    """Recompute the UserVaccineStatus row for one (user, vaccine) pair."""
+    statuses = UserVaccineStatus.objects.using(using)
+    totals = Dose.objects.using(using).filter(user_id=user_id, vaccine_id=vaccine_id).aggregate(
+        n=Count('id'), last=Max('date_administered'),
+    )
+    if not totals['n']:
+        statuses.filter(user_id=user_id, vaccine_id=vaccine_id).delete()
+        return None
+    vaccine = Vaccine.objects.using(using).values_list('id', 'name', *SCHEDULE_FIELDS).get(pk=vaccine_id)
+    progress = VaccineProgress(
+        user_id, VaccineRule.from_values(*vaccine), totals['n'], totals['last'], timezone.localdate().toordinal(),
+    )
+    status, _ = statuses.update_or_create(
+        user_id=user_id, vaccine_id=vaccine_id, defaults=progress.status_fields(),
+    )
+    return status
+
+
+def _status_rows(doses, today):
+    return [
+        UserVaccineStatus(user_id=p.user_id, vaccine_id=p.vaccine_id, **p.status_fields())
+        for p in population_schedule(today=today, doses=doses)
+    ]
+
+
+def rebuild_statuses(chunk_size=REBUILD_CHUNK_USERS, vaccine=None, progress=None):
+    """
+    Regenerate UserVaccineStatus from Dose, one transaction per chunk of
+    user ids so the table stays readable throughout. With `vaccine`, only
+    that vaccine's rows are rebuilt (e.g. after its intervals change), and
+    only users holding one of its doses are visited.
+    `progress` is called with the running row count after each chunk.
+    Returns the number of rows written.
+    """
+    today = timezone.localdate()
+    doses = Dose.objects.all()
+    statuses = UserVaccineStatus.objects.all()
+    if vaccine is not None:
+        doses = doses.filter(vaccine=vaccine)
+        statuses = statuses.filter(vaccine=vaccine)
+        user_ids = doses.order_by('user_id').values_list('user_id', flat=True).distinct()
+    else:
+        user_ids = get_user_model().objects.order_by('pk').values_list('pk', flat=True)
+
+    # Chunks cover (after, last]; together they span every id, so rows of
+    # users without doses are dropped too.
+    written = 0
+    after = None
+    chunk = []
+    for user_id in user_ids.iterator(chunk_size=chunk_size):
+        chunk.append(user_id)
+        if len(chunk) == chunk_size:
+            written += _rebuild_chunk(after, chunk[-1], doses, statuses, today)
+            after = chunk[-1]
+            chunk = []
+            if progress:
+                progress(written)
+    written += _rebuild_chunk(after, None, doses, statuses, today)
+    if chunk and progress:
+        progress(written)
+    return written
+
+
+def _rebuild_chunk(after_id, last_id, doses, statuses, today):
+    span = {}
+    if after_id is not None:
+        span['user_id__gt'] = after_id
+    if last_id is not None:
+        span['user_id__lte'] = last_id
+    rows = _status_rows(doses.filter(**span), today)
+    with transaction.atomic():
+        statuses.filter(**span).delete()
+        UserVaccineStatus.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def refresh_statuses(pairs, using=None):
+    """
+    Upsert the rows for a set of (user_id, vaccine_id) pairs that have doses,
+    e.g. after bulk_create, which bypasses the Dose signals. Call inside the
+    transaction doing the writes.
+    """
+    pairs = set(pairs)
+    rules = load_rules()
+    today_ordinal = timezone.localdate().toordinal()
+    totals = _dose_totals(Dose.objects.using(using).filter(
+        user_id__in={u for u, _ in pairs}, vaccine_id__in={v for _, v in pairs},
+    ))
+    rows = [
+        UserVaccineStatus(
+            user_id=user_id, vaccine_id=vaccine_id,
+            **VaccineProgress(user_id, rules[vaccine_id], n, last, today_ordinal).status_fields(),
+        )
+        for user_id, vaccine_id, n, last in totals
+        if (user_id, vaccine_id) in pairs
+    ]
+    UserVaccineStatus.objects.using(using).bulk_create(
+        rows, batch_size=500, update_conflicts=True, unique_fields=['user', 'vaccine'],
+        update_fields=['dose_count', 'last_dose_date', 'next_due_date', 'series_complete', 'completed', 'updated_at'],
+    )
+    return len(rows)
@@ -1,11 +1,23 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Max
-from django.http import JsonResponse, Http404
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseForbidden, JsonResponse, Http404
 from django.utils import timezone
-from datetime import date
+from django.views.decorators.http import condition
+from datetime import date, timedelta
+import hmac
 import json
+from . import slots
+from .booking import SlotUnavailable, book_appointment, reschedule_appointment
+from .catalogue import catalogue_script, catalogue_url
+from .doses import record_dose
+from .metrics import collect, render_prometheus
+from .profiling import profile_artifact, profile_dir, recent_profiles
+from .reference_data import reference_etag, reference_last_modified
+from .registry import reference_registry
+from .vaccine_schedule import upcoming_vaccinations
 from .models import Appointment, Vaccine, Branch, Dose, User
 from .forms import AppointmentForm, CustomUserCreationForm, DoseForm, UserProfileForm
 from django.contrib.auth.forms import UserCreationForm
@@ -17,11 +29,13 @@ def home(request):
     vaccines = Vaccine.objects.all()[:10]
     branches = Branch.objects.all()[:10]
     doses = Dose.objects.select_related('vaccine').filter(user=request.user).order_by('-date_administered')[:5] if request.user.is_authenticated else []
+    due = upcoming_vaccinations(request.user).exclude(next_due_date=None)[:5] if request.user.is_authenticated else []
     return render(request, 'home.html', {
         'appointments': appointments,
         'vaccines': vaccines,
         'branches': branches,
         'recent_doses': doses,
+        'due_vaccinations': due,
     })
 
 def signup(request):
@@ -43,58 +57,31 @@ def appointment_create(request):
     # allow pre-select branch via query param (?branch=ID)
     initial = {}
     branch_id = request.GET.get('branch') if request.method == 'GET' else request.POST.get('branch')
-    if branch_id:
-        try:
-            initial_branch = Branch.objects.get(pk=branch_id)
-            initial['branch'] = initial_branch
-        except Branch.DoesNotExist:
-            pass
+    branch_obj = reference_registry.branch(branch_id) if branch_id else None
+    if branch_obj:
+        initial['branch'] = branch_obj
     if request.method == 'POST':
         form = AppointmentForm(request.POST)
         if form.is_valid():
             appt = form.save(commit=False)
             appt.user = request.user
-            appt.save()
-            appt.save()
-            messages.success(request, 'Appointment booked!')
-            return redirect('appointment_confirmation', pk=appt.pk)
+            try:
+                book_appointment(appt)
+            except SlotUnavailable as exc:
+                form.add_error('datetime', str(exc))
+            else:
+                messages.success(request, 'Appointment booked!')
+                return redirect('appointment_confirmation', pk=appt.pk)
     else:
         form = AppointmentForm(initial=initial)
-    # supply hours for selected branch (initial or from form)
-    branch_obj = initial.get('branch') if initial.get('branch') else None
-    if not branch_obj and 'branch' in request.POST:
-        try:
-            branch_obj = Branch.objects.get(pk=request.POST.get('branch'))
-        except Branch.DoesNotExist:
-            branch_obj = None
     opening_hours = branch_obj.opening_hours if branch_obj else []
     opening_hours_json = json.dumps(opening_hours if isinstance(opening_hours, list) else [])
     
-    # Prepare vaccines and branches data for wizard
-    vaccines = Vaccine.objects.all().order_by('name')
-    vaccines_json = json.dumps([{
-        'id': v.id,
-        'name': v.name,
-        'price': str(v.price_per_dose),
-        'side_effects': v.side_effects if isinstance(v.side_effects, list) else []
-    } for v in vaccines])
-    
-    branches = Branch.objects.all().order_by('name')
-    branches_json = json.dumps([{
-        'id': b.id,
-        'name': b.name,
-        'postcode': b.postcode,
-        'image_url': b.image_url or '',
-        'status': b.status_info() or {'text': 'Hours vary', 'class': 'status-open'},
-        'opening_hours': b.opening_hours if isinstance(b.opening_hours, list) else []
-    } for b in branches])
-    
     return render(request, 'appointment_form.html', {
         'form': form,
         'opening_hours': opening_hours,
         'opening_hours_json': opening_hours_json,
-        'vaccines_json': vaccines_json,
-        'branches_json': branches_json,
+        'catalogue_url': catalogue_url(),
         'today_str': date.today().isoformat(),
     })
 
@@ -102,33 +89,19 @@ def appointment_create(request):
 def appointment_edit(request, pk):
     appt = get_object_or_404(Appointment, pk=pk, user=request.user)
     if request.method == 'POST':
+        previous_branch, previous_datetime = appt.branch, appt.datetime
         form = AppointmentForm(request.POST, instance=appt)
         if form.is_valid():
-            form.save()
-            messages.success(request, 'Appointment updated.')
-            return redirect('home')
+            try:
+                reschedule_appointment(form.save(commit=False), previous_branch, previous_datetime)
+            except SlotUnavailable as exc:
+                form.add_error('datetime', str(exc))
+            else:
+                messages.success(request, 'Appointment updated.')
+                return redirect('home')
     else:
         form = AppointmentForm(instance=appt)
     
-    # Prepare vaccines and branches data for wizard (same as create)
-    vaccines = Vaccine.objects.all().order_by('name')
-    vaccines_json = json.dumps([{
-        'id': v.id,
-        'name': v.name,
-        'price': str(v.price_per_dose),
-        'side_effects': v.side_effects if isinstance(v.side_effects, list) else []
-    } for v in vaccines])
-    
-    branches = Branch.objects.all().order_by('name')
-    branches_json = json.dumps([{
-        'id': b.id,
-        'name': b.name,
-        'postcode': b.postcode,
-        'image_url': b.image_url or '',
-        'status': b.status_info() or {'text': 'Hours vary', 'class': 'status-open'},
-        'opening_hours': b.opening_hours if isinstance(b.opening_hours, list) else []
-    } for b in branches])
-    
     # Get opening hours for the appointment's branch
     opening_hours = appt.branch.opening_hours if isinstance(appt.branch.opening_hours, list) else []
     opening_hours_json = json.dumps(opening_hours)
@@ -138,8 +111,7 @@ def appointment_edit(request, pk):
         'appointment': appt,
         'opening_hours': opening_hours,
         'opening_hours_json': opening_hours_json,
-        'vaccines_json': vaccines_json,
-        'branches_json': branches_json,
+        'catalogue_url': catalogue_url(),
         'today_str': date.today().isoformat(),
     })
 
@@ -221,23 +193,13 @@ def dose_create(request):
         if form.is_valid():
             dose = form.save(commit=False)
             dose.user = request.user
-            # auto increment dose_number per vaccine & user
-            last = Dose.objects.filter(user=request.user, vaccine=dose.vaccine).aggregate(m=Max('dose_number'))['m'] or 0
-            dose.dose_number = last + 1
-            dose.save()
+            # dose_number is allocated per vaccine & user by the service
+            record_dose(dose)
             messages.success(request, f'Dose #{dose.dose_number} recorded.')
             return redirect('profile')
     else:
         form = DoseForm(user=request.user)
     
-    # Prepare vaccine and appointment data for the wizard
-    vaccines = Vaccine.objects.all().order_by('name')
-    vaccines_json = json.dumps([{
-        'id': v.id,
-        'name': v.name,
-        'price': str(v.price_per_dose),
-    } for v in vaccines])
-    
     # Only show past appointments for linking
     now = timezone.now()
     past_appointments = request.user.appointments.select_related('vaccine', 'branch').filter(
@@ -255,7 +217,7 @@ def dose_create(request):
     
     return render(request, 'dose_form.html', {
         'form': form,
-        'vaccines_json': vaccines_json,
+        'catalogue_url': catalogue_url(),
         'appointments_json': appointments_json,
     })
 
@@ -273,6 +235,12 @@ def dose_delete(request, pk):
             return redirect('dose_list')
     return render(request, 'dose_delete_confirm.html', {'dose': dose})
 
+def _branch_or_404(pk):
+    branch = reference_registry.branch(pk)
+    if branch is None:
+        raise Http404
+    return branch
+
 def branch_list(request):
     allowed = {
         'name': 'name',
@@ -284,7 +252,7 @@ def branch_list(request):
     direction = request.GET.get('dir', 'asc')
     field = allowed.get(sort, 'name')
     order = ('-' if direction == 'desc' else '') + field
-    branches = Branch.objects.all().order_by(order)
+    branches = Branch.objects.with_status().order_by(order)
 
     def next_dir(col):
         return 'desc' if (sort == col and direction == 'asc') else 'asc'
@@ -303,7 +271,7 @@ def branch_list(request):
     )
 
 def branch_detail(request, pk):
-    branch = get_object_or_404(Branch, pk=pk)
+    branch = _branch_or_404(pk)
     inline_form = None
     if request.user.is_authenticated:
         inline_form = AppointmentForm(initial={'branch': branch})
@@ -317,15 +285,68 @@ def branch_detail(request, pk):
         'today_str': date.today().isoformat(),
     })
 
+@condition(etag_func=reference_etag, last_modified_func=reference_last_modified)
 def branch_hours(request, pk):
     """Return opening_hours JSON for a branch (public)."""
-    try:
-        branch = Branch.objects.get(pk=pk)
-    except Branch.DoesNotExist:
-        raise Http404
+    branch = _branch_or_404(pk)
     data = branch.opening_hours if isinstance(branch.opening_hours, list) else []
     return JsonResponse({'opening_hours': data})
 
+def wizard_catalogue(request, digest):
+    """Serve the wizard catalogue script at its content-hashed URL."""
+    current, body = catalogue_script()
+    if digest != current:
+        return redirect('wizard_catalogue', digest=current)
+    response = HttpResponse(body, content_type='text/javascript; charset=utf-8')
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def metrics(request):
+    """Per-view latency metrics for a Prometheus scraper: staff, or 'Bearer <METRICS_TOKEN>'."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    bearer = request.headers.get('Authorization', '')
+    if not request.user.is_staff and not (token and hmac.compare_digest(bearer, f'Bearer {token}')):
+        return HttpResponseForbidden()
+    return HttpResponse(render_prometheus(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@staff_member_required
+def request_profiles(request):
+    """Recent on-demand request profiles with their top functions."""
+    return render(request, 'request_profiles.html', {
+        'profiles': recent_profiles(),
+        'profile_dir': profile_dir(),
+        'title': 'Request profiles',
+    })
+
+@staff_member_required
+def request_profile_download(request, name):
+    path = profile_artifact(name)
+    if path is None:
+        raise Http404("No such profile")
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
+
+def branch_slots(request, pk):
+    """
+    Return bookable slots with remaining capacity for a branch (public).
+    Query params: start=YYYY-MM-DD (default today), days=N (default 7).
+    """
+    branch = _branch_or_404(pk)
+    try:
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else timezone.localdate()
+        days = int(request.GET.get('days', slots.DEFAULT_RANGE_DAYS))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid start or days parameter'}, status=400)
+    if not 1 <= days <= slots.MAX_RANGE_DAYS:
+        return JsonResponse({'error': f'days must be between 1 and {slots.MAX_RANGE_DAYS}'}, status=400)
+    end = start + timedelta(days=days - 1)
+    return JsonResponse({
+        'branch': branch.pk,
+        'slot_minutes': slots.SLOT_MINUTES,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'slots': [slot.as_dict() for slot in slots.available_slots(branch, start, end)],
+    })
+
 @login_required
 def profile(request):
     """User profile page with personal info editing and vaccination history"""
@@ -348,7 +369,7 @@ def profile(request):
     direction = request.GET.get('dir', 'desc')
     field = allowed_sort.get(sort, 'date_administered')
     order = ('-' if direction == 'desc' else '') + field
-    doses = Dose.objects.select_related('vaccine', 'appointment').filter(user=request.user).order_by(order)
+    doses = Dose.objects.select_related('vaccine', 'appointment__branch').filter(user=request.user).order_by(order)
     
     def next_dir(col):
         if sort == col and direction == 'asc':
@@ -367,6 +388,7 @@ def profile(request):
         'sort': sort,
         'direction': direction,
         'links': sort_links,
+        'schedule': upcoming_vaccinations(request.user),
     })
 
 @login_required
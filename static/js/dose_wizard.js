@@ -17,10 +17,10 @@
   });
 
   function loadVaccines() {
-    const vaccinesData = document.getElementById('vaccines-data');
-    if (!vaccinesData) return;
+    // Catalogue script loaded from its content-hashed URL
+    if (!window.wizardCatalogue) return;
     
-    const vaccines = JSON.parse(vaccinesData.textContent);
+    const vaccines = window.wizardCatalogue.vaccines;
     const grid = document.getElementById('vaccine-grid');
     
     vaccines.forEach(vaccine => {
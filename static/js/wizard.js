@@ -55,10 +55,10 @@ const WizardForm = (function() {
   }
 
   function loadVaccines() {
-    const vaccinesData = document.getElementById('vaccines-data');
-    if (!vaccinesData) return;
+    // Catalogue script loaded from its content-hashed URL
+    if (!window.wizardCatalogue) return;
     
-    const vaccines = JSON.parse(vaccinesData.textContent);
+    const vaccines = window.wizardCatalogue.vaccines;
     const grid = document.getElementById('vaccine-grid');
     
     vaccines.forEach(vaccine => {
@@ -81,10 +81,9 @@ const WizardForm = (function() {
   }
 
   function loadBranches() {
-    const branchesData = document.getElementById('branches-data');
-    if (!branchesData) return;
+    if (!window.wizardCatalogue) return;
     
-    const branches = JSON.parse(branchesData.textContent);
+    const branches = window.wizardCatalogue.branches;
     const grid = document.getElementById('branch-grid');
     
     branches.forEach(branch => {
@@ -104,10 +103,6 @@ const WizardForm = (function() {
         imageSrc = '/static/img/branches/placeholder.jpg';
       }
       
-      // Status text and class
-      const statusText = branch.status?.text || 'Hours vary';
-      const statusClass = branch.status?.class || 'status-open';
-      
       card.innerHTML = `
         <div class="branch-card-image" style="background-image: url('${imageSrc}'); width: calc(100% + 3rem); height: 140px; background-size: cover; background-position: center; border-radius: 12px 12px 0 0; margin: -1.5rem -1.5rem 1rem -1.5rem;"></div>
         <div class="selection-card-title">${branch.name}</div>